@@ -14,6 +14,7 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django app configs.
 app.conf.imports = (
     'inventory.tasks',
+    'logger.tasks',
     # Add other task modules here
 )
 
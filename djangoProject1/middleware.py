@@ -0,0 +1,46 @@
+# middleware.py
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+
+class QueryCountMiddleware:
+    """
+    Adds X-Query-Count and X-Query-Time-Ms headers with the number of SQL
+    statements each request ran and the time spent in them, so the load
+    harness can report queries per request without DEBUG=True.
+
+    Only meant for load-test and staging settings:
+
+        MIDDLEWARE = ['djangoProject1.middleware.QueryCountMiddleware', *MIDDLEWARE]
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = _QueryCounter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(counter))
+            response = self.get_response(request)
+        # Streaming responses run their queries after this point; their count covers the first page only.
+        response['X-Query-Count'] = str(counter.count)
+        response['X-Query-Time-Ms'] = f"{counter.elapsed * 1000:.1f}"
+        return response
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.elapsed = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.elapsed += time.perf_counter() - started
+
@@ -0,0 +1,185 @@
+# catalog.py
+"""
+In-process cache of the exercise reference data.
+
+Exercises, muscle groups, equipment and images only change when the import
+scripts run or an admin edits them, so each worker keeps the whole graph in
+memory and only goes back to the database when the shared version stamp
+(stored in the Django cache) changes.
+
+The stamp is replaced once the changing transaction commits, so no worker can
+reload the old rows under the new stamp. Imports wrap their writes in
+`batched_catalog_changes()` so the per-row signals add up to a single bump.
+"""
+import gzip
+import hashlib
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import transaction
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
+
+CATALOG_VERSION_KEY = "exercises:catalog_version"
+CATALOG_VERSION_CHECK_INTERVAL = 5  # Seconds between version checks against the shared cache
+
+_lock = threading.Lock()
+_catalog = None
+_last_version_check = 0.0
+_batch = threading.local()  # Open batched_catalog_changes() blocks of this thread
+
+
+class PrecompressedBody:
+    """A rendered JSON body together with its gzip/brotli encodings and strong ETags."""
+
+    def __init__(self, raw):
+        self.encodings = {"identity": raw, "gzip": gzip.compress(raw, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.encodings["br"] = brotli.compress(raw)
+        digest = hashlib.sha256(raw).hexdigest()[:32]
+        # Each encoding is a distinct representation, so each gets its own strong ETag.
+        self.etags = {
+            encoding: f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"'
+            for encoding in self.encodings
+        }
+
+
+class ExerciseCatalog:
+    """Immutable snapshot of the exercise graph for one catalog version."""
+
+    def __init__(self, version):
+        from .models import Exercise, MuscleGroup
+
+        self.version = version
+        self._exercises_all_body = None
+
+        # Muscle groups, in id order: id -> name and name -> id
+        self.muscle_groups = dict(MuscleGroup.objects.order_by('id').values_list('id', 'name'))
+        self.muscle_group_ids_by_name = {name: mg_id for mg_id, name in self.muscle_groups.items()}
+
+        # Exercises, in id order: id -> serialisable row
+        self.exercises = {}
+        self.exercise_ids_by_name = {}
+        queryset = (
+            Exercise.objects.order_by('id')
+            .select_related('equipment')
+            .prefetch_related('muscle_groups', 'images')
+        )
+        for exercise in queryset:
+            self.exercises[exercise.id] = {
+                "name": exercise.name,
+                "description": exercise.description,
+                "equipment": exercise.equipment.name if exercise.equipment else None,
+                "muscle_group_ids": tuple(mg.id for mg in exercise.muscle_groups.all()),
+                "images": tuple(image.url for image in exercise.images.all()),
+            }
+            # Names are not unique; keep the lowest id like the previous `.get()` lookups expected.
+            self.exercise_ids_by_name.setdefault(exercise.name, exercise.id)
+
+    def muscle_group_names(self, exercise_id):
+        return [self.muscle_groups[mg_id] for mg_id in self.exercises[exercise_id]["muscle_group_ids"]]
+
+    def exercises_all_data(self):
+        """The payload served by `exercises.views.exercises_all`."""
+        return [{
+            "name": exercise["name"],
+            "muscle_groups": self.muscle_group_names(exercise_id),
+            "description": exercise["description"],
+            "equipment": exercise["equipment"],
+            "images": list(exercise["images"])
+        } for exercise_id, exercise in self.exercises.items()]
+
+    def exercises_all_body(self):
+        """
+        Returns the rendered and compressed `exercises_all` body, built once per
+        catalog version. Rendering matches DRF's JSONRenderer output.
+        """
+        if self._exercises_all_body is None:
+            raw = json.dumps(self.exercises_all_data(), ensure_ascii=False, separators=(',', ':'))
+            self._exercises_all_body = PrecompressedBody(raw.encode('utf-8'))
+        return self._exercises_all_body
+
+    def exercises_for_muscle_group(self, muscle_group_id, with_images=False):
+        """Returns exercise ids (in id order) that target the given muscle group."""
+        return [
+            exercise_id for exercise_id, exercise in self.exercises.items()
+            if muscle_group_id in exercise["muscle_group_ids"] and (exercise["images"] or not with_images)
+        ]
+
+
+def current_version():
+    """Returns the shared catalog version, creating one if the cache has none."""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def _drop_catalog():
+    global _catalog
+    with _lock:
+        _catalog = None
+
+
+def bump_catalog_version():
+    """
+    Marks every worker's in-memory catalog as stale once the current
+    transaction commits; they reload on next access. Inside
+    `batched_catalog_changes()` the bump waits for the end of the block.
+    """
+    if getattr(_batch, 'depth', 0):
+        _batch.pending = True
+        return
+    # Drop our own copy straight away so the caller sees its changes immediately.
+    _drop_catalog()
+
+    def bump():
+        cache.set(CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+        # Again, in case this worker reloaded before the commit
+        _drop_catalog()
+
+    transaction.on_commit(bump)
+
+
+@contextmanager
+def batched_catalog_changes():
+    """Coalesces every catalog bump made inside the block into one, at its end."""
+    depth = getattr(_batch, 'depth', 0)
+    if not depth:
+        _batch.pending = False
+    _batch.depth = depth + 1
+    try:
+        yield
+    finally:
+        _batch.depth = depth
+        # Also after a failure: whatever was written before it may have committed
+        if not depth and _batch.pending:
+            bump_catalog_version()
+
+
+def get_catalog():
+    """
+    Returns the current ExerciseCatalog for this worker.
+    The shared version is checked at most every CATALOG_VERSION_CHECK_INTERVAL
+    seconds, so steady-state reads touch neither the database nor the cache.
+    """
+    global _catalog, _last_version_check
+    catalog = _catalog
+    now = time.monotonic()
+    if catalog is not None and now - _last_version_check < CATALOG_VERSION_CHECK_INTERVAL:
+        return catalog
+
+    with _lock:
+        version = current_version()
+        _last_version_check = now
+        if _catalog is None or _catalog.version != version:
+            _catalog = ExerciseCatalog(version)
+        return _catalog
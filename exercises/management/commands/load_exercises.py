@@ -1,5 +1,6 @@
 import json
 import boto3
+from exercises.catalog import batched_catalog_changes
 from exercises.models import MuscleGroup, Equipment, Exercise, Image
 from django.conf import settings
 
@@ -17,45 +18,47 @@ def load_data_to_db(json_file):
 
     bucket_name = settings.AWS_STORAGE_BUCKET_NAME
 
-    for exercise in data:
-        # Add or get Muscle Groups
-        muscle_group_objects = []
-        for muscle in exercise.get('primary', []):
-            muscle_obj, created = MuscleGroup.objects.get_or_create(name=muscle)
-            muscle_group_objects.append(muscle_obj)
-
-        for muscle in exercise.get('secondary', []):
-            muscle_obj, created = MuscleGroup.objects.get_or_create(name=muscle)
-            muscle_group_objects.append(muscle_obj)
-
-        # Add or get Equipment
-        equipment_name = exercise['equipment'][0] if exercise['equipment'] else None
-        equipment_obj = None
-        if equipment_name:
-            equipment_obj, created = Equipment.objects.get_or_create(name=equipment_name)
-
-        # Add Exercise
-        exercise_obj, created = Exercise.objects.get_or_create(
-            name=exercise['title'],
-            defaults={
-                'description': exercise['primer'],
-                'equipment': equipment_obj
-            }
-        )
-
-        # Link Muscle Groups to Exercise
-        exercise_obj.muscle_groups.set(muscle_group_objects)
-
-        # Add Images
-        for img_url in exercise.get('png', []):
-            object_name = f"exercise_images/{img_url.split('/')[-1]}"
-            s3_url = upload_to_s3(img_url, bucket_name, object_name)
-            Image.objects.get_or_create(
-                exercise=exercise_obj,
-                url=s3_url
+    # Let every worker reload the in-memory exercise catalog once, not once per row
+    with batched_catalog_changes():
+        for exercise in data:
+            # Add or get Muscle Groups
+            muscle_group_objects = []
+            for muscle in exercise.get('primary', []):
+                muscle_obj, created = MuscleGroup.objects.get_or_create(name=muscle)
+                muscle_group_objects.append(muscle_obj)
+
+            for muscle in exercise.get('secondary', []):
+                muscle_obj, created = MuscleGroup.objects.get_or_create(name=muscle)
+                muscle_group_objects.append(muscle_obj)
+
+            # Add or get Equipment
+            equipment_name = exercise['equipment'][0] if exercise['equipment'] else None
+            equipment_obj = None
+            if equipment_name:
+                equipment_obj, created = Equipment.objects.get_or_create(name=equipment_name)
+
+            # Add Exercise
+            exercise_obj, created = Exercise.objects.get_or_create(
+                name=exercise['title'],
+                defaults={
+                    'description': exercise['primer'],
+                    'equipment': equipment_obj
+                }
             )
 
-        print(f"Added/Updated exercise: {exercise['title']}")
+            # Link Muscle Groups to Exercise
+            exercise_obj.muscle_groups.set(muscle_group_objects)
+
+            # Add Images
+            for img_url in exercise.get('png', []):
+                object_name = f"exercise_images/{img_url.split('/')[-1]}"
+                s3_url = upload_to_s3(img_url, bucket_name, object_name)
+                Image.objects.get_or_create(
+                    exercise=exercise_obj,
+                    url=s3_url
+                )
+
+            print(f"Added/Updated exercise: {exercise['title']}")
 
 
 # Call the function with your JSON file path
@@ -1,3 +1,4 @@
+from exercises.catalog import batched_catalog_changes
 from exercises.models import MuscleGroup
 
 # Mapping of old names to new readable names
@@ -25,12 +26,13 @@ rename_map = {
     "trapezius": "Trapezius",
 }
 
-# Update names in the database
-for old_name, new_name in rename_map.items():
-    try:
-        muscle_group = MuscleGroup.objects.get(name=old_name)
-        muscle_group.name = new_name
-        muscle_group.save()
-        print(f"Renamed '{old_name}' to '{new_name}'")
-    except MuscleGroup.DoesNotExist:
-        print(f"Muscle group '{old_name}' not found")
+# Update names in the database; every worker reloads the in-memory exercise catalog once, at the end
+with batched_catalog_changes():
+    for old_name, new_name in rename_map.items():
+        try:
+            muscle_group = MuscleGroup.objects.get(name=old_name)
+            muscle_group.name = new_name
+            muscle_group.save()
+            print(f"Renamed '{old_name}' to '{new_name}'")
+        except MuscleGroup.DoesNotExist:
+            print(f"Muscle group '{old_name}' not found")
@@ -0,0 +1,25 @@
+# signals.py
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog import bump_catalog_version
+from .models import Equipment, Exercise, Image, MuscleGroup
+
+
+@receiver(post_save, sender=Exercise)
+@receiver(post_save, sender=MuscleGroup)
+@receiver(post_save, sender=Equipment)
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Exercise)
+@receiver(post_delete, sender=MuscleGroup)
+@receiver(post_delete, sender=Equipment)
+@receiver(post_delete, sender=Image)
+def invalidate_catalog(sender, **kwargs):
+    """Admin edits and ad-hoc scripts change the reference data; make workers reload it."""
+    bump_catalog_version()
+
+
+@receiver(m2m_changed, sender=Exercise.muscle_groups.through)
+def invalidate_catalog_on_muscle_groups_change(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        bump_catalog_version()
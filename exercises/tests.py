@@ -1,3 +1,29 @@
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from .catalog import CATALOG_VERSION_KEY, batched_catalog_changes, current_version
+from .models import Exercise, MuscleGroup
+
+
+class CatalogVersionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.version = current_version()
+
+    def test_version_changes_only_once_the_edit_commits(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Exercise.objects.create(name="Squat", description="d")
+            self.assertEqual(cache.get(CATALOG_VERSION_KEY), self.version)
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertNotEqual(cache.get(CATALOG_VERSION_KEY), self.version)
+
+    def test_bulk_import_bumps_once(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with batched_catalog_changes():
+                muscle_group = MuscleGroup.objects.create(name="Quadriceps")
+                for name in ("Squat", "Lunge", "Leg press"):
+                    Exercise.objects.create(name=name, description="d").muscle_groups.add(muscle_group)
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertNotEqual(cache.get(CATALOG_VERSION_KEY), self.version)
@@ -1,9 +1,9 @@
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
-from exercises.models import Exercise, MuscleGroup
+from exercises.catalog import get_catalog
 
 
 @api_view(['GET'])
@@ -24,36 +24,40 @@ def index(request):
         return Response({"error": "Invalid items_per_page value"}, status=400)
 
     if muscle_type is not None:
+        catalog = get_catalog()
+        muscle_group_id = catalog.muscle_group_ids_by_name.get(muscle_type)
+        if muscle_group_id is None:
+            return Response({"error": "Muscle type not found"}, status=404)
+
+        # Exercises that belong to the muscle group and have at least one image
+        exercise_ids = catalog.exercises_for_muscle_group(muscle_group_id, with_images=True)
+
+        # Add pagination
+        paginator = Paginator(exercise_ids, items_per_page)
         try:
-            muscle_group = MuscleGroup.objects.get(name=muscle_type)
-            # Filter exercises that belong to the muscle group and have at least one image
-            exercises = Exercise.objects.filter(muscle_groups=muscle_group, images__isnull=False).distinct()
+            paginated_exercises = paginator.page(page)
+        except PageNotAnInteger:
+            return Response({"error": "Page number is not an integer"}, status=400)
+        except EmptyPage:
+            return Response({"error": "Page out of range"}, status=404)
 
-            # Add pagination
-            paginator = Paginator(exercises, items_per_page)
-            try:
-                paginated_exercises = paginator.page(page)
-            except PageNotAnInteger:
-                return Response({"error": "Page number is not an integer"}, status=400)
-            except EmptyPage:
-                return Response({"error": "Page out of range"}, status=404)
-
-            data = [{
-                "name": exercise.name,
-                "description": get_first_three_sentences(exercise.description),
-                "equipment": exercise.equipment.name if exercise.equipment else None,
-                "images": [image.url for image in exercise.images.all()]
-            } for exercise in paginated_exercises]
-
-            return Response({
-                "total_pages": paginator.num_pages,
-                "current_page": paginated_exercises.number,
-                "total_items": paginator.count,
-                "items_per_page": paginator.per_page,
-                "exercises": data
+        data = []
+        for exercise_id in paginated_exercises:
+            exercise = catalog.exercises[exercise_id]
+            data.append({
+                "name": exercise["name"],
+                "description": get_first_three_sentences(exercise["description"]),
+                "equipment": exercise["equipment"],
+                "images": list(exercise["images"])
             })
-        except MuscleGroup.DoesNotExist:
-            return Response({"error": "Muscle type not found"}, status=404)
+
+        return Response({
+            "total_pages": paginator.num_pages,
+            "current_page": paginated_exercises.number,
+            "total_items": paginator.count,
+            "items_per_page": paginator.per_page,
+            "exercises": data
+        })
     else:
         return Response({"error": "Muscle type parameter is required"}, status=400)
 
@@ -62,27 +66,62 @@ def get_first_three_sentences(description):
     sentences = description.split('. ')
     return '. '.join(sentences[:3]) + ('.' if len(sentences) > 3 else '')
 
+def _preferred_encoding(accept_encoding, available):
+    """Picks br, then gzip, then identity from an Accept-Encoding header."""
+    accepted = set()
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        qvalue = params.strip()
+        if qvalue.startswith('q='):
+            try:
+                if float(qvalue[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    for encoding in ("br", "gzip"):
+        if encoding in available and (encoding in accepted or '*' in accepted):
+            return encoding
+    return "identity"
+
+
+def _etag_matches(if_none_match, etags):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = {tag.strip() for tag in if_none_match.split(',')}
+    # Also accept tags that a proxy weakened (W/"...").
+    candidates |= {tag[2:] for tag in candidates if tag.startswith('W/')}
+    return bool(candidates & set(etags.values()))
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def exercises_all(request):
-    try:
-        exercises = Exercise.objects.all()
-        data = [{
-            "name": exercise.name,
-            "muscle_groups": [muscle.name for muscle in exercise.muscle_groups.all()],
-            "description": exercise.description,
-            "equipment": exercise.equipment.name if exercise.equipment else None,
-            "images": [image.url for image in exercise.images.all()]
-        } for exercise in exercises]
-        return Response(data)
-    except MuscleGroup.DoesNotExist:
-        return Response({"error": "Muscle type not found"}, status=404)
+    """
+    Serves the full exercise list from a body that is rendered and compressed once
+    per catalog version. Clients revalidate with If-None-Match and get a 304 until
+    the catalog changes.
+    """
+    body = get_catalog().exercises_all_body()
+    encoding = _preferred_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), body.encodings)
+
+    if _etag_matches(request.META.get('HTTP_IF_NONE_MATCH'), body.etags):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body.encodings[encoding], content_type='application/json')
+        if encoding != "identity":
+            response['Content-Encoding'] = encoding
 
+    response['ETag'] = body.etags[encoding]
+    response['Cache-Control'] = 'public, no-cache'
+    response['Vary'] = 'Accept-Encoding'
+    return response
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def muscles(request):
-    muscles = MuscleGroup.objects.all()
-    data = [{"name": muscle.name} for muscle in muscles]
+    data = [{"name": name} for name in get_catalog().muscle_groups.values()]
     return Response(data)
@@ -2,7 +2,7 @@
 from django.contrib import admin
 from django.core.exceptions import ValidationError
 
-from .models import Item, Inventory, EquippedItem, Chest, NPC
+from .models import Item, Inventory, EquippedItem, Chest, NPC, PlayerStats
 from .forms import ItemForm
 
 
@@ -88,6 +88,15 @@ class EquippedItemAdmin(admin.ModelAdmin):
         super().save_model(request, obj, form, change)
 
 
+@admin.register(PlayerStats)
+class PlayerStatsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'strength', 'agility', 'intelligence', 'stealth', 'speed', 'defence', 'updated_at')
+    search_fields = ('user__username',)
+    list_select_related = ('user',)
+    # Maintained by inventory.stats; edit base stats or gear instead
+    readonly_fields = ('user', 'strength', 'agility', 'intelligence', 'stealth', 'speed', 'defence', 'updated_at')
+
+
 @admin.register(Chest)
 class ChestAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'cost')
@@ -1,33 +1,50 @@
 # inventory/consumers.py
 from random import choice
 
-import boto3
-from botocore.exceptions import BotoCoreError, ClientError
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 import json
 
 from channels.layers import get_channel_layer
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from asgiref.sync import sync_to_async, async_to_sync
 import logging
 
 from django.utils.timezone import now
 
+from users.economy import InsufficientCoins, add_coins, transfer_coins
+from .dungeon_state import DungeonStateConflict, get_dungeon_state_store
+from .events import dungeon_group_name
+
 
 logger = logging.getLogger(__name__)
 class InventoryConsumer(AsyncWebsocketConsumer):
+    # Actions that can change the inventory snapshot; each is followed by an `inventory_delta`
+    INVENTORY_MUTATING_ACTIONS = {
+        "add_item", "remove_item", "equip_item", "unequip_item",
+        "buy_listing", "stop_dungeon", "handle_dungeon_choice",
+    }
+
     def __init__(self, *args, **kwargs):
         super().__init__(args, kwargs)
         self.user = None
+        self.inventory_state = None  # Last inventory snapshot the client was sent, full or via deltas
+        self.dungeon_group_name = None
 
 
     async def connect(self):
         self.user = self.scope["user"]
         if self.user.is_authenticated:
+            # Dungeon progress from the Celery task is pushed to this group; see inventory.events
+            self.dungeon_group_name = dungeon_group_name(self.user.id)
+            await self.channel_layer.group_add(self.dungeon_group_name, self.channel_name)
+
             # Allow connection
             await self.accept()
 
+            await self.load_dungeon_state()
+
             # # Load and send inventory data
             inventory_data = await self.get_inventory_data()
             await self.send_inventory_update(inventory_data)
@@ -42,7 +59,22 @@ class InventoryConsumer(AsyncWebsocketConsumer):
         """
         Handles the WebSocket disconnect event.
         """
-        pass
+        if self.dungeon_group_name:
+            await self.channel_layer.group_discard(self.dungeon_group_name, self.channel_name)
+            try:
+                await self.flush_dungeon_state(evict=True)
+            except Exception as e:
+                # flush_dungeon_states picks the run up on its next pass
+                print(f"Flushing dungeon state on disconnect failed: {e}")
+
+    async def dungeon_event(self, event):
+        """
+        Forwards a dungeon event published by `process_dungeon_sessions` to the client.
+        """
+        await self.send(text_data=json.dumps({
+            "type": "dungeon_event",
+            "data": event["data"]
+        }))
 
     async def receive(self, text_data):
         """
@@ -67,6 +99,8 @@ class InventoryConsumer(AsyncWebsocketConsumer):
         elif action == "fetch_inventory_data":
             inventory_data = await self.get_inventory_data()
             await self.send_inventory_update(inventory_data)
+        elif action == "sync_inventory":
+            await self.sync_inventory(data.get("revision"))
         elif action == "fetch_currency_data":
             currency_data = await self.get_currency_data()
             await self.send_currency_update(currency_data)
@@ -85,107 +119,82 @@ class InventoryConsumer(AsyncWebsocketConsumer):
         elif action == "start_dungeon":
             await self.handle_start_dungeon()
         elif action == "stop_dungeon":
+            await self.catch_up_dungeon()
             await self.stop_dungeon()
         elif action == "handle_dungeon_choice":
             choice_index = data.get("choice_index", 0)
             await self.handle_dungeon_choice(choice_index)
         elif action == "fetch_dungeon_data":
             print("dungeon")
-            dungeon_data = await self.get_dungeon_data()
+            await self.catch_up_dungeon()
+            dungeon_data = await self.get_dungeon_data(data.get("since_seq", 0))
             await self.send(text_data=json.dumps({
                 "type": "dungeon_data",
                 "data": dungeon_data
             }))
         elif action == "check_dungeon_status":
+            await self.catch_up_dungeon()
             await self.is_player_in_dungeon()
 
+        if action in self.INVENTORY_MUTATING_ACTIONS:
+            await self.push_inventory_delta()
+
 
     async def send_inventory_update(self, inventory_data):
         """
         Sends the updated inventory data to the client.
         """
+        self.inventory_state = inventory_data
         await self.send(text_data=json.dumps({
             "type": "inventory_update",
             "data": inventory_data
         }))
 
-    @sync_to_async
-    def get_inventory_data(self):
-        from .models import Inventory, EquippedItem
-        try:
-            inventory = Inventory.objects.get(user=self.user)
-            items = inventory.items.all()
-
-            # Initialize equipped_items to handle cases where it might not be set
-            equipped_items = None
-            equipped_data = {}
+    async def push_inventory_delta(self, inventory_data=None):
+        """
+        Sends only what changed since the inventory the client last received:
+        added, changed and removed items, slot changes and stats.
+        """
+        from .snapshots import diff_inventory_snapshots
+        if inventory_data is None:
+            inventory_data = await self.get_inventory_data()
+        if self.inventory_state is None:
+            await self.send_inventory_update(inventory_data)
+            return
 
-            try:
-                equipped_items = inventory.equipped_items
-                equipped_data = {
-                    "legs": equipped_items.legs.file_name if equipped_items.legs else None,
-                    "headpiece": equipped_items.headpiece.file_name if equipped_items.headpiece else None,
-                    "arm": equipped_items.arm.file_name if equipped_items.arm else None,
-                    "melee": equipped_items.melee.file_name if equipped_items.melee else None,
-                    "armour": equipped_items.armour.file_name if equipped_items.armour else None,
-                    "wings": equipped_items.wings.file_name if equipped_items.wings else None,
-                }
-            except EquippedItem.DoesNotExist:
-                # Log the absence of equipped items if needed
-                equipped_items = None
-
-            # Include is_equipped for each item
-            item_list = []
-            for item in items:
-                is_equipped = (
-                        equipped_items is not None and any(
-                    getattr(equipped_items, key, None) and getattr(equipped_items, key).file_name == item.file_name
-                    for key in ["legs", "headpiece", "arm", "melee", "armour", "wings"]
-                )
-                )
-                # Append `_inv` to file_name for everything except armour
-                file_name = f"{item.file_name}_inv" if item.category != "armour" else item.file_name
-
-                item_list.append({
-                    "id": item.id,
-                    "name": item.name,
-                    "file_name": item.file_name,
-                    "file_name_inv": file_name,
-                    "category": item.category,
-                    "rarity": item.rarity,
-                    "is_equipped": is_equipped
-                })
-
-            # Fetch player stats from the user object
-            self.user.refresh_from_db()
-            stats = {
-                "strength": self.user.strength,
-                "agility": self.user.agility,
-                "intelligence": self.user.intelligence,
-                "stealth": self.user.stealth,
-                "speed": self.user.speed,
-                "defence": self.user.defence,
-            }
+        delta = diff_inventory_snapshots(self.inventory_state, inventory_data)
+        self.inventory_state = inventory_data
+        if delta is not None:
+            await self.send(text_data=json.dumps({
+                "type": "inventory_delta",
+                "data": delta
+            }))
 
-            # Add stats from equipped items
-            if equipped_items:
-                for key in ["legs", "headpiece", "arm", "melee", "armour", "wings"]:
-                    item = getattr(equipped_items, key, None)
-                    if item:
-                        stats["strength"] += getattr(item, "strength", 0)
-                        stats["agility"] += getattr(item, "agility", 0)
-                        stats["intelligence"] += getattr(item, "intelligence", 0)
-                        stats["stealth"] += getattr(item, "stealth", 0)
-                        stats["speed"] += getattr(item, "speed", 0)
-                        stats["defence"] += getattr(item, "defence", 0)
+    async def sync_inventory(self, client_revision):
+        """
+        Brings a client holding inventory `client_revision` up to date: nothing if it
+        is current, a delta if it matches what this connection last sent, otherwise
+        the full inventory.
+        """
+        inventory_data = await self.get_inventory_data()
+        if client_revision == inventory_data["revision"]:
+            await self.send(text_data=json.dumps({
+                "type": "inventory_in_sync",
+                "revision": client_revision
+            }))
+        elif self.inventory_state is not None and client_revision == self.inventory_state["revision"]:
+            await self.push_inventory_delta(inventory_data)
+        else:
+            await self.send_inventory_update(inventory_data)
 
-            return {
-                "items": item_list,
-                "equipped": equipped_data,
-                "stats": stats
-            }
-        except Inventory.DoesNotExist:
-            return {"items": [], "equipped": {}, "stats": {}}  # Default empty stats if no inventory exists
+    @sync_to_async
+    def get_inventory_data(self):
+        """
+        Returns the user's items, equipped map and computed stats from the
+        cached snapshot; see `inventory.snapshots`.
+        """
+        from .snapshots import get_inventory_snapshot
+        return get_inventory_snapshot(self.user.pk)
 
     async def send_currency_update(self, currency_data):
         """
@@ -221,7 +230,9 @@ class InventoryConsumer(AsyncWebsocketConsumer):
             pass
 
     @sync_to_async
+    @transaction.atomic
     def remove_item(self, item_id):
+        from .loadout import EQUIPMENT_SLOTS
         from .models import Item, Inventory, EquippedItem
         try:
             item = Item.objects.get(id=item_id)
@@ -229,9 +240,9 @@ class InventoryConsumer(AsyncWebsocketConsumer):
             inventory.items.remove(item)
             try:
                 equipped_items = inventory.equipped_items
-                for field in ["legs", "headpiece", "arm", "wings", "melee", "armour"]:
-                    equipped_item = getattr(equipped_items, field)
-                    if equipped_item == item:
+                # Compare the raw ids so no slot item is loaded
+                for field in EQUIPMENT_SLOTS:
+                    if getattr(equipped_items, f"{field}_id") == item.id:
                         setattr(equipped_items, field, None)
                 equipped_items.save()
             except EquippedItem.DoesNotExist:
@@ -240,10 +251,12 @@ class InventoryConsumer(AsyncWebsocketConsumer):
             pass
 
     @sync_to_async
+    @transaction.atomic
     def equip_item(self, item_name, category):
         """
         Equips an item in the specified category.
         """
+        from .loadout import EQUIPMENT_SLOTS
         from .models import Item, Inventory, EquippedItem
         try:
             print(item_name)
@@ -256,24 +269,26 @@ class InventoryConsumer(AsyncWebsocketConsumer):
             inventory = Inventory.objects.get(user=self.user)
             equipped_items, _ = EquippedItem.objects.get_or_create(inventory=inventory)
 
-            if category in ["legs", "headpiece", "arm", "wings", "melee", "armour"]:
-                if item in inventory.items.all() and item.category == category:
+            if category in EQUIPMENT_SLOTS:
+                if item.category == category and inventory.items.filter(pk=item.pk).exists():
                     setattr(equipped_items, category, item)
                     equipped_items.save()
         except (Item.DoesNotExist, Inventory.DoesNotExist):
             print("Item or Inventory does not exist.")
 
     @sync_to_async
+    @transaction.atomic
     def unequip_item(self, category):
         """
         Unequips an item from the specified category.
         """
+        from .loadout import EQUIPMENT_SLOTS
         from .models import Inventory, EquippedItem
         try:
             inventory = Inventory.objects.get(user=self.user)
             equipped_items, _ = EquippedItem.objects.get_or_create(inventory=inventory)
 
-            if category in ["legs", "headpiece", "arm", "wings", "melee", "armour"]:
+            if category in EQUIPMENT_SLOTS:
                 setattr(equipped_items, category, None)
                 equipped_items.save()
         except Inventory.DoesNotExist:
@@ -354,28 +369,23 @@ class InventoryConsumer(AsyncWebsocketConsumer):
         """
         from .models import Inventory, MarketListing
         try:
-            listing = MarketListing.objects.get(id=listing_id, is_active=True)
+            listing = MarketListing.objects.select_related('item').get(id=listing_id, is_active=True)
             buyer = self.user
 
-            # Check if buyer has enough coins
-            if buyer.coins < listing.listed_price:
-                raise ValueError("Not enough currency to buy this item.")
-
-            # Deduct coins from buyer
-            buyer.coins -= listing.listed_price
-            buyer.save()
+            with transaction.atomic():
+                # Mark the listing as inactive; the conditional UPDATE lets only one buyer claim it
+                if not MarketListing.objects.filter(pk=listing.pk, is_active=True).update(is_active=False):
+                    raise MarketListing.DoesNotExist
 
-            # Add item to buyer's inventory
-            inventory, _ = Inventory.objects.get_or_create(user=buyer)
-            inventory.items.add(listing.item)
-
-            # Mark the listing as inactive
-            listing.is_active = False
-            listing.save()
+                # Move coins from buyer to seller, if the buyer can afford it
+                try:
+                    transfer_coins(buyer, listing.seller_id, listing.listed_price)
+                except InsufficientCoins:
+                    raise ValueError("Not enough currency to buy this item.")
 
-            # Add coins to seller
-            listing.seller.coins += listing.listed_price
-            listing.seller.save()
+                # Add item to buyer's inventory
+                inventory, _ = Inventory.objects.get_or_create(user=buyer)
+                inventory.items.add(listing.item)
 
             return {
                 "id": listing.item.id,
@@ -489,6 +499,9 @@ class InventoryConsumer(AsyncWebsocketConsumer):
     async def stop_dungeon(self):
         from .models import DungeonSession, Inventory
 
+        # The row and items_collected must hold everything from Redis before the run is closed
+        await self.flush_dungeon_state(evict=True)
+
         # Retrieve the active dungeon session
         session = await self.get_active_dungeon_session_end()
         if not session:
@@ -561,15 +574,34 @@ class InventoryConsumer(AsyncWebsocketConsumer):
 
     @database_sync_to_async
     def add_coins_sync(self, user, amount: int):
-        user.coins += amount
-        user.save()
+        add_coins(user, amount)
 
     @database_sync_to_async
     def get_paused_session(self, user_id):
         from .models import DungeonSession
-        return DungeonSession.objects.filter(
-            user_id=user_id, end_time__isnull=True, paused=True
-        ).first()
+        store = get_dungeon_state_store()
+        if store is None:
+            return DungeonSession.objects.filter(
+                user_id=user_id, end_time__isnull=True, paused=True
+            ).first()
+        # While the run is hot the row's pause flag may be behind
+        session = DungeonSession.objects.filter(user_id=user_id, end_time__isnull=True).first()
+        if session is not None:
+            store.overlay([session])
+        return session if session is not None and session.paused else None
+
+    @database_sync_to_async
+    def resolve_hot_dungeon_choice(self, session, health_change):
+        """
+        Resolves the NPC event of a hot run in one atomic Redis update. Returns
+        False if the run is not hot; raises DungeonStateConflict if it was
+        already resolved.
+        """
+        from django.utils.timezone import timedelta
+        store = get_dungeon_state_store()
+        if store is None:
+            return False
+        return store.resolve_choice(session.pk, health_change, now() + timedelta(minutes=10), now()) is not None
 
     @database_sync_to_async
     def update_user_health(self, session, health_change):
@@ -611,7 +643,14 @@ class InventoryConsumer(AsyncWebsocketConsumer):
         health_change = choice.get("health_change", 0)
         currency_change = choice.get("currency_change", 0)
 
-        await self.update_user_health(session, health_change)
+        # A hot run is resolved first and atomically, so a repeated choice cannot pay out twice
+        try:
+            hot = await self.resolve_hot_dungeon_choice(session, health_change)
+        except DungeonStateConflict:
+            await self.send("No NPC event data to resolve.")
+            return
+        if not hot:
+            await self.update_user_health(session, health_change)
         await self.add_coins_sync(self.user, currency_change)
 
         # 3) Add any items gained
@@ -620,14 +659,17 @@ class InventoryConsumer(AsyncWebsocketConsumer):
             await self.add_item_by_name_local_sync(self.user, item_name)
 
         # 4) Unpause and save the session
-        session.paused = False
-        session.npc_event_data = None
+        if not hot:
+            session.paused = False
+            session.npc_event_data = None
 
-        from django.utils.timezone import now, timedelta
-        session.next_item_time = now() + timedelta(minutes=10)
+            from django.utils.timezone import now, timedelta
+            session.next_item_time = now() + timedelta(minutes=10)
+            # Nothing happens while paused; catch-up must not replay escapades for that time
+            session.next_escapade_time = max(session.next_escapade_time, now())
 
-        # Use our lazy method to save the session
-        await self.save_dungeon_session(session)
+            # Use our lazy method to save the session
+            await self.save_dungeon_session(session)
 
         # 5) Send feedback
         await self.send(text_data=json.dumps({
@@ -688,6 +730,64 @@ class InventoryConsumer(AsyncWebsocketConsumer):
             print(f"Error fetching active dungeon session: {e}")
             return None
 
+    @sync_to_async
+    def catch_up_dungeon(self):
+        """
+        Replays everything that has happened in the player's open run since it
+        was last evaluated, so reads never depend on when the sweep last came by.
+        """
+        from .models import DungeonSession
+        from .tasks import advance_dungeon_sessions
+
+        store = get_dungeon_state_store()
+        with transaction.atomic():
+            sessions = DungeonSession.objects.select_for_update().filter(user=self.user, end_time__isnull=True)
+            if store is None:
+                sessions = sessions.filter(paused=False)
+            # A hot run's pause flag is read from Redis by advance_dungeon_sessions
+            sessions = list(sessions)
+            if sessions:
+                advance_dungeon_sessions(sessions, now(), store=store)
+
+    @sync_to_async
+    def load_dungeon_state(self):
+        """
+        Moves the player's open run into Redis while they are connected (see
+        `inventory.dungeon_state`); a no-op unless DUNGEON_HOT_STATE is on.
+        """
+        from .models import DungeonSession
+
+        store = get_dungeon_state_store()
+        if store is None:
+            return
+        try:
+            with transaction.atomic():
+                session = DungeonSession.objects.select_for_update().filter(
+                    user=self.user, end_time__isnull=True
+                ).first()
+                if session:
+                    store.load(session)
+        except Exception as e:
+            # The run simply stays in Postgres
+            print(f"Loading dungeon state into Redis failed: {e}")
+
+    @sync_to_async
+    def flush_dungeon_state(self, evict=False):
+        """
+        Writes the player's hot run back to its row; with `evict`, it also
+        leaves Redis and returns to the sweep.
+        """
+        from .models import DungeonSession
+
+        store = get_dungeon_state_store()
+        if store is None:
+            return
+        session_id = store.session_id_for_user(self.user.id)
+        if session_id is None:
+            return
+        with transaction.atomic():
+            store.flush(DungeonSession.objects.select_for_update().filter(pk=session_id), evict=evict)
+
     @sync_to_async
     def get_paused_dungeon_session(self):
         """
@@ -699,7 +799,12 @@ class InventoryConsumer(AsyncWebsocketConsumer):
         ).first()
 
     @sync_to_async
-    def get_dungeon_data(self):
+    def get_dungeon_data(self, since_seq=0):
+        """
+        Returns the active session's state. Only the log entries after
+        `since_seq` are included, so a client that already holds the log up to
+        `log_seq` of an earlier reply fetches just the new lines.
+        """
         print("in get_dungeon_data")
         from .models import DungeonSession, Item
 
@@ -715,8 +820,16 @@ class InventoryConsumer(AsyncWebsocketConsumer):
                 "message": "No active dungeon session."
             }
 
+        items = list(session.items_collected.all())
+        store = get_dungeon_state_store()
+        if store is not None and store.overlay([session]):
+            # Items collected since the last flush are still only in Redis
+            pending = store.pending_item_ids(session.pk) - {item.id for item in items}
+            if pending:
+                items += Item.objects.filter(pk__in=pending)
+
         items_collected = []
-        for i in session.items_collected.all():
+        for i in items:
             items_collected.append({
                 "id": i.id,
                 "name": i.name,
@@ -731,7 +844,8 @@ class InventoryConsumer(AsyncWebsocketConsumer):
 
         return {
             "items": items_collected,
-            "logs": session.logs,
+            "logs": session.logs_since(since_seq or 0),
+            "log_seq": session.log_seq,
             "current_health": session.user_health,
             "npc_event": session.npc_event_data or {},
             "paused": session.paused,
@@ -838,174 +952,22 @@ class InventoryConsumer(AsyncWebsocketConsumer):
     @staticmethod
     def generate_dynamic_event(npc) -> dict:
         """
-        Generates a dynamic dungeon event involving the specified NPC using Amazon Bedrock.
-        """
-        # Fallback example event structure
-        example_event = {
-            "dialogue": f"{npc.name} glances at you warily. '{npc.short_description}'",
-            "choices": [
-                {
-                    "choice_text": "Ask for directions.",
-                    "consequences": {
-                        "health_change": 0,
-                        "currency_change": 0,
-                        "consequence_text": "The NPC gives you directions, though they seem unsure."
-                    }
-                },
-                {
-                    "choice_text": "Attack immediately.",
-                    "consequences": {
-                        "health_change": -10,
-                        "currency_change": 0,
-                        "consequence_text": "You strike first, dealing 10 damage—but the NPC quickly retaliates."
-                    }
-                }
-            ]
-        }
-
-        # Define the revised prompt for the model
-        prompt = (
-            "Act as a creative game event generator. Given an NPC's details, create a dungeon event that includes "
-            "dialogue from the NPC and exactly two choices. Each choice must have a 'choice_text' and corresponding "
-            "'consequences' including 'health_change', 'currency_change', and 'consequence_text'.\n\n"
-            "Output only the JSON object without any additional text or formatting.\n"
-            "Example:\n"
-            "{\n"
-            '    "dialogue": "Sloan Rho leans against a cracked concrete wall, cleaning a sleek pistol with practiced movements. \'You\'re not from around here. What\'s your business in this sector?\' Their eyes scan you coldly, waiting for a response.",\n'
-            '    "choices": [\n'
-            '        {\n'
-            '            "choice_text": "Offer to help with a local problem.",\n'
-            '            "consequences": {\n'
-            '                "health_change": 0,\n'
-            '                "currency_change": 50,\n'
-            '                "consequence_text": "Sloan considers your offer, then nods. They share a quick job that pays well, appreciating your straightforward approach."\n'
-            '            }\n'
-            '        },\n'
-            '        {\n'
-            '            "choice_text": "Claim you\'re just passing through.",\n'
-            '            "consequences": {\n'
-            '                "health_change": -5,\n'
-            '                "currency_change": -20,\n'
-            '                "consequence_text": "Sloan doesn\'t believe your story. They rough you up a bit and search your pockets, taking some of your credits as \'insurance\'."\n'
-            '            }\n'
-            '        }\n'
-            '    ]\n'
-            "}\n"
-            "\n"
-            "Generate a dungeon event based on the following NPC details:\n"
-            f'"name": "{npc.name}",\n'
-            f'"description": "{npc.short_description}"\n'
-        )
-
-        # Prepare the request payload (adjust according to Bedrock's API)
-        native_request = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 512,
-            "temperature": 0.5,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [{"type": "text", "text": prompt}],
-                }
-            ],
-        }
-
-        # Convert the request to JSON
-        request = json.dumps(native_request)
-
-        # Create the Bedrock Runtime client
-        client = boto3.client("bedrock-runtime", region_name="us-east-2")
-        model_id = "us.anthropic.claude-3-5-haiku-20241022-v1:0"
-
-        try:
-            # Invoke the model with the request
-            streaming_response = client.invoke_model_with_response_stream(
-                modelId=model_id, body=request
-            )
-
-            # Collect the response content from text_deltas
-            full_response = ""
-            for event in streaming_response.get("body", []):
-                try:
-                    chunk_str = event.get("chunk", {}).get("bytes", b"").decode('utf-8')
-                    if not chunk_str:
-                        continue  # Skip empty chunks
-
-                    # Each chunk_str is a JSON object, parse it
-                    chunk_json = json.loads(chunk_str)
-
-                    # Check if it's a content_block_delta with text_delta
-                    if chunk_json.get("type") == "content_block_delta":
-                        delta = chunk_json.get("delta", {})
-                        if delta.get("type") == "text_delta":
-                            text = delta.get("text", "")
-                            full_response += text  # Accumulate the text
-                except json.JSONDecodeError as e:
-                    print(f"Error decoding chunk: {e}")
-                    print(f"Chunk content: {chunk_str}")
-                    continue  # Skip malformed chunks
-
-            # Debugging: Print the full_response to inspect its content
-            print("Full Response from Model:", full_response)
-
-            if not full_response.strip():
-                print("Received empty response from the model. Using fallback example_event.")
-                return example_event  # Return fallback if the response is empty
-
-            # Attempt to parse the accumulated full_response as JSON
-            try:
-                response_data = json.loads(full_response)
-            except json.JSONDecodeError as json_err:
-                print(f"JSON decoding error after accumulation: {json_err}")
-                print(f"Accumulated JSON string was: {full_response}")
-                return example_event  # Return fallback structure
-
-            # Extract dialogue and choices with defaults
-            dialogue = response_data.get("dialogue", example_event["dialogue"])
-            choices = response_data.get("choices", example_event["choices"])
-
-            # Validate that choices contain required fields
-            validated_choices = []
-            for choice in choices:
-                choice_text = choice.get("choice_text", "Default choice")
-                consequences = choice.get("consequences", {})
-                health_change = consequences.get("health_change", 0)
-                currency_change = consequences.get("currency_change", 0)
-                consequence_text = consequences.get("consequence_text", "")
-
-                validated_choices.append({
-                    "choice_text": choice_text,
-                    "consequences": {
-                        "health_change": health_change,
-                        "currency_change": currency_change,
-                        "consequence_text": consequence_text
-                    }
-                })
-
-            # Ensure exactly two choices
-            if len(validated_choices) != 2:
-                print(f"Expected 2 choices, but got {len(validated_choices)}. Using fallback choices.")
-                return example_event
-
-            # Format and return the structured output
-            return {
-                "dialogue": dialogue.strip(),
-                "choices": validated_choices
-            }
-
-        except Exception as e:
-            print(f"Error generating dynamic event: {e}")
-            return example_event  # Return fallback structure
+        Generates a dynamic dungeon event involving the specified NPC using Amazon Bedrock,
+        falling back to the static example event. The dungeon tick takes pre-generated
+        events from `inventory.npc_events` instead of calling this.
+        """
+        from .npc_events import example_event, generate_npc_event
+        return generate_npc_event(npc) or example_event(npc)
 
     @sync_to_async
     def get_random_npc(self):
         """
         Retrieves a random NPC from the database.
         """
-        from inventory.models import NPC
+        from .loot import get_npc_table
 
         try:
-            npc = NPC.objects.order_by('?').first()
+            npc = get_npc_table().sample()
             if npc:
                 logger.info("Selected NPC '%s' for dungeon event.", npc.name)
             else:
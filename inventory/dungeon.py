@@ -0,0 +1,278 @@
+# dungeon.py
+"""
+One dungeon tick as a pure function of the session's state and an RNG.
+
+`tick_session` reads a session's timers and health, rolls everything with the
+`random.Random` it is given and returns a `TickResult` listing what changed:
+new field values, the items collected and the events (with their log entries)
+to publish. It never touches the database (draws come from the in-memory tables
+of `inventory.loot`), so a tick can be replayed exactly from a seeded RNG, and
+`process_dungeon_sessions` can write a whole batch of results with one UPDATE
+per session plus one log INSERT and one collected-items INSERT per batch.
+
+Runs are advanced lazily by `catch_up`, which replays every step that fell due
+since the last evaluation. It is called when the player reads the run
+(`fetch_dungeon_data`, `check_dungeon_status`, `stop_dungeon`), so the sweep is
+only there to push events to players who are watching.
+
+Every roll of step N of a run comes from `step_rng(session.seed, N)`, so a run
+is reproducible from its seed. Log entries are stored compactly as a code and
+the rolled values (LOG_* below, e.g. ("fight", [monster, damage])) with the
+player's health after them; `render_log` turns them back into text on read.
+"""
+import random
+from datetime import timedelta
+
+from .events import DEATH, ESCAPADE, ITEM_COLLECTED, NPC_ENCOUNTER
+
+NPC_EVENT_DELAY = timedelta(seconds=360)  # Time into a run before the NPC encounter
+ITEM_INTERVAL = timedelta(minutes=10)
+ESCAPADE_INTERVAL = timedelta(minutes=10)
+MAX_HEALTH = 100
+MAX_CATCH_UP_STEPS = 1000  # Per call; a longer backlog is finished by the next read or sweep
+
+MONSTERS = [
+    {"name": "Goblin", "description": "A sneaky green creature with sharp teeth."},
+    {"name": "Skeleton Warrior", "description": "An animated skeleton armed with a rusty sword."},
+    {"name": "Orc Brute", "description": "A large and muscular orc with a menacing axe."},
+    {"name": "Dark Sorcerer", "description": "A mysterious figure cloaked in dark robes, wielding arcane powers."}
+]
+TRAPS = [
+    "a spike trap that deals damage",
+    "a poison dart trap that reduces health over time",
+    "a collapsing ceiling that restricts movement"
+]
+TREASURES = [
+    {"name": "Ancient Relic", "description": "An old relic radiating mysterious energy."},
+    {"name": "Healing Potion", "description": "A potion that restores health."},
+    {"name": "Mana Crystal", "description": "A crystal that enhances magical abilities."}
+]
+PUZZLES = [
+    "a riddle inscribed on the wall",
+    "a complex mechanism that needs to be aligned",
+    "a series of pressure plates that must be stepped on in the correct order"
+]
+
+# Log entry codes and their arguments
+LOG_ITEM = "item"  # [item id]
+LOG_NPC = "npc"  # [npc name, npc description]
+LOG_FIGHT = "fight"  # [MONSTERS index, damage]
+LOG_TRAP = "trap"  # [TRAPS index, damage]
+LOG_CHAMBER = "chamber"  # [TREASURES index]
+LOG_PUZZLE = "puzzle"  # [PUZZLES index, damage]; no damage means it was solved
+LOG_REST = "rest"  # [health regained]
+LOG_DEATH = "death"  # []
+
+
+class TickResult:
+    """The changes one tick makes to a session; empty (falsy) if nothing was due."""
+
+    def __init__(self):
+        self.fields = {}  # DungeonSession field -> new value
+        self.item_ids = []  # Items to add to items_collected
+        self.events = []  # {"event", "at", "logs": [(code, args, health)], "data"} in the order they happened
+        self.npc = None  # NPC met this tick; its dialogue is generated when the result is applied
+
+    def __bool__(self):
+        return bool(self.fields or self.events)
+
+    def add_event(self, at, event, logs, **data):
+        self.events.append({"event": event, "at": at, "logs": logs, "data": data})
+
+    def merge(self, other):
+        """Folds a later step's changes into this result."""
+        self.fields.update(other.fields)
+        self.item_ids.extend(other.item_ids)
+        self.events.extend(other.events)
+        self.npc = other.npc or self.npc
+
+    @property
+    def logs(self):
+        return [log for event in self.events for log in event["logs"]]
+
+
+def tick_session(session, now, rng, loot_table, npc_table):
+    """
+    Runs one tick of `session` at time `now`:
+    - Collect an item drawn from `loot_table` when `next_item_time` has passed.
+    - Meet an NPC drawn from `npc_table` once NPC_EVENT_DELAY into the run, which
+      pauses the session until the player chooses.
+    - Have an escapade every ESCAPADE_INTERVAL.
+    - Pause the session if the player's health has dropped to zero.
+    The session is only read; apply the returned TickResult to persist it.
+    """
+    result = TickResult()
+    health = session.user_health
+    paused = session.paused
+
+    if session.next_item_time and now >= session.next_item_time:
+        # With nothing to drop the timer still moves on, so catch-up does not stall on it
+        item = loot_table.sample(rng)
+        if item is not None:
+            result.item_ids.append(item.id)
+            result.add_event(
+                now,
+                ITEM_COLLECTED,
+                [(LOG_ITEM, [item.id], health)],
+                item={
+                    "id": item.id,
+                    "name": item.name,
+                    "file_name": item.file_name,
+                    "category": item.category,
+                    "rarity": item.rarity,
+                },
+            )
+        result.fields['next_item_time'] = now + ITEM_INTERVAL
+
+    if not session.npc_event_triggered and now - session.start_time >= NPC_EVENT_DELAY and npc_table:
+        npc = npc_table.sample(rng)
+        result.npc = npc
+        result.fields['npc_event_triggered'] = True
+        result.fields['paused'] = paused = True
+        result.add_event(now, NPC_ENCOUNTER, [(LOG_NPC, [npc.name, npc.short_description], health)])
+
+    if session.next_escapade_time and now >= session.next_escapade_time:
+        health, code, args = generate_escapade(health, rng)
+        result.add_event(now, ESCAPADE, [(code, args, health)])
+        result.fields['next_escapade_time'] = now + ESCAPADE_INTERVAL
+
+    if health != session.user_health:
+        result.fields['user_health'] = health
+
+    if health <= 0 and not paused:
+        result.fields['paused'] = True
+        result.add_event(now, DEATH, [(LOG_DEATH, [], health)])
+
+    return result
+
+
+def new_seed():
+    return random.getrandbits(62)
+
+
+def step_rng(seed, step):
+    """The generator for step `step` of a run; the same seed and step always roll the same."""
+    return random.Random(f"{seed}:{step}")
+
+
+def next_step_at(session, include_npc=True):
+    """
+    When the session's next step falls due: the earliest of the item, NPC and
+    escapade timers, or straight away for a player already dead. None once the
+    run is paused or over.
+    """
+    if session.end_time is not None or session.paused:
+        return None
+    if session.user_health <= 0:
+        return session.last_evaluated_at or session.start_time
+    due = [time for time in (session.next_item_time, session.next_escapade_time) if time is not None]
+    if include_npc and not session.npc_event_triggered:
+        due.append(session.start_time + NPC_EVENT_DELAY)
+    return min(due) if due else None
+
+
+def catch_up(session, until, loot_table, npc_table):
+    """
+    Replays every step of `session` that fell due up to `until`, each at its
+    own due time and with the `step_rng` of its step number, and returns the
+    combined TickResult. The outcome depends only on the session's seed and timers, so
+    it makes no difference whether the sweep or a player's read gets there
+    first, or how late. The session's fields are advanced in memory.
+    """
+    combined = TickResult()
+    for _ in range(MAX_CATCH_UP_STEPS):
+        # Without NPCs to meet, the NPC timer would never move on
+        at = next_step_at(session, include_npc=bool(npc_table))
+        if at is None or at > until:
+            break
+        result = tick_session(session, at, step_rng(session.seed, session.step), loot_table, npc_table)
+        if not result:
+            break
+        result.fields['step'] = session.step + 1
+        for field, value in result.fields.items():
+            setattr(session, field, value)
+        combined.merge(result)
+    if combined:
+        session.last_evaluated_at = combined.fields['last_evaluated_at'] = until
+    return combined
+
+
+def generate_escapade(health, rng):
+    """
+    Picks one escapade and returns (new health, log code, log args):
+    - Fighting a monster
+    - Finding a trap
+    - Discovering a hidden chamber
+    - Solving a puzzle
+    - Resting to regain health
+    """
+    escapade = rng.choice([
+        fight_monster,
+        find_trap,
+        discover_hidden_chamber,
+        solve_puzzle,
+        rest_regain_health
+    ])
+    return escapade(health, rng)
+
+
+def fight_monster(health, rng):
+    monster = rng.randrange(len(MONSTERS))
+    damage = rng.randint(10, 25)
+    return max(health - damage, 0), LOG_FIGHT, [monster, damage]
+
+
+def find_trap(health, rng):
+    trap = rng.randrange(len(TRAPS))
+    damage = rng.randint(15, 25)
+    return max(health - damage, 0), LOG_TRAP, [trap, damage]
+
+
+def discover_hidden_chamber(health, rng):
+    return health, LOG_CHAMBER, [rng.randrange(len(TREASURES))]
+
+
+def solve_puzzle(health, rng):
+    puzzle = rng.randrange(len(PUZZLES))
+    if rng.random() < 0.7:  # 70% chance to solve
+        return health, LOG_PUZZLE, [puzzle]
+    damage = rng.randint(5, 10)
+    return max(health - damage, 0), LOG_PUZZLE, [puzzle, damage]
+
+
+def rest_regain_health(health, rng):
+    health_regained = rng.randint(10, 15)
+    return min(health + health_regained, MAX_HEALTH), LOG_REST, [health_regained]
+
+
+def render_log(code, args, items=None):
+    """
+    The text of a compact log entry. `items` maps item ids to anything with
+    name, category and rarity (or such dicts), for LOG_ITEM entries.
+    """
+    if code == LOG_ITEM:
+        item = (items or {}).get(args[0])
+        if item is None:
+            return "Collected an item that no longer exists."
+        if not isinstance(item, dict):
+            item = {"name": item.name, "category": item.category, "rarity": item.rarity}
+        return f"Collected item: {item['name']} ({item['category']}, {item['rarity']})"
+    if code == LOG_NPC:
+        return f"Encountered NPC: {args[0]} - {args[1]}"
+    if code == LOG_FIGHT:
+        monster = MONSTERS[args[0]]
+        return f"Fought a {monster['name']}: {monster['description']}. Took {args[1]} damage."
+    if code == LOG_TRAP:
+        return f"Triggered {TRAPS[args[0]]}. Took {args[1]} damage."
+    if code == LOG_CHAMBER:
+        treasure = TREASURES[args[0]]
+        return f"Discovered a hidden chamber containing {treasure['name']}: {treasure['description']}."
+    if code == LOG_PUZZLE:
+        if len(args) < 2:
+            return f"Solved {PUZZLES[args[0]]}. Progressed further into the dungeon."
+        return f"Failed to solve {PUZZLES[args[0]]}. Took {args[1]} damage."
+    if code == LOG_REST:
+        return f"Rested and regained {args[0]} health."
+    if code == LOG_DEATH:
+        return "You have died in the dungeon."
+    return ""
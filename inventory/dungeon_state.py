@@ -0,0 +1,311 @@
+# dungeon_state.py
+"""
+Hot state of the dungeon runs whose players are connected, kept in Redis.
+
+While a player has the inventory socket open, their open run's mutable fields
+(health, timers, pause flag, pending NPC event, step and log counters) live in
+a Redis hash and the items it collects in a Redis set. Catching up, NPC
+choices and reads go there instead of rewriting the DungeonSession row each
+time; every multi-field change is a single Lua script, so it is atomic and
+one round trip. The row is written back ("flushed") when the run is stopped,
+when the player dies or disconnects, and every few seconds by
+`flush_dungeon_states`.
+
+A hot row has `next_due_at` cleared, so `process_dungeon_sessions` leaves it
+to `flush_dungeon_states`; flushing with `evict=True` restores it. Every write
+bumps a `version` counter in the hash and a flush records the version it wrote
+as `flushed`, so the periodic flush only writes the rows of runs that changed.
+
+Enabled with the DUNGEON_HOT_STATE setting; the client can be injected, so a
+local Redis or fakeredis is enough to exercise it.
+"""
+import json
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import transaction
+
+STATE_KEY = "inventory:dungeon_state:{session_id}"
+ITEMS_KEY = "inventory:dungeon_state:{session_id}:items"
+USER_KEY = "inventory:dungeon_state:user:{user_id}"
+HOT_SESSIONS_KEY = "inventory:dungeon_state:hot"
+STATE_TTL = 60 * 60 * 6  # Refreshed by every write and flush; only reached if flushing stops
+
+# DungeonSession fields held in the hash, with how they are encoded
+DATETIME, BOOL, INT, JSON = "datetime", "bool", "int", "json"
+HOT_FIELDS = {
+    'user_health': INT,
+    'paused': BOOL,
+    'npc_event_triggered': BOOL,
+    'npc_event_data': JSON,
+    'next_item_time': DATETIME,
+    'next_escapade_time': DATETIME,
+    'step': INT,
+    'log_seq': INT,
+    'last_evaluated_at': DATETIME,
+}
+
+# KEYS: state, hot index, user; ARGV: ttl, session id, field/value pairs
+LOAD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'version', 0, 'flushed', 0, unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('SADD', KEYS[2], ARGV[2])
+redis.call('SET', KEYS[3], ARGV[2], 'EX', ARGV[1])
+return 1
+"""
+
+# KEYS: state, items; ARGV: expected step, ttl, number of field/value args, field/value pairs, item ids
+SAVE_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'step') ~= ARGV[1] then
+    return 0
+end
+local n = tonumber(ARGV[3])
+if n > 0 then
+    redis.call('HSET', KEYS[1], unpack(ARGV, 4, 3 + n))
+end
+if #ARGV > 3 + n then
+    redis.call('SADD', KEYS[2], unpack(ARGV, 4 + n))
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+end
+redis.call('HINCRBY', KEYS[1], 'version', 1)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+# KEYS: state; ARGV: health change, next item time, now, ttl
+RESOLVE_CHOICE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -2
+end
+if redis.call('HGET', KEYS[1], 'paused') ~= '1' or redis.call('HGET', KEYS[1], 'npc_event_data') == '' then
+    return -1
+end
+local health = math.max(0, tonumber(redis.call('HGET', KEYS[1], 'user_health')) + tonumber(ARGV[1]))
+local escapade = tonumber(redis.call('HGET', KEYS[1], 'next_escapade_time'))
+if escapade == nil or escapade < tonumber(ARGV[3]) then
+    redis.call('HSET', KEYS[1], 'next_escapade_time', ARGV[3])
+end
+redis.call('HSET', KEYS[1], 'user_health', health, 'paused', '0', 'npc_event_data', '', 'next_item_time', ARGV[2])
+redis.call('HINCRBY', KEYS[1], 'version', 1)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return health
+"""
+
+
+class DungeonStateConflict(Exception):
+    """The hash changed (or expired) under a write that expected a given step."""
+
+
+def _encode(kind, value):
+    if value is None:
+        return ""
+    if kind == DATETIME:
+        return str(round(value.timestamp() * 1_000_000))
+    if kind == BOOL:
+        return "1" if value else "0"
+    if kind == JSON:
+        return json.dumps(value)
+    return str(value)
+
+
+def _decode(kind, raw):
+    raw = raw.decode() if isinstance(raw, bytes) else raw
+    if raw == "":
+        return None
+    if kind == DATETIME:
+        return datetime.fromtimestamp(int(raw) / 1_000_000, tz=timezone.utc)
+    if kind == BOOL:
+        return raw == "1"
+    if kind == JSON:
+        return json.loads(raw)
+    return int(raw)
+
+
+def _pairs(fields):
+    args = []
+    for field, value in fields.items():
+        args += [field, _encode(HOT_FIELDS[field], value)]
+    return args
+
+
+class DungeonStateStore:
+    def __init__(self, client=None):
+        if client is None:
+            from django_redis import get_redis_connection
+            client = get_redis_connection("default")
+        self.client = client
+        self._load = client.register_script(LOAD_SCRIPT)
+        self._save = client.register_script(SAVE_SCRIPT)
+        self._resolve_choice = client.register_script(RESOLVE_CHOICE_SCRIPT)
+
+    def load(self, session):
+        """
+        Makes `session` hot: copies its fields into Redis unless they are there
+        already, and takes the row off the sweep. Call with the row locked.
+        """
+        from .models import DungeonSession
+
+        fields = {field: getattr(session, field) for field in HOT_FIELDS}
+        loaded = self._load(
+            keys=[STATE_KEY.format(session_id=session.pk), HOT_SESSIONS_KEY, USER_KEY.format(user_id=session.user_id)],
+            args=[STATE_TTL, session.pk, *_pairs(fields)],
+        )
+        DungeonSession.objects.filter(pk=session.pk).update(next_due_at=None)
+        return bool(loaded)
+
+    def session_id_for_user(self, user_id):
+        session_id = self.client.get(USER_KEY.format(user_id=user_id))
+        return int(session_id) if session_id is not None else None
+
+    def hot_session_ids(self):
+        return {int(session_id) for session_id in self.client.smembers(HOT_SESSIONS_KEY)}
+
+    def get(self, session_id):
+        """The hot fields of the session as a dict, or None if it is not hot."""
+        raw = self.client.hgetall(STATE_KEY.format(session_id=session_id))
+        if not raw:
+            return None
+        raw = {(key.decode() if isinstance(key, bytes) else key): value for key, value in raw.items()}
+        return {field: _decode(kind, raw[field]) for field, kind in HOT_FIELDS.items() if field in raw}
+
+    def overlay(self, sessions):
+        """
+        Replaces the fields of every hot session in `sessions` with its hot
+        state, in one round trip. Returns the ids of the hot ones.
+        """
+        return set(self._overlay(sessions))
+
+    def _overlay(self, sessions):
+        """`overlay`, returning {session id: (version, flushed version)} of the hot ones."""
+        sessions = list(sessions)
+        pipe = self.client.pipeline(transaction=False)
+        for session in sessions:
+            pipe.hgetall(STATE_KEY.format(session_id=session.pk))
+        versions = {}
+        for session, raw in zip(sessions, pipe.execute()):
+            if not raw:
+                continue
+            raw = {(key.decode() if isinstance(key, bytes) else key): value for key, value in raw.items()}
+            for field, kind in HOT_FIELDS.items():
+                if field in raw:
+                    setattr(session, field, _decode(kind, raw[field]))
+            versions[session.pk] = (int(raw.get('version', 0)), int(raw.get('flushed', -1)))
+        return versions
+
+    def pending_item_ids(self, session_id):
+        """Items collected while hot and not yet flushed to `items_collected`."""
+        return {int(item_id) for item_id in self.client.smembers(ITEMS_KEY.format(session_id=session_id))}
+
+    def save(self, session, expected_step, fields, item_ids=()):
+        """
+        Writes the changed `fields` and collected `item_ids` of a hot session
+        atomically, provided its step is still `expected_step`.
+        """
+        pairs = _pairs(fields)
+        saved = self._save(
+            keys=[STATE_KEY.format(session_id=session.pk), ITEMS_KEY.format(session_id=session.pk)],
+            args=[expected_step, STATE_TTL, len(pairs), *pairs, *item_ids],
+        )
+        if not saved:
+            raise DungeonStateConflict(f"Dungeon session {session.pk} changed or left Redis during the write")
+
+    def resolve_choice(self, session_id, health_change, next_item_time, now):
+        """
+        Applies an NPC choice: health change, unpause, clear the event and
+        restart the item timer, moving an overdue escapade timer up to `now`.
+        Returns the new health, or None if the session is not hot; raises
+        DungeonStateConflict if it is hot but not waiting on a choice (any more).
+        """
+        health = self._resolve_choice(
+            keys=[STATE_KEY.format(session_id=session_id)],
+            args=[int(health_change), _encode(DATETIME, next_item_time), _encode(DATETIME, now), STATE_TTL],
+        )
+        if health == -2:
+            return None
+        if health == -1:
+            raise DungeonStateConflict(f"Dungeon session {session_id} has no NPC event to resolve")
+        return health
+
+    def flush(self, sessions, evict=False):
+        """
+        Writes the hot state of `sessions` back to their rows (and the pending
+        items to `items_collected`), skipping runs that have not changed since
+        their last flush. With `evict`, every hot run is written, its state
+        leaves Redis and the row returns to the sweep. Call with the rows
+        locked; Redis is only updated once the transaction commits, so a
+        rolled-back flush is simply done again. Returns the ids written.
+        """
+        from .models import DungeonSession
+
+        sessions = list(sessions)
+        versions = self._overlay(sessions)
+        written = set()
+        collected = []
+        cleanup = []
+        keepalive = self.client.pipeline(transaction=False)
+        for session in sessions:
+            if session.pk not in versions:
+                continue
+            version, flushed = versions[session.pk]
+            state_key = STATE_KEY.format(session_id=session.pk)
+            user_key = USER_KEY.format(user_id=session.user_id)
+            if version == flushed and not evict:
+                # Idle; the row already holds this state
+                keepalive.expire(state_key, STATE_TTL)
+                keepalive.expire(user_key, STATE_TTL)
+                continue
+
+            items_key = ITEMS_KEY.format(session_id=session.pk)
+            item_ids = [int(item_id) for item_id in self.client.smembers(items_key)]
+            collected.extend(
+                DungeonSession.items_collected.through(dungeonsession_id=session.pk, item_id=item_id)
+                for item_id in item_ids
+            )
+            session.next_due_at = session.compute_next_due_at() if evict else None
+            DungeonSession.objects.filter(pk=session.pk).update(
+                next_due_at=session.next_due_at, **{field: getattr(session, field) for field in HOT_FIELDS}
+            )
+            written.add(session.pk)
+            cleanup.append((session.pk, state_key, user_key, items_key, item_ids, version))
+        DungeonSession.items_collected.through.objects.bulk_create(collected, ignore_conflicts=True)
+        keepalive.execute()
+
+        def forget_flushed():
+            pipe = self.client.pipeline(transaction=True)
+            for session_id, state_key, user_key, items_key, item_ids, version in cleanup:
+                # Only what was written; anything added since stays for the next flush
+                if item_ids:
+                    pipe.srem(items_key, *item_ids)
+                if evict:
+                    pipe.delete(state_key, items_key, user_key)
+                    pipe.srem(HOT_SESSIONS_KEY, session_id)
+                else:
+                    pipe.hset(state_key, 'flushed', version)
+                    pipe.expire(state_key, STATE_TTL)
+                    pipe.expire(user_key, STATE_TTL)
+            pipe.execute()
+
+        if cleanup:
+            transaction.on_commit(forget_flushed)
+        return written
+
+    def forget(self, session_ids):
+        """Drops index entries whose state has expired; returns those ids."""
+        session_ids = list(session_ids)
+        pipe = self.client.pipeline(transaction=False)
+        for session_id in session_ids:
+            pipe.exists(STATE_KEY.format(session_id=session_id))
+        gone = [session_id for session_id, exists in zip(session_ids, pipe.execute()) if not exists]
+        if gone:
+            self.client.srem(HOT_SESSIONS_KEY, *gone)
+        return gone
+
+
+def get_dungeon_state_store(client=None):
+    """The hot-state store, or None when DUNGEON_HOT_STATE is off and runs live in Postgres only."""
+    if not getattr(settings, 'DUNGEON_HOT_STATE', False):
+        return None
+    return DungeonStateStore(client)
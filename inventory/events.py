@@ -0,0 +1,53 @@
+# events.py
+"""
+Dungeon progress pushed to the player's open sockets.
+
+`process_dungeon_sessions` publishes one event per thing that happens in a run
+(item collected, escapade, NPC encounter, death) to the channel-layer group
+`dungeon_<user_id>`, which `InventoryConsumer` joins on connect and forwards as
+`dungeon_event` messages. Clients apply them incrementally instead of polling
+`fetch_dungeon_data` / `check_dungeon_status`.
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.utils.timezone import now
+
+ITEM_COLLECTED = "item_collected"
+ESCAPADE = "escapade"
+NPC_ENCOUNTER = "npc_encounter"
+DEATH = "death"
+
+
+def dungeon_group_name(user_id):
+    return f"dungeon_{user_id}"
+
+
+def publish_dungeon_event(session, event, **data):
+    """
+    Sends `event` for the session's owner once the current transaction commits,
+    so clients never hear about progress that was rolled back.
+    """
+    message = {
+        "type": "dungeon_event",
+        "data": {
+            "event": event,
+            "session_id": session.id,
+            "user_health": session.user_health,
+            "timestamp": now().isoformat(),
+            **data,
+        },
+    }
+    group = dungeon_group_name(session.user_id)
+    transaction.on_commit(lambda: _group_send(group, message))
+
+
+def _group_send(group, message):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(group, message)
+    except Exception as e:
+        # A channel layer outage must not fail the dungeon tick; clients can still poll
+        print(f"Failed to publish dungeon event to {group}: {e}")
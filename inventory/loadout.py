@@ -0,0 +1,55 @@
+# loadout.py
+"""
+Resolves a user's inventory together with everything equipped in it.
+
+The inventory row, its EquippedItem and the six slot items come back in one
+joined query, and the owned items in one more when asked for, so callers never
+reach the slot foreign keys lazily.
+"""
+from .models import EquippedItem, Inventory
+
+EQUIPMENT_SLOTS = ["legs", "headpiece", "arm", "melee", "armour", "wings"]
+
+
+class Loadout:
+    """An inventory with its equipped slots resolved; `equipped` maps every slot to an Item or None."""
+
+    def __init__(self, inventory, equipped_items, items=None):
+        self.inventory = inventory
+        self.equipped_items = equipped_items
+        self.equipped = {
+            slot: getattr(equipped_items, slot) if equipped_items else None
+            for slot in EQUIPMENT_SLOTS
+        }
+        self.equipped_ids = {item.id for item in self.equipped.values() if item}
+        self.items = items
+
+    def is_equipped(self, item):
+        return item.id in self.equipped_ids
+
+    def equipped_file_names(self):
+        """Slot -> file name (None when empty); an empty dict if nothing was ever equipped."""
+        if self.equipped_items is None:
+            return {}
+        return {slot: item.file_name if item else None for slot, item in self.equipped.items()}
+
+
+def resolve_loadout(user_id, with_items=False):
+    """
+    Returns the user's Loadout, or None if they have no inventory.
+    Costs one query, plus one for the owned items when `with_items` is set.
+    """
+    queryset = Inventory.objects.select_related(
+        *(f'equipped_items__{slot}' for slot in EQUIPMENT_SLOTS)
+    )
+    if with_items:
+        queryset = queryset.prefetch_related('items')
+    inventory = queryset.filter(user_id=user_id).first()
+    if inventory is None:
+        return None
+
+    try:
+        equipped_items = inventory.equipped_items
+    except EquippedItem.DoesNotExist:
+        equipped_items = None
+    return Loadout(inventory, equipped_items, list(inventory.items.all()) if with_items else None)
@@ -0,0 +1,157 @@
+# loot.py
+"""
+In-memory loot tables for dungeon rewards, chests and NPC encounters.
+
+Random picks used to be `order_by('?')` queries, which make the database sort
+the whole Item or NPC table for every reward. Instead each worker loads the
+candidates once into a `LootTable` and draws from it in O(1) with Vose's alias
+method, weighting items by rarity (RARITY_DROP_WEIGHTS, overridable with the
+LOOT_RARITY_WEIGHTS setting).
+
+Tables are cached per process and tagged with a version token kept in the
+shared Django cache. The signals in `inventory.signals` replace the token
+whenever an item, chest pool or NPC changes; every worker notices within
+VERSION_CHECK_INTERVAL seconds and rebuilds on its next draw.
+"""
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+LOOT_VERSION_KEY = "inventory:loot:version"
+VERSION_CHECK_INTERVAL = 5  # Seconds a worker trusts its tables before re-reading the version
+
+# Relative chance of dropping one item of each rarity
+RARITY_DROP_WEIGHTS = {'common': 100, 'rare': 30, 'epic': 8, 'legendary': 2}
+
+_tables = {}
+_version = None
+_checked_at = 0.0
+
+
+class LootTable:
+    """Entries with relative weights, sampled in O(1) after an O(n) build."""
+
+    def __init__(self, entries, weights=None):
+        self.entries = list(entries)
+        n = len(self.entries)
+        weights = [1] * n if weights is None else list(weights)
+        total = sum(weights)
+        self._prob = [0.0] * n
+        self._alias = [0] * n
+        if not n or total <= 0:
+            self.entries = []
+            return
+
+        # Vose's alias method: split the weights into n columns of height 1,
+        # each holding at most two entries
+        scaled = [weight * n / total for weight in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self._prob[less] = scaled[less]
+            self._alias[less] = more
+            scaled[more] -= 1 - scaled[less]
+            (small if scaled[more] < 1 else large).append(more)
+        for i in small + large:  # Leftovers are 1 up to rounding
+            self._prob[i] = 1.0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __bool__(self):
+        return bool(self.entries)
+
+    def sample(self, rng=random):
+        """One weighted draw, or None if the table is empty."""
+        if not self.entries:
+            return None
+        column = rng.randrange(len(self.entries))
+        return self.entries[column] if rng.random() < self._prob[column] else self.entries[self._alias[column]]
+
+    def sample_distinct(self, count, rng=random):
+        """Up to `count` different entries, drawn by weight."""
+        if count >= len(self.entries):
+            picked = list(self.entries)
+            rng.shuffle(picked)
+            return picked
+        picked = {}
+        # Redraw duplicates, giving up after a bounded number of tries on very skewed tables
+        for _ in range(count * 10):
+            entry = self.sample(rng)
+            picked.setdefault(id(entry), entry)
+            if len(picked) == count:
+                break
+        return list(picked.values())
+
+
+def _rarity_weights():
+    return getattr(settings, 'LOOT_RARITY_WEIGHTS', RARITY_DROP_WEIGHTS)
+
+
+def _build_item_table(chest_id):
+    from .models import Chest, Item
+
+    items = Chest.objects.get(pk=chest_id).item_pool.all() if chest_id is not None else Item.objects.all()
+    items = list(items.exclude(category='coins').order_by('id'))
+    weights = _rarity_weights()
+    return LootTable(items, [weights.get(item.rarity, 1) for item in items])
+
+
+def _build_npc_table():
+    from .models import NPC
+
+    return LootTable(NPC.objects.order_by('id'))
+
+
+def _cached(key, build):
+    global _version, _checked_at
+    if time.monotonic() - _checked_at >= VERSION_CHECK_INTERVAL:
+        version = cache.get(LOOT_VERSION_KEY)
+        if version is None:
+            cache.add(LOOT_VERSION_KEY, uuid.uuid4().hex, None)
+            version = cache.get(LOOT_VERSION_KEY)
+        if version != _version:
+            _tables.clear()
+            _version = version
+        _checked_at = time.monotonic()
+
+    table = _tables.get(key)
+    if table is None:
+        table = _tables[key] = build()
+    return table
+
+
+def get_loot_table(chest_id=None):
+    """
+    The non-coin items that can drop, weighted by rarity: every item, or only
+    the pool of chest `chest_id` (Chest.DoesNotExist if there is no such chest).
+    """
+    return _cached(('items', chest_id), lambda: _build_item_table(chest_id))
+
+
+def get_npc_table():
+    """Every NPC, equally likely."""
+    return _cached(('npcs',), _build_npc_table)
+
+
+def invalidate_loot_tables():
+    """
+    Drops this worker's tables and, once the current transaction commits,
+    replaces the shared version so the other workers drop theirs too.
+    """
+    global _checked_at
+    _tables.clear()
+    _checked_at = 0.0
+
+    def bump():
+        global _checked_at
+        cache.set(LOOT_VERSION_KEY, uuid.uuid4().hex, None)
+        _tables.clear()
+        _checked_at = 0.0
+
+    transaction.on_commit(bump)
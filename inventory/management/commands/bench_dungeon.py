@@ -0,0 +1,232 @@
+import json
+import os
+import random
+import subprocess
+import time
+import tracemalloc
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+from django.db.models.functions import Mod
+from django.utils import timezone
+
+from inventory.consumers import InventoryConsumer
+from inventory.loot import invalidate_loot_tables
+from inventory.models import DungeonSession
+from inventory.npc_events import example_event
+from inventory.seeding import ensure_seed_items, ensure_seed_npcs, seed_dungeon_sessions
+from inventory.tasks import process_dungeon_sessions
+from logger.seeding import create_seed_users
+
+# Metrics compared by --compare, per section of a result
+COMPARED_METRICS = {
+    "tick": ["seconds", "queries_per_session", "rows_written_per_session", "peak_memory_mb"],
+    "consumer": ["catch_up_dungeon_ms", "fetch_dungeon_data_ms", "fetch_dungeon_data_since_ms"],
+}
+
+
+class _Rollback(Exception):
+    pass
+
+
+class _StatementCounter:
+    """An execute_wrapper counting statements and the rows they inserted, updated or deleted."""
+
+    def __init__(self):
+        self.queries = 0
+        self.rows_written = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        self.queries += 1
+        if sql.lstrip()[:6].upper() in ('INSERT', 'UPDATE', 'DELETE'):
+            self.rows_written += max(context['cursor'].rowcount, 0)
+        return result
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the dungeon simulation at several scales: seed N due runs with items and NPCs, run '
+        'process_dungeon_sessions and the consumer-side dungeon reads, and record wall time, queries and rows '
+        'written per session and peak memory. Results go to a JSON file to compare between commits'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='1000,10000,100000', help='Comma-separated numbers of runs')
+        parser.add_argument('--backlog-minutes', type=int, default=30,
+                            help='How long ago every run was last evaluated')
+        parser.add_argument('--npc-fraction', type=float, default=0.1,
+                            help='Share of runs still due to meet their NPC')
+        parser.add_argument('--consumer-sample', type=int, default=200,
+                            help='Runs whose owner goes through the consumer-side calls')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default='loadtest/results/bench_dungeon.json')
+        parser.add_argument('--compare', help='JSON written by an earlier run to compare against')
+
+    def handle(self, *args, **options):
+        report = {
+            "commit": self.git_commit(),
+            "database": connection.vendor,
+            "created_at": timezone.now().isoformat(),
+            "options": {
+                key: options[key] for key in ('backlog_minutes', 'npc_fraction', 'consumer_sample', 'seed')
+            },
+            "results": [],
+        }
+        # NPC dialogue comes from the Bedrock-backed pools; the static example event stands in for both paths
+        with mock.patch('inventory.tasks.pop_npc_event', example_event), \
+                mock.patch.object(InventoryConsumer, 'generate_dynamic_event', staticmethod(example_event)):
+            for scale in (int(scale) for scale in options['scales'].split(',')):
+                result = self.run_scale(random.Random(options['seed']), scale, options)
+                report["results"].append(result)
+                self.write_result(result)
+
+        os.makedirs(os.path.dirname(options['output']) or '.', exist_ok=True)
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(f"Results written to {options['output']}")
+        if options['compare']:
+            self.compare(options['compare'], report)
+
+    def run_scale(self, rng, scale, options):
+        result = {"sessions": scale}
+        # Everything runs inside a transaction that is rolled back, so the database is left untouched
+        try:
+            with transaction.atomic():
+                sessions = self.seed(rng, scale, options)
+                # Drop the tables this process cached before the seed items existed
+                invalidate_loot_tables()
+                seeded = transaction.savepoint()
+
+                result["tick"] = self.run_tick()
+                # tracemalloc slows the tick down, so memory is measured on a second pass over the same runs
+                transaction.savepoint_rollback(seeded)
+                result["tick"]["peak_memory_mb"] = self.measure_tick_memory()
+
+                transaction.savepoint_rollback(seeded)
+                result["consumer"] = self.run_consumer(sessions[:options['consumer_sample']])
+                raise _Rollback
+        except _Rollback:
+            pass
+        return result
+
+    def seed(self, rng, count, options):
+        ensure_seed_items(rng)
+        ensure_seed_npcs(rng)
+        last_id = DungeonSession.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        users = create_seed_users(count, rng, prefix="bench_dungeon")
+        seed_dungeon_sessions(users, rng, active_fraction=1.0)
+        seeded = DungeonSession.objects.filter(pk__gt=last_id)
+        due = timezone.now() - timedelta(minutes=options['backlog_minutes'])
+        seeded.update(
+            paused=False, npc_event_triggered=True, npc_event_data=None, last_evaluated_at=None,
+            next_item_time=due, next_escapade_time=due, next_due_at=due,
+        )
+        # Meeting the NPC pauses a run after one step, so only some runs are left to meet theirs
+        seeded.annotate(bucket=Mod('id', 100)).filter(bucket__lt=round(options['npc_fraction'] * 100)).update(
+            npc_event_triggered=False
+        )
+        return list(seeded.select_related('user').order_by('id'))
+
+    def run_tick(self):
+        counter = _StatementCounter()
+        with connection.execute_wrapper(counter):
+            started = time.perf_counter()
+            processed = process_dungeon_sessions()
+            elapsed = time.perf_counter() - started
+        return {
+            "processed": processed,
+            "seconds": round(elapsed, 3),
+            "sessions_per_second": round(processed / max(elapsed, 1e-9)),
+            "queries": counter.queries,
+            "queries_per_session": round(counter.queries / max(processed, 1), 3),
+            "rows_written": counter.rows_written,
+            "rows_written_per_session": round(counter.rows_written / max(processed, 1), 3),
+        }
+
+    def measure_tick_memory(self):
+        tracemalloc.start()
+        try:
+            process_dungeon_sessions()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return round(peak / 2 ** 20, 2)
+
+    def run_consumer(self, sessions):
+        """
+        Times the dungeon reads a connected player makes. async_to_sync runs the
+        consumer's sync_to_async bodies on this thread, so they share its
+        connection and see the seeded runs.
+        """
+        calls = {
+            "catch_up_dungeon": ('catch_up_dungeon', lambda session: ()),
+            "fetch_dungeon_data": ('get_dungeon_data', lambda session: ()),
+            "fetch_dungeon_data_since": ('get_dungeon_data', lambda session: (session.log_seq,)),
+            "check_dungeon_status": ('is_player_in_dungeon', lambda session: ()),
+        }
+        timings = {name: [] for name in calls}
+        queries = {name: 0 for name in calls}
+        for session in sessions:
+            consumer = InventoryConsumer()
+            consumer.user = session.user
+            consumer.send = lambda *args, **kwargs: None
+            for name, (method, call_args) in calls.items():
+                call = async_to_sync(getattr(consumer, method))
+                counter = _StatementCounter()
+                with connection.execute_wrapper(counter):
+                    started = time.perf_counter()
+                    call(*call_args(session))
+                    timings[name].append(time.perf_counter() - started)
+                queries[name] += counter.queries
+
+        result = {"calls": len(sessions)}
+        for name, samples in timings.items():
+            samples.sort()
+            result[f"{name}_ms"] = round(sum(samples) / max(len(samples), 1) * 1000, 3)
+            result[f"{name}_p95_ms"] = round(samples[int(len(samples) * 0.95)] * 1000, 3) if samples else 0
+            result[f"{name}_queries"] = round(queries[name] / max(len(samples), 1), 2)
+        return result
+
+    def write_result(self, result):
+        tick = result["tick"]
+        consumer = result["consumer"]
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['sessions']} runs: tick processed {tick['processed']} in {tick['seconds']:.2f}s "
+            f"({tick['sessions_per_second']}/s), {tick['queries_per_session']} queries and "
+            f"{tick['rows_written_per_session']} rows written per session, peak {tick['peak_memory_mb']} MB; "
+            f"catch_up_dungeon {consumer['catch_up_dungeon_ms']} ms, "
+            f"fetch_dungeon_data {consumer['fetch_dungeon_data_ms']} ms "
+            f"({consumer['fetch_dungeon_data_since_ms']} ms since log_seq)"
+        ))
+
+    def compare(self, path, report):
+        with open(path) as f:
+            previous = json.load(f)
+        earlier = {result["sessions"]: result for result in previous["results"]}
+        self.stdout.write(f"Compared with {previous.get('commit') or path}:")
+        for result in report["results"]:
+            old = earlier.get(result["sessions"])
+            if old is None:
+                continue
+            for section, metrics in COMPARED_METRICS.items():
+                for metric in metrics:
+                    before, after = old.get(section, {}).get(metric), result[section][metric]
+                    if not before:
+                        continue
+                    change = (after - before) / before
+                    line = f"  {result['sessions']} runs {section}.{metric}: {before} -> {after} ({change:+.0%})"
+                    self.stdout.write(self.style.WARNING(line) if change > 0.1 else line)
+
+    @staticmethod
+    def git_commit():
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,87 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from inventory.dungeon import tick_session
+from inventory.loot import LootTable, get_loot_table
+from inventory.models import DungeonSession
+from inventory.seeding import ensure_seed_items, seed_dungeon_sessions
+from inventory.tasks import DUNGEON_TICK_BATCH_SIZE, advance_dungeon_sessions
+from logger.seeding import create_seed_users
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the dungeon tick: seed N due sessions, time the pure tick alone and '
+        'the full tick including its writes, and report the queries used'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=10000)
+        parser.add_argument('--batch-size', type=int, default=DUNGEON_TICK_BATCH_SIZE)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        # Everything runs inside a transaction that is rolled back, so the database is left untouched
+        try:
+            with transaction.atomic():
+                sessions = self.seed(rng, options['sessions'])
+                loot_table = get_loot_table()
+                self.stdout.write(f"Seeded {len(sessions)} due sessions, {len(loot_table)} items in the loot table")
+                # NPC encounters are left out: their dialogue comes from Bedrock, not from the tick
+                self.run_pure(sessions, rng, loot_table)
+                self.run_full(sessions, loot_table, options['batch_size'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def seed(self, rng, count):
+        ensure_seed_items(rng)
+        last_id = DungeonSession.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        users = create_seed_users(count, rng, prefix="bench_tick")
+        seed_dungeon_sessions(users, rng, active_fraction=1.0)
+        seeded = DungeonSession.objects.filter(pk__gt=last_id)
+        due = timezone.now() - timedelta(seconds=1)
+        seeded.update(paused=False, next_item_time=due, next_escapade_time=due, next_due_at=due)
+        return list(seeded.order_by('id'))
+
+    def run_pure(self, sessions, rng, loot_table):
+        tick_time = timezone.now()
+        started = time.perf_counter()
+        changed = sum(1 for session in sessions if tick_session(session, tick_time, rng, loot_table, LootTable([])))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"pure tick: {changed} of {len(sessions)} sessions changed in {elapsed * 1000:.1f} ms "
+            f"({elapsed / max(len(sessions), 1) * 1e6:.1f} us/session)"
+        ))
+
+    def run_full(self, sessions, loot_table, batch_size):
+        tick_time = timezone.now()
+        failed = set()
+        queries = []
+
+        # CaptureQueriesContext keeps at most 9000 queries; only a count is needed here
+        def count_query(execute, sql, params, many, context):
+            queries.append(None)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_query):
+            started = time.perf_counter()
+            for start in range(0, len(sessions), batch_size):
+                failed |= advance_dungeon_sessions(sessions[start:start + batch_size], tick_time, loot_table, LootTable([]))
+            elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"full tick: {len(sessions)} sessions in {elapsed * 1000:.1f} ms using {len(queries)} queries "
+            f"({len(sessions) / max(elapsed, 1e-9):.0f} sessions/s, {len(failed)} failed)"
+        ))
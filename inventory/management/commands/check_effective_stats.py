@@ -0,0 +1,36 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.stats import find_stat_drift, refresh_effective_stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare stored effective stats (PlayerStats) against base stats plus equipped gear '
+        'and report every user that drifted; --repair rewrites them'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help='Recompute and store the stats of drifted users')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help='Only check these user ids')
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids'] or get_user_model().objects.order_by('pk').values_list('pk', flat=True)
+        user_ids = list(user_ids)
+        batch_size = options['batch_size']
+
+        drifted = 0
+        repaired = 0
+        for start in range(0, len(user_ids), batch_size):
+            drift = find_stat_drift(user_ids[start:start + batch_size])
+            for user_id, (stored, expected) in drift.items():
+                self.stdout.write(f"User {user_id}: stored {stored}, expected {expected}")
+            drifted += len(drift)
+            if options['repair'] and drift:
+                refresh_effective_stats(drift)
+                repaired += len(drift)
+
+        self.stdout.write(f"Checked {len(user_ids)} users, {drifted} drifted, {repaired} repaired.")
+        if drifted and not options['repair']:
+            raise CommandError(f"{drifted} users have drifted effective stats; run with --repair to fix them.")
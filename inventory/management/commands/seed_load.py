@@ -0,0 +1,72 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+from exercises.models import Exercise, MuscleGroup
+from inventory.models import Inventory
+from inventory.stats import refresh_effective_stats
+from inventory.seeding import ensure_seed_items, seed_dungeon_sessions, seed_inventories, seed_market_listings
+from logger.seeding import create_seed_users, seed_workouts
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a load-test dataset: users with auth tokens, workout histories, inventories, '
+        'market listings and dungeon sessions. The tokens and ids the load harness needs are written to a JSON file.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--workouts-per-user', type=int, default=100)
+        parser.add_argument('--items-per-user', type=int, default=15)
+        parser.add_argument('--listings-per-user', type=int, default=2)
+        parser.add_argument('--dungeon-fraction', type=float, default=0.3,
+                            help='Share of users left with an active dungeon session')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default='loadtest/seed.json', help='Where to write tokens and ids for the load harness')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            item_ids, chest = ensure_seed_items(rng)
+            users = create_seed_users(options['users'], rng, prefix="load")
+            tokens = [Token(key=Token.generate_key(), user=user) for user in users]
+            Token.objects.bulk_create(tokens, batch_size=1000)
+
+            workouts = seed_workouts(
+                users,
+                options['workouts_per_user'],
+                rng,
+                exercise_ids=list(Exercise.objects.values_list('id', flat=True)[:200]),
+                muscle_group_ids=list(MuscleGroup.objects.values_list('id', flat=True)),
+            )
+            seed_inventories(users, rng, item_ids, items_per_user=options['items_per_user'])
+            refresh_effective_stats(user.pk for user in users)
+            listings = seed_market_listings(users, rng, listings_per_user=options['listings_per_user'])
+            sessions = seed_dungeon_sessions(users, rng, active_fraction=options['dungeon_fraction'])
+
+        owned = {}
+        for user_id, name in Inventory.items.through.objects.filter(inventory__user__in=users).values_list(
+            'inventory__user_id', 'item__name'
+        ):
+            owned.setdefault(user_id, []).append(name)
+        seed = {
+            "chest_id": chest.id,
+            "users": [
+                {"token": token.key, "username": token.user.username, "items": owned.get(token.user.pk, [])}
+                for token in tokens
+            ],
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(seed, f)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(users)} users, {workouts} workouts, {listings} listings and {sessions} dungeon "
+            f"sessions in {time.perf_counter() - started:.1f}s; harness data written to {options['output']}"
+        ))
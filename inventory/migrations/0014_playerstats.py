@@ -0,0 +1,66 @@
+# Generated by Django 4.2.13 on 2026-10-18 00:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+STAT_FIELDS = ['strength', 'agility', 'intelligence', 'stealth', 'speed', 'defence']
+EQUIPMENT_SLOTS = ['legs', 'headpiece', 'arm', 'melee', 'armour', 'wings']
+
+
+def backfill_player_stats(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Inventory = apps.get_model('inventory', 'Inventory')
+    EquippedItem = apps.get_model('inventory', 'EquippedItem')
+    PlayerStats = apps.get_model('inventory', 'PlayerStats')
+
+    stats = {row.pop('id'): row for row in User.objects.values('id', *STAT_FIELDS).iterator()}
+
+    # A user's first inventory is the one that counts
+    first_inventory = {}
+    for inventory_id, user_id in Inventory.objects.order_by('id').values_list('id', 'user_id').iterator():
+        first_inventory.setdefault(user_id, inventory_id)
+    counted = set(first_inventory.values())
+
+    for equipped_items in EquippedItem.objects.select_related('inventory', *EQUIPMENT_SLOTS).iterator():
+        if equipped_items.inventory_id not in counted:
+            continue
+        totals = stats[equipped_items.inventory.user_id]
+        for slot in EQUIPMENT_SLOTS:
+            item = getattr(equipped_items, slot)
+            if item:
+                for field in STAT_FIELDS:
+                    totals[field] += getattr(item, field)
+
+    PlayerStats.objects.bulk_create(
+        [PlayerStats(user_id=user_id, **values) for user_id, values in stats.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('inventory', '0013_remove_equippeditem_shield_equippeditem_arm_and_more'),
+        # The backfill reads the base stats
+        ('users', '0004_customuser_agility_customuser_defence_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('strength', models.PositiveIntegerField(default=0)),
+                ('agility', models.PositiveIntegerField(default=0)),
+                ('intelligence', models.PositiveIntegerField(default=0)),
+                ('stealth', models.PositiveIntegerField(default=0)),
+                ('speed', models.PositiveIntegerField(default=0)),
+                ('defence', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='effective_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(backfill_player_stats, migrations.RunPython.noop),
+    ]
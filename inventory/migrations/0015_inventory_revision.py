@@ -0,0 +1,18 @@
+# Generated by Django 4.2.13 on 2026-10-18 00:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0014_playerstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventory',
+            name='revision',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
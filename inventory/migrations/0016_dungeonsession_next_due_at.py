@@ -0,0 +1,42 @@
+# Generated by Django 4.2.13 on 2026-10-18 00:39
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+NPC_EVENT_DELAY = timedelta(seconds=360)
+
+
+def backfill_next_due_at(apps, schema_editor):
+    DungeonSession = apps.get_model('inventory', 'DungeonSession')
+    sessions = list(DungeonSession.objects.filter(end_time__isnull=True, paused=False))
+    for session in sessions:
+        if session.user_health <= 0:
+            session.next_due_at = timezone.now()
+            continue
+        due = [time for time in (session.next_item_time, session.next_escapade_time) if time is not None]
+        if not session.npc_event_triggered:
+            due.append(session.start_time + NPC_EVENT_DELAY)
+        session.next_due_at = min(due) if due else None
+    DungeonSession.objects.bulk_update(sessions, ['next_due_at'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0015_inventory_revision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dungeonsession',
+            name='next_due_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='dungeonsession',
+            index=models.Index(condition=models.Q(('next_due_at__isnull', False)), fields=['next_due_at'], name='dungeon_next_due_idx'),
+        ),
+        migrations.RunPython(backfill_next_due_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 4.2.13 on 2026-10-18 00:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+def copy_logs_to_entries(apps, schema_editor):
+    DungeonSession = apps.get_model('inventory', 'DungeonSession')
+    DungeonLogEntry = apps.get_model('inventory', 'DungeonLogEntry')
+    entries = []
+    sessions = []
+    for session in DungeonSession.objects.exclude(logs__isnull=True).only('id', 'logs').iterator():
+        for seq, log in enumerate(session.logs or [], start=1):
+            entries.append(DungeonLogEntry(
+                session_id=session.id,
+                seq=seq,
+                timestamp=parse_datetime(log.get("timestamp") or "") or timezone.now(),
+                message=log.get("message", ""),
+            ))
+        session.log_seq = len(session.logs or [])
+        sessions.append(session)
+    DungeonLogEntry.objects.bulk_create(entries, batch_size=5000)
+    DungeonSession.objects.bulk_update(sessions, ['log_seq'], batch_size=1000)
+
+
+def copy_entries_to_logs(apps, schema_editor):
+    DungeonSession = apps.get_model('inventory', 'DungeonSession')
+    DungeonLogEntry = apps.get_model('inventory', 'DungeonLogEntry')
+    logs = {}
+    for entry in DungeonLogEntry.objects.order_by('session_id', 'seq').iterator():
+        logs.setdefault(entry.session_id, []).append({
+            "timestamp": entry.timestamp.isoformat(),
+            "message": entry.message,
+        })
+    sessions = list(DungeonSession.objects.filter(pk__in=logs))
+    for session in sessions:
+        session.logs = logs[session.pk]
+    DungeonSession.objects.bulk_update(sessions, ['logs'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0016_dungeonsession_next_due_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dungeonsession',
+            name='log_seq',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='DungeonLogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveIntegerField()),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('message', models.TextField()),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='log_entries', to='inventory.dungeonsession')),
+            ],
+            options={
+                'ordering': ['seq'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dungeonlogentry',
+            constraint=models.UniqueConstraint(fields=('session', 'seq'), name='dungeon_log_session_seq_uniq'),
+        ),
+        migrations.RunPython(copy_logs_to_entries, copy_entries_to_logs),
+        migrations.RemoveField(
+            model_name='dungeonsession',
+            name='logs',
+        ),
+    ]
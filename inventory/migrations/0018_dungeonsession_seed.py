@@ -0,0 +1,34 @@
+# Generated by Django 4.2.13 on 2026-10-18 00:52
+
+from django.db import migrations, models
+import inventory.dungeon
+
+
+def seed_sessions(apps, schema_editor):
+    # AddField evaluates the default once, so existing runs would all share a seed
+    DungeonSession = apps.get_model('inventory', 'DungeonSession')
+    sessions = list(DungeonSession.objects.only('id'))
+    for session in sessions:
+        session.seed = inventory.dungeon.new_seed()
+    DungeonSession.objects.bulk_update(sessions, ['seed'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0017_dungeonlogentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dungeonsession',
+            name='last_evaluated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='dungeonsession',
+            name='seed',
+            field=models.PositiveBigIntegerField(default=inventory.dungeon.new_seed),
+        ),
+        migrations.RunPython(seed_sessions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.13 on 2026-10-18 00:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0018_dungeonsession_seed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dungeonlogentry',
+            name='args',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='dungeonlogentry',
+            name='code',
+            field=models.CharField(blank=True, default='', max_length=8),
+        ),
+        migrations.AddField(
+            model_name='dungeonlogentry',
+            name='health',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='dungeonsession',
+            name='step',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='dungeonlogentry',
+            name='message',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
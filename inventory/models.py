@@ -5,6 +5,9 @@ from django.db import models
 from django.conf import settings
 from django.utils.timezone import now
 
+from .dungeon import LOG_ITEM, new_seed, next_step_at, render_log
+from .loot import get_npc_table
+
 User = get_user_model()
 
 
@@ -46,6 +49,8 @@ class Item(models.Model):
 class Inventory(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='inventory')
     items = models.ManyToManyField(Item, related_name='inventories')
+    # Bumped on every change to the items, equipped slots or effective stats; see inventory.snapshots
+    revision = models.PositiveBigIntegerField(default=0)
 
     def __str__(self):
         return f"Inventory of {self.user.username}"
@@ -78,6 +83,25 @@ class EquippedItem(models.Model):
         return f"Equipped items for {self.inventory.user.username}"
 
 
+class PlayerStats(models.Model):
+    """
+    Effective stats: the user's base stats plus everything they have equipped.
+    Maintained by `inventory.stats` whenever either side changes, so reads are
+    a single row lookup; `manage.py check_effective_stats` finds and repairs drift.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='effective_stats')
+    strength = models.PositiveIntegerField(default=0)
+    agility = models.PositiveIntegerField(default=0)
+    intelligence = models.PositiveIntegerField(default=0)
+    stealth = models.PositiveIntegerField(default=0)
+    speed = models.PositiveIntegerField(default=0)
+    defence = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Effective stats for {self.user.username}"
+
+
 class Chest(models.Model):
     name = models.CharField(max_length=100, unique=True)
     cost = models.PositiveIntegerField()
@@ -107,23 +131,92 @@ class DungeonSession(models.Model):
     npc_event_triggered = models.BooleanField(default=False)
     npc_event_data = models.JSONField(null=True, blank=True)  # Stores the paused NPC event data
     paused = models.BooleanField(default=False)  # Indicates if the session is waiting for user input
-    logs = models.JSONField(null=True, blank=True, default=list)  # Initialize as empty list
+    log_seq = models.PositiveIntegerField(default=0)  # Sequence number of the last DungeonLogEntry
     next_escapade_time = models.DateTimeField(default=now)  # Initialize to start_time by default
+    # Earliest moment the dungeon tick has work for this session; null once it is paused or over
+    next_due_at = models.DateTimeField(null=True, blank=True)
+    # Every roll of the run derives from the seed, so catching up on a read replays exactly what the sweep would have done
+    seed = models.PositiveBigIntegerField(default=new_seed)
+    step = models.PositiveIntegerField(default=0)  # Steps played so far; step N rolls with dungeon.step_rng(seed, N)
+    last_evaluated_at = models.DateTimeField(null=True, blank=True)  # When inventory.dungeon.catch_up last advanced the run
+
+    class Meta:
+        indexes = [
+            # The tick only ever asks for due sessions, so idle and finished ones stay out of the index
+            models.Index(fields=['next_due_at'], condition=models.Q(next_due_at__isnull=False), name='dungeon_next_due_idx'),
+        ]
+
+    def compute_next_due_at(self):
+        """
+        The earliest of the item, NPC and escapade timers (or now, if the player
+        is dead). Like `catch_up`, the NPC timer only counts while there are
+        NPCs to meet; otherwise the run would stay due without ever moving on.
+        """
+        return next_step_at(self, include_npc=bool(get_npc_table()))
 
     def save(self, *args, **kwargs):
         if not self.pk and not self.next_escapade_time:
             self.next_escapade_time = self.start_time + timedelta(minutes=10)
+        # Every save can move a timer, end or pause the run; keep the schedule in step
+        self.next_due_at = self.compute_next_due_at()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'next_due_at' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'next_due_at']
         super().save(*args, **kwargs)
 
     def add_log(self, message):
-        """Append a new log entry to the logs field."""
-        if self.logs is None:
-            self.logs = []
-        self.logs.append({
-            "timestamp": now().isoformat(),
-            "message": message
-        })
-        self.save(update_fields=['logs'])
+        """
+        Appends a DungeonLogEntry and returns it as a dict. Costs one small
+        INSERT and one UPDATE of `log_seq`, however long the run gets.
+        """
+        self.log_seq += 1
+        entry = DungeonLogEntry.objects.create(session=self, seq=self.log_seq, message=message)
+        DungeonSession.objects.filter(pk=self.pk).update(log_seq=self.log_seq)
+        return entry.as_dict()
+
+    def logs_since(self, seq=0):
+        """The session's log entries after sequence number `seq`, oldest first, rendered to text."""
+        entries = list(self.log_entries.filter(seq__gt=seq))
+        item_ids = {entry.args[0] for entry in entries if entry.code == LOG_ITEM}
+        items = {
+            item['id']: item
+            for item in Item.objects.filter(pk__in=item_ids).values('id', 'name', 'category', 'rarity')
+        } if item_ids else {}
+        return [entry.as_dict(items) for entry in entries]
+
+
+class DungeonLogEntry(models.Model):
+    """
+    One line of a dungeon run's log; rows are only ever appended. Lines the
+    tick writes are stored as a code and the values rolled (see
+    `inventory.dungeon`) and rendered on read; free text goes in `message`.
+    """
+    session = models.ForeignKey(DungeonSession, on_delete=models.CASCADE, related_name='log_entries')
+    seq = models.PositiveIntegerField()  # 1, 2, 3... within the session
+    timestamp = models.DateTimeField(default=now)
+    code = models.CharField(max_length=8, blank=True, default='')
+    args = models.JSONField(default=list, blank=True)
+    health = models.PositiveSmallIntegerField(null=True, blank=True)  # The player's health after this line
+    message = models.TextField(blank=True, default='')
+
+    class Meta:
+        ordering = ['seq']
+        constraints = [
+            # Also serves the "since sequence N" reads
+            models.UniqueConstraint(fields=['session', 'seq'], name='dungeon_log_session_seq_uniq'),
+        ]
+
+    def as_dict(self, items=None):
+        """`items` maps item ids to their name, category and rarity, for collected-item lines."""
+        return {
+            "seq": self.seq,
+            "timestamp": self.timestamp.isoformat(),
+            "message": self.message or render_log(self.code, self.args, items),
+            "health": self.health,
+        }
+
+    def __str__(self):
+        return f"#{self.seq} of session {self.session_id}: {self.message or self.code}"
 
 class NPC(models.Model):
     """
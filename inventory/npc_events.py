@@ -0,0 +1,251 @@
+# npc_events.py
+"""
+NPC encounter events: generating them with Bedrock, and a pre-generated pool per NPC.
+
+A model call takes seconds, far too long for the dungeon tick, where one slow
+reply used to hold up every other player in the sweep. Instead the
+`refill_npc_event_pools` task keeps up to NPC_EVENT_POOL_DEPTH validated events
+per NPC in a Redis list, and the tick takes one with `pop_npc_event`, a single
+LPOP. When a pool is empty (or Redis is unreachable) the tick uses the static
+`example_event` and a refill is queued.
+
+The model and the Redis client are parameters, so the generator runs just as
+well against a local stub (anything with `complete(prompt) -> str`) and a
+fakeredis client.
+"""
+import json
+
+import boto3
+from django.conf import settings
+from django.core.cache import cache
+
+NPC_EVENT_POOL_KEY = "inventory:npc_events:{npc_id}"
+NPC_EVENT_POOL_TTL = 60 * 60 * 24 * 7  # Pools of deleted NPCs expire on their own
+NPC_EVENT_REFILL_QUEUED_KEY = "inventory:npc_events:refill_queued"
+NPC_EVENT_REFILL_QUEUED_TTL = 60 * 10
+BEDROCK_MODEL_ID = "us.anthropic.claude-3-5-haiku-20241022-v1:0"
+
+
+def pool_depth():
+    """How many events each NPC's pool is topped up to."""
+    return getattr(settings, 'NPC_EVENT_POOL_DEPTH', 20)
+
+
+def _key(npc_id):
+    return NPC_EVENT_POOL_KEY.format(npc_id=npc_id)
+
+
+def _redis(client):
+    if client is None:
+        from django_redis import get_redis_connection
+        client = get_redis_connection("default")
+    return client
+
+
+def example_event(npc):
+    """The static event used whenever no generated one is available."""
+    return {
+        "dialogue": f"{npc.name} glances at you warily. '{npc.short_description}'",
+        "choices": [
+            {
+                "choice_text": "Ask for directions.",
+                "consequences": {
+                    "health_change": 0,
+                    "currency_change": 0,
+                    "consequence_text": "The NPC gives you directions, though they seem unsure."
+                }
+            },
+            {
+                "choice_text": "Attack immediately.",
+                "consequences": {
+                    "health_change": -10,
+                    "currency_change": 0,
+                    "consequence_text": "You strike first, dealing 10 damage—but the NPC quickly retaliates."
+                }
+            }
+        ]
+    }
+
+
+def event_prompt(npc):
+    return (
+        "Act as a creative game event generator. Given an NPC's details, create a dungeon event that includes "
+        "dialogue from the NPC and exactly two choices. Each choice must have a 'choice_text' and corresponding "
+        "'consequences' including 'health_change', 'currency_change', and 'consequence_text'.\n\n"
+        "Output only the JSON object without any additional text or formatting.\n"
+        "Example:\n"
+        "{\n"
+        '    "dialogue": "Sloan Rho leans against a cracked concrete wall, cleaning a sleek pistol with practiced movements. \'You\'re not from around here. What\'s your business in this sector?\' Their eyes scan you coldly, waiting for a response.",\n'
+        '    "choices": [\n'
+        '        {\n'
+        '            "choice_text": "Offer to help with a local problem.",\n'
+        '            "consequences": {\n'
+        '                "health_change": 0,\n'
+        '                "currency_change": 50,\n'
+        '                "consequence_text": "Sloan considers your offer, then nods. They share a quick job that pays well, appreciating your straightforward approach."\n'
+        '            }\n'
+        '        },\n'
+        '        {\n'
+        '            "choice_text": "Claim you\'re just passing through.",\n'
+        '            "consequences": {\n'
+        '                "health_change": -5,\n'
+        '                "currency_change": -20,\n'
+        '                "consequence_text": "Sloan doesn\'t believe your story. They rough you up a bit and search your pockets, taking some of your credits as \'insurance\'."\n'
+        '            }\n'
+        '        }\n'
+        '    ]\n'
+        "}\n"
+        "\n"
+        "Generate a dungeon event based on the following NPC details:\n"
+        f'"name": "{npc.name}",\n'
+        f'"description": "{npc.short_description}"\n'
+    )
+
+
+class BedrockEventModel:
+    """Streams a completion from the event model on Amazon Bedrock."""
+
+    def __init__(self, model_id=BEDROCK_MODEL_ID, region_name="us-east-2"):
+        self.model_id = model_id
+        self.client = boto3.client("bedrock-runtime", region_name=region_name)
+
+    def complete(self, prompt):
+        native_request = {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": 512,
+            "temperature": 0.5,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [{"type": "text", "text": prompt}],
+                }
+            ],
+        }
+        streaming_response = self.client.invoke_model_with_response_stream(
+            modelId=self.model_id, body=json.dumps(native_request)
+        )
+
+        # Collect the response content from text_deltas
+        full_response = ""
+        for event in streaming_response.get("body", []):
+            chunk_str = event.get("chunk", {}).get("bytes", b"").decode('utf-8')
+            if not chunk_str:
+                continue  # Skip empty chunks
+            try:
+                chunk_json = json.loads(chunk_str)
+            except json.JSONDecodeError as e:
+                print(f"Error decoding chunk: {e}")
+                print(f"Chunk content: {chunk_str}")
+                continue  # Skip malformed chunks
+            if chunk_json.get("type") == "content_block_delta":
+                delta = chunk_json.get("delta", {})
+                if delta.get("type") == "text_delta":
+                    full_response += delta.get("text", "")
+        return full_response
+
+
+def parse_event(npc, text):
+    """Validates a model reply into an event with a dialogue and exactly two choices; None if unusable."""
+    if not text.strip():
+        print("Received empty response from the model.")
+        return None
+    try:
+        response_data = json.loads(text)
+    except json.JSONDecodeError as json_err:
+        print(f"JSON decoding error after accumulation: {json_err}")
+        print(f"Accumulated JSON string was: {text}")
+        return None
+
+    fallback = example_event(npc)
+    dialogue = response_data.get("dialogue", fallback["dialogue"])
+    choices = response_data.get("choices", fallback["choices"])
+
+    # Validate that choices contain required fields
+    validated_choices = []
+    for choice in choices:
+        consequences = choice.get("consequences", {})
+        validated_choices.append({
+            "choice_text": choice.get("choice_text", "Default choice"),
+            "consequences": {
+                "health_change": consequences.get("health_change", 0),
+                "currency_change": consequences.get("currency_change", 0),
+                "consequence_text": consequences.get("consequence_text", "")
+            }
+        })
+
+    if len(validated_choices) != 2:
+        print(f"Expected 2 choices, but got {len(validated_choices)}.")
+        return None
+    return {
+        "dialogue": dialogue.strip(),
+        "choices": validated_choices
+    }
+
+
+def generate_npc_event(npc, model=None):
+    """Asks the model for a new event for `npc`; returns None if the call or its reply fails."""
+    try:
+        model = model or BedrockEventModel()
+        return parse_event(npc, model.complete(event_prompt(npc)))
+    except Exception as e:
+        print(f"Error generating dynamic event: {e}")
+        return None
+
+
+def pop_npc_event(npc, client=None):
+    """
+    Takes the next pre-generated event for `npc`, or returns `example_event`
+    if its pool is empty. Queues a refill once the pool is half drained.
+    """
+    try:
+        client = _redis(client)
+        pipe = client.pipeline()
+        pipe.lpop(_key(npc.id))
+        pipe.llen(_key(npc.id))
+        raw, remaining = pipe.execute()
+    except Exception as e:
+        # The tick must not wait on or fail with the pool; the static event will do
+        print(f"NPC event pool unavailable: {e}")
+        raw, remaining = None, 0
+
+    if remaining < pool_depth() // 2:
+        queue_npc_event_refill()
+    return json.loads(raw) if raw else example_event(npc)
+
+
+def queue_npc_event_refill():
+    """Queues `refill_npc_event_pools` unless a refill is already queued or running."""
+    if not cache.add(NPC_EVENT_REFILL_QUEUED_KEY, True, NPC_EVENT_REFILL_QUEUED_TTL):
+        return
+    from .tasks import refill_npc_event_pools
+    try:
+        refill_npc_event_pools.delay()
+    except Exception as e:
+        # Leave the flag set so a broker outage is retried after the TTL, not on every pop
+        print(f"Could not queue NPC event refill: {e}")
+
+
+def fill_npc_event_pools(npcs, depth=None, model=None, client=None):
+    """
+    Tops the pool of every NPC in `npcs` up to `depth` (default
+    NPC_EVENT_POOL_DEPTH) generated events. An NPC whose generation fails is
+    left for the next refill rather than retried. Returns the number of events added.
+    """
+    depth = pool_depth() if depth is None else depth
+    client = _redis(client)
+    added = 0
+    for npc in npcs:
+        key = _key(npc.id)
+        events = []
+        for _ in range(depth - client.llen(key)):
+            event = generate_npc_event(npc, model)
+            if event is None:
+                break
+            events.append(json.dumps(event))
+        if events:
+            pipe = client.pipeline()
+            pipe.rpush(key, *events)
+            pipe.expire(key, NPC_EVENT_POOL_TTL)
+            pipe.execute()
+            added += len(events)
+    return added
@@ -0,0 +1,185 @@
+# seeding.py
+"""
+Synthetic inventories, market listings and dungeon sessions for load tests.
+Like `logger.seeding`, everything is drawn from a caller-supplied `random.Random`.
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .dungeon import LOG_CHAMBER, TREASURES
+from .models import NPC, Chest, DungeonLogEntry, DungeonSession, EquippedItem, Inventory, Item, MarketListing
+
+SEED_ITEM_PREFIX = "Seed"
+RARITY_WEIGHTS = {'common': 60, 'rare': 25, 'epic': 12, 'legendary': 3}
+EQUIPPABLE_CATEGORIES = ['wings', 'headpiece', 'armour', 'melee', 'arm', 'legs']
+
+# Same shape as the events stored by `inventory.tasks` when a session pauses on an NPC
+SEED_NPC_EVENT = {
+    "npc": {"name": "Seed NPC", "description": "A wanderer who only exists in load tests."},
+    "event": {
+        "dialogue": "The wanderer blocks the corridor.",
+        "choices": [
+            {"choice_text": "Pay the toll.", "consequences": {
+                "health_change": 0, "currency_change": -5, "consequence_text": "You pay and walk on."}},
+            {"choice_text": "Push past.", "consequences": {
+                "health_change": -10, "currency_change": 0, "consequence_text": "You shove through, bruised."}},
+        ],
+    },
+}
+
+
+def ensure_seed_items(rng, per_category=20):
+    """
+    Makes sure there are at least `per_category` items in every equippable
+    category plus a coin item and a chest over the whole pool, creating
+    "Seed ..." items for whatever is missing. Returns the item ids by category
+    and the chest.
+    """
+    new_items = []
+    for category in EQUIPPABLE_CATEGORIES:
+        existing = Item.objects.filter(category=category).count()
+        for i in range(existing, per_category):
+            rarity = rng.choices(list(RARITY_WEIGHTS), weights=list(RARITY_WEIGHTS.values()))[0]
+            new_items.append(Item(
+                file_name=f"seed_{category}_{i}",
+                name=f"{SEED_ITEM_PREFIX} {category} {i}",
+                category=category,
+                rarity=rarity,
+                strength=rng.randint(0, 10),
+                agility=rng.randint(0, 10),
+                intelligence=rng.randint(0, 10),
+                stealth=rng.randint(0, 10),
+                speed=rng.randint(0, 10),
+                defence=rng.randint(0, 10),
+            ))
+    if not Item.objects.filter(category='coins').exists():
+        new_items.append(Item(file_name="seed_coins", name=f"{SEED_ITEM_PREFIX} coins", category='coins'))
+    Item.objects.bulk_create(new_items)
+
+    item_ids = {
+        category: list(Item.objects.filter(category=category).order_by('id').values_list('id', flat=True))
+        for category in EQUIPPABLE_CATEGORIES
+    }
+    chest, created = Chest.objects.get_or_create(name=f"{SEED_ITEM_PREFIX} chest", defaults={'cost': 100})
+    if created:
+        chest.item_pool.set([item_id for ids in item_ids.values() for item_id in ids])
+    return item_ids, chest
+
+
+def ensure_seed_npcs(rng, count=5):
+    """Makes sure there are at least `count` NPCs, creating "Seed ..." ones for whatever is missing."""
+    existing = NPC.objects.count()
+    NPC.objects.bulk_create([
+        NPC(
+            name=f"{SEED_ITEM_PREFIX} NPC {i}",
+            short_description=rng.choice(["A lost cartographer.", "A retired gladiator.", "A merchant of odd relics."]),
+            likes="gold,stories",
+            dislikes="rudeness",
+            file_name=f"seed_npc_{i}",
+        )
+        for i in range(existing, count)
+    ])
+
+
+def seed_inventories(users, rng, item_ids, items_per_user=15):
+    """Gives each user an inventory of random items with one item equipped in most slots."""
+    inventories = Inventory.objects.bulk_create([Inventory(user=user) for user in users], batch_size=1000)
+    if inventories and inventories[0].pk is None:
+        inventories = list(Inventory.objects.filter(user__in=users).order_by('user_id'))
+
+    all_ids = [item_id for ids in item_ids.values() for item_id in ids]
+    ItemThrough = Inventory.items.through
+    item_rows = []
+    equipped = []
+    for inventory in inventories:
+        owned = rng.sample(all_ids, min(len(all_ids), items_per_user))
+        item_rows.extend(ItemThrough(inventory_id=inventory.pk, item_id=item_id) for item_id in owned)
+        owned = set(owned)
+        slots = {}
+        for category, ids in item_ids.items():
+            candidates = [item_id for item_id in ids if item_id in owned]
+            if candidates and rng.random() < 0.8:
+                slots[f"{category}_id"] = rng.choice(candidates)
+        equipped.append(EquippedItem(inventory_id=inventory.pk, **slots))
+    ItemThrough.objects.bulk_create(item_rows, batch_size=5000)
+    EquippedItem.objects.bulk_create(equipped, batch_size=1000)
+    return inventories
+
+
+def seed_market_listings(users, rng, listings_per_user=2):
+    """Lists a few of each user's items on the market, mostly active."""
+    ItemThrough = Inventory.items.through
+    owned = {}
+    for user_id, item_id in ItemThrough.objects.filter(inventory__user__in=users).values_list(
+        'inventory__user_id', 'item_id'
+    ):
+        owned.setdefault(user_id, []).append(item_id)
+
+    listings = []
+    for user in users:
+        items = owned.get(user.pk, [])
+        for item_id in rng.sample(items, min(len(items), listings_per_user)):
+            listings.append(MarketListing(
+                item_id=item_id,
+                seller=user,
+                listed_price=rng.randint(10, 1500),
+                is_active=rng.random() < 0.85,
+            ))
+    MarketListing.objects.bulk_create(listings, batch_size=2000)
+    return len(listings)
+
+
+def seed_dungeon_sessions(users, rng, active_fraction=0.3):
+    """
+    Starts a dungeon session for roughly `active_fraction` of the users, at
+    various points in the run, with a few log lines and collected items.
+    A handful are paused on an NPC event. Returns the number of sessions.
+    """
+    now = timezone.now()
+    item_ids = list(Item.objects.exclude(category='coins').values_list('id', flat=True))
+    sessions = []
+    for user in users:
+        if rng.random() >= active_fraction:
+            continue
+        start_time = now - timedelta(minutes=rng.randint(1, 240))
+        paused = rng.random() < 0.1
+        sessions.append(DungeonSession(
+            user=user,
+            user_health=rng.randint(20, 100),
+            start_time=start_time,
+            next_item_time=now + timedelta(minutes=rng.randint(0, 10)),
+            next_escapade_time=now + timedelta(minutes=rng.randint(0, 10)),
+            paused=paused,
+            npc_event_triggered=paused,
+            npc_event_data=SEED_NPC_EVENT if paused else None,
+            log_seq=rng.randint(0, 20),
+            seed=rng.getrandbits(62),
+        ))
+    for session in sessions:
+        session.next_due_at = session.compute_next_due_at()  # bulk_create skips save()
+    DungeonSession.objects.bulk_create(sessions, batch_size=1000)
+    if sessions and sessions[0].pk is None:
+        sessions = list(DungeonSession.objects.filter(user__in=users, end_time__isnull=True))
+
+    DungeonLogEntry.objects.bulk_create([
+        DungeonLogEntry(
+            session_id=session.pk,
+            seq=seq,
+            timestamp=session.start_time + timedelta(minutes=10 * seq),
+            code=LOG_CHAMBER,
+            args=[rng.randrange(len(TREASURES))],
+            health=session.user_health,
+        )
+        for session in sessions
+        for seq in range(1, session.log_seq + 1)
+    ], batch_size=5000)
+
+    if item_ids:
+        CollectedThrough = DungeonSession.items_collected.through
+        CollectedThrough.objects.bulk_create([
+            CollectedThrough(dungeonsession_id=session.pk, item_id=item_id)
+            for session in sessions
+            for item_id in rng.sample(item_ids, min(len(item_ids), rng.randint(0, 4)))
+        ], batch_size=5000)
+    return len(sessions)
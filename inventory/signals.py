@@ -0,0 +1,82 @@
+# signals.py
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .loadout import EQUIPMENT_SLOTS
+from .loot import invalidate_loot_tables
+from .models import Chest, EquippedItem, Inventory, Item, NPC
+from .snapshots import invalidate_inventory_snapshot, invalidate_inventory_snapshots
+from .stats import STAT_FIELDS, refresh_effective_stats
+
+
+@receiver(m2m_changed, sender=Inventory.items.through)
+def invalidate_snapshot_on_items_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Items added to or removed from an inventory: chests, market trades, dungeon rewards, admin edits."""
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            invalidate_inventory_snapshot(instance.user_id)
+    elif action == "pre_clear":
+        # item.inventories.clear() gives no pk_set, so collect the owners before the rows go
+        invalidate_inventory_snapshots(instance.inventories.values_list('user_id', flat=True))
+    elif action in ("post_add", "post_remove"):
+        invalidate_inventory_snapshots(Inventory.objects.filter(pk__in=pk_set).values_list('user_id', flat=True))
+
+
+@receiver(post_save, sender=Inventory)
+@receiver(post_delete, sender=Inventory)
+def invalidate_snapshot_on_inventory_change(sender, instance, **kwargs):
+    invalidate_inventory_snapshot(instance.user_id)
+
+
+@receiver(post_save, sender=EquippedItem)
+@receiver(post_delete, sender=EquippedItem)
+def refresh_on_equip(sender, instance, origin=None, **kwargs):
+    """Equip/unequip: recompute effective stats in the same transaction and drop the snapshot."""
+    user_id = instance.inventory.user_id
+    # A cascade from deleting the inventory or user has nothing left to refresh
+    if origin is None or origin is instance:
+        refresh_effective_stats([user_id])
+    invalidate_inventory_snapshot(user_id)
+
+
+def _users_with_item_equipped(item):
+    slots = Q()
+    for slot in EQUIPMENT_SLOTS:
+        slots |= Q(**{slot: item})
+    return set(EquippedItem.objects.filter(slots).values_list('inventory__user_id', flat=True))
+
+
+@receiver(post_save, sender=Item)
+def refresh_item_owners(sender, instance, created=False, update_fields=None, **kwargs):
+    """Admin edits to an item's stats or artwork change every snapshot that contains it."""
+    if created:
+        return
+    invalidate_inventory_snapshots(instance.inventories.values_list('user_id', flat=True))
+    if update_fields is None or set(update_fields) & set(STAT_FIELDS):
+        refresh_effective_stats(_users_with_item_equipped(instance))
+
+
+@receiver(pre_delete, sender=Item)
+def remember_item_owners(sender, instance, **kwargs):
+    invalidate_inventory_snapshots(instance.inventories.values_list('user_id', flat=True))
+    # Deleting the item empties its slots (SET_NULL); the wearers are refreshed once that has happened
+    instance._equipped_user_ids = _users_with_item_equipped(instance)
+
+
+@receiver(post_delete, sender=Item)
+def refresh_item_wearers(sender, instance, **kwargs):
+    refresh_effective_stats(getattr(instance, '_equipped_user_ids', ()))
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+@receiver(post_save, sender=Chest)
+@receiver(post_delete, sender=Chest)
+@receiver(post_save, sender=NPC)
+@receiver(post_delete, sender=NPC)
+@receiver(m2m_changed, sender=Chest.item_pool.through)
+def invalidate_loot(sender, **kwargs):
+    """Any change to the items, chest pools or NPCs that can be drawn rebuilds the loot tables."""
+    if kwargs.get('action', 'post_').startswith('post_'):
+        invalidate_loot_tables()
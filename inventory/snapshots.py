@@ -0,0 +1,137 @@
+# snapshots.py
+"""
+Per-user inventory snapshots (items, equipped map and computed stats) kept in
+the shared Django cache, which is Redis in production.
+
+The snapshot is what `InventoryConsumer` sends as `inventory_update`; building
+it touches the inventory, its items, the six equipped slots and the user row,
+so connects and `fetch_inventory_data` read it from the cache instead. Every
+write that can change it bumps `Inventory.revision` in its own transaction:
+inventory and equipped-slot changes through the signals in `inventory.signals`,
+base-stat changes explicitly at the call site.
+
+Entries are keyed by that revision. A reader looks up the revision first and
+stores what it built under the revision the build saw, so a reader racing a
+writer can only cache pre-commit state under the old revision, which nobody
+asks for once the writer commits. Superseded entries simply expire.
+
+The consumer also uses the revision to push only what changed
+(`diff_inventory_snapshots`) and to tell whether a client asking for a resync
+is already up to date.
+"""
+from django.core.cache import cache
+from django.db.models import F
+
+from .loadout import resolve_loadout
+from .stats import get_effective_stats
+
+SNAPSHOT_KEY = "inventory:snapshot:v3:{user_id}:{revision}"
+SNAPSHOT_TTL = 60 * 60  # Bounds the memory of entries superseded by a newer revision
+
+
+def _key(user_id, revision):
+    return SNAPSHOT_KEY.format(user_id=user_id, revision=revision)
+
+
+def _current_revision(user_id):
+    from .models import Inventory
+
+    # Like `resolve_loadout`, a user's first inventory is the one that counts
+    return Inventory.objects.filter(user_id=user_id).order_by('id').values_list('revision', flat=True).first()
+
+
+def build_inventory_snapshot(user_id):
+    """Reads the snapshot from the database; see `get_inventory_snapshot`."""
+    loadout = resolve_loadout(user_id, with_items=True)
+    if loadout is None:
+        # Default empty stats if no inventory exists
+        return {"revision": 0, "items": [], "equipped": {}, "stats": {}}
+
+    item_list = []
+    for item in loadout.items:
+        item_list.append({
+            "id": item.id,
+            "name": item.name,
+            "file_name": item.file_name,
+            # Append `_inv` to file_name for everything except armour
+            "file_name_inv": f"{item.file_name}_inv" if item.category != "armour" else item.file_name,
+            "category": item.category,
+            "rarity": item.rarity,
+            "is_equipped": loadout.is_equipped(item),
+        })
+
+    return {
+        "revision": loadout.inventory.revision,
+        "items": item_list,
+        "equipped": loadout.equipped_file_names(),
+        # Base stats plus gear, maintained in PlayerStats by `inventory.stats`
+        "stats": get_effective_stats(user_id)
+    }
+
+
+def get_inventory_snapshot(user_id):
+    """
+    Returns the user's inventory snapshot: one revision lookup and a cache
+    read, building and caching it on a miss.
+    """
+    revision = _current_revision(user_id)
+    if revision is None:
+        # Without an inventory there is next to nothing to read, and no revision to key on
+        return build_inventory_snapshot(user_id)
+    snapshot = cache.get(_key(user_id, revision))
+    if snapshot is None:
+        snapshot = build_inventory_snapshot(user_id)
+        # Under the revision the build read, never the one looked up before it
+        cache.set(_key(user_id, snapshot["revision"]), snapshot, SNAPSHOT_TTL)
+    return snapshot
+
+
+def invalidate_inventory_snapshots(user_ids):
+    """
+    Bumps the inventory revision of the given users, which moves their
+    snapshots to a new cache key once the current transaction commits.
+    """
+    from .models import Inventory
+
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    Inventory.objects.filter(user_id__in=user_ids).update(revision=F('revision') + 1)
+
+
+def invalidate_inventory_snapshot(user_id):
+    invalidate_inventory_snapshots([user_id])
+
+
+def diff_inventory_snapshots(old, new):
+    """
+    Returns the `inventory_delta` payload that turns snapshot `old` into `new`:
+    added and changed items in full, removed item ids, changed slots and the
+    stats if they moved. Returns None when nothing changed.
+    """
+    old_items = {item["id"]: item for item in old["items"]}
+    new_items = {item["id"]: item for item in new["items"]}
+    added = [item for item_id, item in new_items.items() if item_id not in old_items]
+    changed = [
+        item for item_id, item in new_items.items()
+        if item_id in old_items and old_items[item_id] != item
+    ]
+    removed = [item_id for item_id in old_items if item_id not in new_items]
+    equipped = {
+        slot: file_name for slot, file_name in new["equipped"].items()
+        if slot not in old["equipped"] or old["equipped"][slot] != file_name
+    }
+
+    if not (added or changed or removed or equipped) and old["stats"] == new["stats"]:
+        return None
+    delta = {
+        "base_revision": old["revision"],
+        "revision": new["revision"],
+        "added": added,
+        "changed": changed,
+        "removed": removed,
+        "equipped": equipped,
+    }
+    if old["stats"] != new["stats"]:
+        delta["stats"] = new["stats"]
+    return delta
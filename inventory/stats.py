@@ -0,0 +1,98 @@
+# stats.py
+"""
+Effective player stats: CustomUser base stats plus the stats of every equipped item.
+
+They are stored in `PlayerStats` and recomputed inside the transaction of each
+write that can change them: equipping and unequipping (EquippedItem signals),
+workout stat gains (`logger.ingest.record_workout`) and admin edits of an item's
+stats (Item signals). Readers such as the inventory snapshot and the dungeon
+logic call `get_effective_stats`, which is one row lookup.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from .loadout import EQUIPMENT_SLOTS
+from .models import EquippedItem, Inventory, PlayerStats
+
+STAT_FIELDS = ["strength", "agility", "intelligence", "stealth", "speed", "defence"]
+
+
+def compute_effective_stats(user_ids):
+    """Computes {user_id: {stat: value}} from the base stats and equipped items of the given users."""
+    user_ids = set(user_ids)
+    stats = {
+        row.pop('id'): row
+        for row in get_user_model().objects.filter(pk__in=user_ids).values('id', *STAT_FIELDS)
+    }
+
+    # Like `resolve_loadout`, a user's first inventory is the one that counts
+    first_inventory = {}
+    for inventory_id, user_id in Inventory.objects.filter(user_id__in=user_ids).order_by('id').values_list('id', 'user_id'):
+        first_inventory.setdefault(user_id, inventory_id)
+
+    equipped_rows = EquippedItem.objects.filter(
+        inventory_id__in=first_inventory.values()
+    ).select_related('inventory', *EQUIPMENT_SLOTS)
+    for equipped_items in equipped_rows:
+        totals = stats.get(equipped_items.inventory.user_id)
+        if totals is None:
+            continue
+        for slot in EQUIPMENT_SLOTS:
+            item = getattr(equipped_items, slot)
+            if item:
+                for field in STAT_FIELDS:
+                    totals[field] += getattr(item, field)
+    return stats
+
+
+def refresh_effective_stats(user_ids):
+    """
+    Recomputes and stores the effective stats of the given users.
+    Joins the caller's transaction; the user rows are locked first so two
+    concurrent refreshes for one player cannot interleave.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+    with transaction.atomic():
+        list(get_user_model().objects.select_for_update().filter(pk__in=user_ids).values_list('pk', flat=True))
+        stats = compute_effective_stats(user_ids)
+        existing = {row.user_id: row for row in PlayerStats.objects.filter(user_id__in=stats)}
+        now = timezone.now()
+        to_update = []
+        to_create = []
+        for user_id, values in stats.items():
+            row = existing.get(user_id)
+            if row is None:
+                to_create.append(PlayerStats(user_id=user_id, **values))
+                continue
+            for field, value in values.items():
+                setattr(row, field, value)
+            row.updated_at = now
+            to_update.append(row)
+        PlayerStats.objects.bulk_create(to_create, batch_size=1000)
+        PlayerStats.objects.bulk_update(to_update, [*STAT_FIELDS, 'updated_at'], batch_size=1000)
+    return stats
+
+
+def get_effective_stats(user_id):
+    """Returns the user's effective stats as a dict, computing and storing them if missing."""
+    row = PlayerStats.objects.filter(user_id=user_id).values(*STAT_FIELDS).first()
+    if row is None:
+        row = refresh_effective_stats([user_id]).get(user_id, {})
+    return row
+
+
+def find_stat_drift(user_ids):
+    """Returns {user_id: (stored, expected)} for users whose stored stats are missing or wrong."""
+    expected = compute_effective_stats(user_ids)
+    stored = {
+        row.pop('user_id'): row
+        for row in PlayerStats.objects.filter(user_id__in=expected).values('user_id', *STAT_FIELDS)
+    }
+    return {
+        user_id: (stored.get(user_id), values)
+        for user_id, values in expected.items()
+        if stored.get(user_id) != values
+    }
@@ -1,162 +1,255 @@
 # tasks.py
 
 from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
 from django.utils.timezone import now, timedelta
 from django.db import transaction
-from .consumers import InventoryConsumer
-import random
+from django.db.models.functions import Mod
+from .dungeon import catch_up
+from .dungeon_state import get_dungeon_state_store
+from .events import ESCAPADE, NPC_ENCOUNTER, publish_dungeon_event
+from .loot import get_loot_table, get_npc_table
+from .npc_events import NPC_EVENT_REFILL_QUEUED_KEY, fill_npc_event_pools, pop_npc_event
+
+DUNGEON_TICK_BATCH_SIZE = 500  # Sessions claimed per transaction
+DUNGEON_TICK_TIME_BUDGET = timedelta(seconds=50)  # Stop claiming new batches before the next beat
+DUNGEON_TICK_LAG_KEY = "inventory:dungeon_tick_lag:{shard}"
+
 
 @shared_task
-def process_dungeon_sessions():
-    from .models import DungeonSession, Item, NPC
+def dispatch_dungeon_ticks():
+    """
+    Beat entry point: fans the dungeon tick out over DUNGEON_TICK_SHARDS
+    workers, each taking the due sessions whose id falls in its shard.
+    """
+    shard_count = getattr(settings, 'DUNGEON_TICK_SHARDS', 1)
+    for shard in range(shard_count):
+        process_dungeon_sessions.delay(shard, shard_count)
+
 
+@shared_task
+def process_dungeon_sessions(shard=0, shard_count=1):
     """
-    Periodic task to process all active dungeon sessions:
-    - Generate item rewards if the time has come.
-    - Trigger an NPC event after a specified duration if not yet triggered.
-    - Generate escapade events every 10 minutes and log them.
-    - Pause and stop the session if the user's health drops to zero or below.
+    Processes the dungeon sessions that are due (`next_due_at` has passed) in
+    this shard. Idle, paused and finished sessions are never loaded: the
+    indexed `next_due_at` column is only set while a run has a timer pending.
+
+    Due sessions are claimed in batches with SELECT ... FOR UPDATE SKIP LOCKED,
+    so overlapping beats and the other shards never tick a session twice. The
+    tick lag (how far behind the oldest due session was) is printed and kept
+    in the cache under DUNGEON_TICK_LAG_KEY for monitoring.
+
+    Each batch is caught up in memory by `inventory.dungeon.catch_up` and
+    written back in a handful of statements (`advance_dungeon_sessions`).
+    Players' reads catch their own run up the same way, so the sweep only
+    decides how soon watching players are told about what happened.
     """
-    sessions = DungeonSession.objects.filter(end_time__isnull=True, paused=False)
-    print(f"Processing {sessions.count()} active dungeon sessions.")
+    from .models import DungeonSession
+
+    tick_started = now()
+    deadline = tick_started + DUNGEON_TICK_TIME_BUDGET
+    processed = 0
+    failed = set()
+    # Claimed in this run and still due (no progress possible yet); left for the next beat
+    stalled = set()
+    lag = timedelta(0)
+
+    loot_table = get_loot_table()
+    npc_table = get_npc_table()
+    # Hot sessions are off the schedule; the store only guards against one being claimed as it is loaded
+    store = get_dungeon_state_store()
+
+    while now() < deadline:
+        with transaction.atomic():
+            due = DungeonSession.objects.filter(next_due_at__lte=tick_started).exclude(pk__in=stalled)
+            if shard_count > 1:
+                due = due.annotate(shard=Mod('id', shard_count)).filter(shard=shard)
+            # Rows another worker is already ticking are skipped, not waited on
+            batch = list(due.order_by('next_due_at').select_for_update(skip_locked=True)[:DUNGEON_TICK_BATCH_SIZE])
+            if not batch:
+                break
+            lag = max(lag, tick_started - batch[0].next_due_at)
+            batch_failed = advance_dungeon_sessions(batch, now(), loot_table, npc_table, store)
+            failed.update(batch_failed)
+            # The others are no longer due, so excluding these is excluding everything processed so far
+            stalled.update(
+                session.pk for session in batch
+                if session.pk in batch_failed or (session.next_due_at is not None and session.next_due_at <= tick_started)
+            )
+        processed += len(batch)
+
+    duration = now() - tick_started
+    print(
+        f"Dungeon tick shard {shard}/{shard_count}: {processed} sessions in {duration.total_seconds():.2f}s, "
+        f"lag {lag.total_seconds():.1f}s"
+    )
+    cache.set(DUNGEON_TICK_LAG_KEY.format(shard=shard), {
+        "lag_seconds": lag.total_seconds(),
+        "processed": processed,
+        "failed": len(failed),
+        "duration_seconds": duration.total_seconds(),
+        "finished_at": now().isoformat(),
+    }, None)
+    return processed
+
 
+@shared_task
+def refill_npc_event_pools():
+    """
+    Tops up the pre-generated NPC event pools (see `inventory.npc_events`).
+    Run it from beat; the tick also queues it when a pool runs low.
+    """
+    from .models import NPC
+
+    try:
+        added = fill_npc_event_pools(NPC.objects.all())
+    finally:
+        cache.delete(NPC_EVENT_REFILL_QUEUED_KEY)
+    print(f"NPC event pools: generated {added} events")
+    return added
+
+
+@shared_task
+def flush_dungeon_states():
+    """
+    Beat entry point (every few seconds when DUNGEON_HOT_STATE is on): catches
+    up the runs held in Redis (see `inventory.dungeon_state`), which the sweep
+    skips, and writes their state back to Postgres. Runs that have ended are
+    evicted; runs whose Redis state expired go back to the sweep from their
+    last flushed state.
+    """
+    from django.db.models import Max
+    from .models import DungeonSession
+
+    store = get_dungeon_state_store()
+    if store is None:
+        return 0
+
+    session_ids = store.hot_session_ids()
+    for session in DungeonSession.objects.filter(pk__in=store.forget(session_ids)):
+        # Log lines written while hot are kept; carry on numbering after them
+        last_seq = session.log_entries.aggregate(last_seq=Max('seq'))['last_seq'] or 0
+        session.log_seq = max(session.log_seq, last_seq)
+        session.save(update_fields=['log_seq'])
+        session_ids.discard(session.pk)
+
+    with transaction.atomic():
+        sessions = list(DungeonSession.objects.filter(pk__in=session_ids).select_for_update(skip_locked=True))
+        ended = [session for session in sessions if session.end_time is not None]
+        running = [session for session in sessions if session.end_time is None]
+        failed = advance_dungeon_sessions(running, now(), store=store)
+        store.flush([session for session in running if session.pk not in failed])
+        store.flush(ended, evict=True)
+    return len(sessions)
+
+
+def advance_dungeon_sessions(sessions, until, loot_table=None, npc_table=None, store=None):
+    """
+    Catches a batch of locked sessions up to `until` and writes the results:
+    one UPDATE per changed session, then one INSERT of all the new log
+    entries and one of the collected items. Sessions held in `store` (a
+    `DungeonStateStore`) are read from and written to Redis instead, each in
+    its own savepoint. Returns the ids of sessions that could not be advanced.
+    """
+    loot_table = get_loot_table() if loot_table is None else loot_table
+    npc_table = get_npc_table() if npc_table is None else npc_table
+    hot = store.overlay(sessions) if store is not None else set()
+    steps = {session.pk: session.step for session in sessions if session.pk in hot}
+    failed = set()
+    results = []
     for session in sessions:
+        try:
+            result = catch_up(session, until, loot_table, npc_table)
+            if result.npc is not None:
+                result.fields['npc_event_data'] = {
+                    "npc": {
+                        "name": result.npc.name,
+                        "description": result.npc.short_description,
+                    },
+                    # Pre-generated, so the tick never waits on the model
+                    "event": pop_npc_event(result.npc)
+                }
+        except Exception as e:
+            print(f"Advancing dungeon session {session.pk} failed: {e}")
+            failed.add(session.pk)
+            continue
+        if result:
+            results.append((session, result))
+
+    for session, result in results:
+        if session.pk not in hot:
+            continue
+        try:
+            with transaction.atomic():
+                apply_tick_results([(session, result)], store, steps[session.pk])
+        except Exception as e:
+            print(f"Writing hot dungeon progress of session {session.pk} failed: {e}")
+            failed.add(session.pk)
+
+    results = [(session, result) for session, result in results if session.pk not in hot]
+    try:
         with transaction.atomic():
-            # Check if it's time for an item reward
-            if session.next_item_time and now() >= session.next_item_time:
-                random_item = Item.objects.exclude(category='coins').order_by("?").first()
-                if random_item:
-                    session.items_collected.add(random_item)
-                    session.add_log(f"Collected item: {random_item.name} ({random_item.category}, {random_item.rarity})")
-
-
-                    # Schedule the next reward (10 minutes from now)
-                    session.next_item_time = now() + timedelta(minutes=10)
-                    session.save(update_fields=['next_item_time'])
-
-            # Trigger NPC event after 1 hour if not triggered
-            elapsed = now() - session.start_time
-            if not session.npc_event_triggered and elapsed.total_seconds() >= 360:  # 3600 seconds = 1 hour
-                npc = NPC.objects.order_by("?").first()
-                if npc:
-                    session.npc_event_triggered = True
-                    session.paused = True
-                    event_data = InventoryConsumer.generate_dynamic_event(npc)
-                    session.npc_event_data = {
-                        "npc": {
-                            "name": npc.name,
-                            "description": npc.short_description,
-                        },
-                        "event": event_data
-                    }
-                    session.add_log(f"Encountered NPC: {npc.name} - {npc.short_description}")
-                    session.save(update_fields=['npc_event_triggered', 'paused', 'npc_event_data', 'logs'])
-
-
-
-            if session.next_escapade_time and now() >= session.next_escapade_time:
-                generate_escapade(session)
-                # Schedule the next escapade 10 minutes later
-                session.next_escapade_time = now() + timedelta(minutes=10)
-                session.save(update_fields=['next_escapade_time'])
-
-            # **Health Check: Pause and Stop Session if Health <= 0**
-            if session.user_health <= 0 and not session.paused:
-                session.add_log("You have died in the dungeon.")
-
-                # Set the end_time to mark the session as ended
-                # session.end_time = now()
-                session.paused = True
-
-                # Optionally, add additional logs or handle rewards/punishments
-                # For example: session.add_log("Session ended due to death.")
-
-                # Save the session with updated fields
-                session.save(update_fields=['end_time', 'logs','paused'])
-
-                # **Notify Frontend** about the death event
-                # Assuming you have a method to send messages via WebSocket
-
-
-def generate_escapade(session):
+            apply_tick_results(results)
+    except Exception as e:
+        print(f"Writing dungeon progress of {len(results)} sessions failed: {e}")
+        failed.update(session.pk for session, _ in results)
+    return failed
+
+
+def apply_tick_results(results, store=None, expected_step=None):
     """
-    Generates an escapade event for the session and logs it.
-    Possible escapades:
-    - Fighting a monster
-    - Finding a trap
-    - Discovering a hidden chamber
-    - Solving a puzzle
-    - Resting to regain health
+    Persists [(session, TickResult)] and publishes their events once the
+    transaction commits. With `store`, the single session given is hot: its
+    fields go to Redis provided it is still at `expected_step`, and it is
+    flushed to its row straight away if the player died.
     """
-    escapades = [
-        fight_monster,
-        find_trap,
-        discover_hidden_chamber,
-        solve_puzzle,
-        rest_regain_health
-    ]
-
-    escapade = random.choice(escapades)
-    escapade(session)
-
-
-def fight_monster(session):
-    monsters = [
-        {"name": "Goblin", "description": "A sneaky green creature with sharp teeth."},
-        {"name": "Skeleton Warrior", "description": "An animated skeleton armed with a rusty sword."},
-        {"name": "Orc Brute", "description": "A large and muscular orc with a menacing axe."},
-        {"name": "Dark Sorcerer", "description": "A mysterious figure cloaked in dark robes, wielding arcane powers."}
-    ]
-    monster = random.choice(monsters)
-    damage = random.randint(10, 25)
-    session.user_health = max(session.user_health - damage, 0)
-    session.add_log(f"Fought a {monster['name']}: {monster['description']}. Took {damage} damage.")
-    session.save(update_fields=['user_health', 'logs'])
-
-
-def find_trap(session):
-    traps = [
-        "a spike trap that deals damage",
-        "a poison dart trap that reduces health over time",
-        "a collapsing ceiling that restricts movement"
-    ]
-    trap = random.choice(traps)
-    damage = random.randint(15, 25)
-    session.user_health = max(session.user_health - damage, 0)
-    session.add_log(f"Triggered {trap}. Took {damage} damage.")
-    session.save(update_fields=['user_health', 'logs'])
-
-
-def discover_hidden_chamber(session):
-    treasures = [
-        {"name": "Ancient Relic", "description": "An old relic radiating mysterious energy."},
-        {"name": "Healing Potion", "description": "A potion that restores health."},
-        {"name": "Mana Crystal", "description": "A crystal that enhances magical abilities."}
-    ]
-    treasure = random.choice(treasures)
-    session.add_log(f"Discovered a hidden chamber containing {treasure['name']}: {treasure['description']}.")
-    session.save(update_fields=['logs'])
-
-
-def solve_puzzle(session):
-    puzzles = [
-        "a riddle inscribed on the wall",
-        "a complex mechanism that needs to be aligned",
-        "a series of pressure plates that must be stepped on in the correct order"
-    ]
-    puzzle = random.choice(puzzles)
-    success = random.random() < 0.7  # 70% chance to solve
-    if success:
-        session.add_log(f"Solved {puzzle}. Progressed further into the dungeon.")
-    else:
-        damage = random.randint(5, 10)
-        session.user_health = max(session.user_health - damage, 0)
-        session.add_log(f"Failed to solve {puzzle}. Took {damage} damage.")
-    session.save(update_fields=['user_health', 'logs'])
-
-
-def rest_regain_health(session):
-    health_regained = random.randint(10, 15)
-    session.user_health = min(session.user_health + health_regained, 100)
-    session.add_log(f"Rested and regained {health_regained} health.")
-    session.save(update_fields=['user_health', 'logs'])
+    from .models import DungeonLogEntry, DungeonSession
+
+    log_entries = []
+    collected = []
+    for session, result in results:
+        for field, value in result.fields.items():
+            setattr(session, field, value)
+        if store is None:
+            # update() skips save(), so keep the schedule in step here
+            session.next_due_at = session.compute_next_due_at()
+        collected.extend(
+            DungeonSession.items_collected.through(dungeonsession_id=session.pk, item_id=item_id)
+            for item_id in result.item_ids
+        )
+        for event in result.events:
+            items = {event["data"]["item"]["id"]: event["data"]["item"]} if "item" in event["data"] else None
+            logs = []
+            for code, args, health in event["logs"]:
+                session.log_seq += 1
+                entry = DungeonLogEntry(
+                    session=session, seq=session.log_seq, timestamp=event["at"], code=code, args=args, health=health
+                )
+                log_entries.append(entry)
+                logs.append(entry.as_dict(items))
+            data = dict(event["data"])
+            if event["event"] == ESCAPADE:
+                data["logs"] = logs
+            else:
+                data["log"] = logs[0]
+            if event["event"] == NPC_ENCOUNTER:
+                data["npc_event"] = session.npc_event_data
+            publish_dungeon_event(session, event["event"], **data)
+
+    if store is not None:
+        DungeonLogEntry.objects.bulk_create(log_entries)
+        # Last, so a failed INSERT leaves Redis untouched; a conflict rolls the INSERT back
+        for session, result in results:
+            store.save(session, expected_step, {**result.fields, 'log_seq': session.log_seq}, result.item_ids)
+            if session.user_health <= 0:
+                store.flush([session])
+        return
+
+    # Plain keyed UPDATEs: bulk_update's CASE expressions cost far more to build than they save
+    for session, result in results:
+        DungeonSession.objects.filter(pk=session.pk).update(
+            log_seq=session.log_seq, next_due_at=session.next_due_at, **result.fields
+        )
+    DungeonLogEntry.objects.bulk_create(log_entries, batch_size=5000)
+    DungeonSession.items_collected.through.objects.bulk_create(collected, batch_size=5000, ignore_conflicts=True)
@@ -1,3 +1,257 @@
-from django.test import TestCase
+import json
+import unittest
+from datetime import datetime, timedelta, timezone as dt_timezone
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .dungeon import catch_up, step_rng, tick_session
+from .dungeon_state import DungeonStateConflict, DungeonStateStore
+from .loot import LootTable, invalidate_loot_tables
+from .models import DungeonSession, Inventory, Item
+from .npc_events import example_event, fill_npc_event_pools, pop_npc_event
+from .snapshots import build_inventory_snapshot, get_inventory_snapshot
+from .tasks import process_dungeon_sessions
+
+try:
+    import fakeredis
+except ImportError:  # Only needed by the tests of the Redis-backed paths
+    fakeredis = None
+
+
+class InventorySnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user("collector", password="p")
+        self.inventory = Inventory.objects.create(user=self.user)
+        self.item = Item.objects.create(name="Sword", file_name="sword", category="melee", rarity="common")
+
+    def test_reader_racing_a_writer_cannot_cache_stale_state(self):
+        stale = build_inventory_snapshot(self.user.pk)
+
+        # The writer commits while the reader is still building, then the reader stores what it read
+        self.inventory.items.add(self.item)
+        with mock.patch('inventory.snapshots.build_inventory_snapshot', return_value=stale):
+            get_inventory_snapshot(self.user.pk)
+
+        snapshot = get_inventory_snapshot(self.user.pk)
+        self.assertEqual([item["id"] for item in snapshot["items"]], [self.item.id])
+
+
+class DungeonDeterminismTests(SimpleTestCase):
+    started = datetime(2024, 1, 1, 12, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.loot_table = LootTable([
+            SimpleNamespace(id=i, name=f"Item {i}", file_name=f"item_{i}", category="melee", rarity="common")
+            for i in range(1, 6)
+        ], [5, 4, 3, 2, 1])
+        self.npc_table = LootTable([SimpleNamespace(name=f"NPC {i}", short_description="d") for i in range(3)])
+
+    def new_session(self, seed=1234):
+        return DungeonSession(
+            start_time=self.started, next_item_time=self.started + timedelta(minutes=1),
+            next_escapade_time=self.started, seed=seed,
+        )
+
+    @staticmethod
+    def outcome(session, result):
+        fields = {field: getattr(session, field) for field in (
+            'user_health', 'paused', 'npc_event_triggered', 'next_item_time', 'next_escapade_time', 'step',
+        )}
+        return fields, result.item_ids, result.logs, result.npc
+
+    def test_tick_replays_from_the_same_seed(self):
+        at = self.started + timedelta(minutes=7)
+        first, second = (
+            tick_session(self.new_session(), at, step_rng(1234, 0), self.loot_table, self.npc_table)
+            for _ in range(2)
+        )
+        self.assertTrue(first)
+        self.assertEqual(
+            (first.fields, first.item_ids, first.events, first.npc),
+            (second.fields, second.item_ids, second.events, second.npc),
+        )
+
+    def test_catch_up_replays_from_the_same_seed(self):
+        until = self.started + timedelta(hours=3)
+        sessions = [self.new_session(), self.new_session()]
+        first, second = (catch_up(session, until, self.loot_table, self.npc_table) for session in sessions)
+
+        self.assertTrue(first.logs)
+        self.assertEqual(self.outcome(sessions[0], first), self.outcome(sessions[1], second))
+
+    def test_catch_up_does_not_depend_on_when_it_runs(self):
+        until = self.started + timedelta(hours=3)
+        at_once = self.new_session()
+        result = catch_up(at_once, until, self.loot_table, None)
+
+        in_steps = self.new_session()
+        item_ids, logs = [], []
+        at = self.started
+        while at < until:
+            at = min(at + timedelta(minutes=13), until)
+            step = catch_up(in_steps, at, self.loot_table, None)
+            item_ids.extend(step.item_ids)
+            logs.extend(step.logs)
+
+        self.assertEqual(self.outcome(at_once, result)[:3], (self.outcome(in_steps, result)[0], item_ids, logs))
+
+
+class DungeonScheduleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        invalidate_loot_tables()
+        self.user = get_user_model().objects.create_user("sleeper", password="p")
+        started = timezone.now() - timedelta(hours=1)
+        later = timezone.now() + timedelta(minutes=5)
+        # Without NPCs in the table, the NPC timer (long passed) can never fire
+        self.session = DungeonSession.objects.create(
+            user=self.user, start_time=started, next_item_time=later, next_escapade_time=later,
+        )
+
+    def test_npc_timer_only_counts_while_there_are_npcs(self):
+        self.assertGreater(self.session.next_due_at, timezone.now())
+
+    def test_session_that_cannot_progress_is_claimed_once_per_run(self):
+        DungeonSession.objects.filter(pk=self.session.pk).update(next_due_at=timezone.now() - timedelta(minutes=1))
+
+        with mock.patch('inventory.tasks.advance_dungeon_sessions', return_value=set()) as advance:
+            self.assertEqual(process_dungeon_sessions(), 1)
+        self.assertEqual(advance.call_count, 1)
+
+
+@unittest.skipUnless(fakeredis, "fakeredis is not installed")
+class DungeonStateStoreTests(TestCase):
+    def setUp(self):
+        self.store = DungeonStateStore(fakeredis.FakeRedis())
+        self.user = get_user_model().objects.create_user("delver", password="p")
+        self.item = Item.objects.create(name="Shield", file_name="shield", category="armour", rarity="common")
+        started = timezone.now() - timedelta(hours=1)
+        self.session = DungeonSession.objects.create(
+            user=self.user, start_time=started, next_item_time=started, next_escapade_time=started, seed=1,
+        )
+        self.assertTrue(self.store.load(self.session))
+
+    def flush(self, evict=False):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.store.flush(DungeonSession.objects.filter(pk=self.session.pk), evict=evict)
+
+    def test_load_takes_the_row_off_the_sweep_once(self):
+        self.assertFalse(self.store.load(self.session))
+        self.assertIsNone(DungeonSession.objects.get(pk=self.session.pk).next_due_at)
+        self.assertEqual(self.store.session_id_for_user(self.user.pk), self.session.pk)
+
+    def test_save_is_rejected_once_the_step_moved_on(self):
+        self.store.save(self.session, 0, {'step': 1, 'user_health': 90}, [self.item.pk])
+        with self.assertRaises(DungeonStateConflict):
+            self.store.save(self.session, 0, {'step': 1, 'user_health': 10})
+
+        self.assertEqual(self.store.get(self.session.pk)['user_health'], 90)
+        self.assertEqual(self.store.pending_item_ids(self.session.pk), {self.item.pk})
+
+    def test_overlay_replaces_hot_fields_only_for_hot_sessions(self):
+        self.store.save(self.session, 0, {'step': 1, 'user_health': 75, 'paused': True})
+        cold = DungeonSession.objects.create(
+            user=get_user_model().objects.create_user("idler", password="p"), start_time=timezone.now(),
+            next_item_time=timezone.now(), next_escapade_time=timezone.now(),
+        )
+        session = DungeonSession.objects.get(pk=self.session.pk)
+
+        self.assertEqual(self.store.overlay([session, cold]), {self.session.pk})
+        self.assertEqual((session.step, session.user_health, session.paused), (1, 75, True))
+
+    def test_flush_writes_changed_sessions_and_skips_idle_ones(self):
+        self.store.save(self.session, 0, {'step': 1, 'user_health': 60}, [self.item.pk])
+        self.assertEqual(self.flush(), {self.session.pk})
+
+        row = DungeonSession.objects.get(pk=self.session.pk)
+        self.assertEqual((row.step, row.user_health), (1, 60))
+        self.assertEqual(list(row.items_collected.values_list('pk', flat=True)), [self.item.pk])
+        self.assertEqual(self.store.pending_item_ids(self.session.pk), set())
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.flush(), set())
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE')])
+
+        self.store.save(self.session, 1, {'step': 2, 'user_health': 55})
+        self.assertEqual(self.flush(), {self.session.pk})
+        self.assertEqual(DungeonSession.objects.get(pk=self.session.pk).user_health, 55)
+
+    def test_rolled_back_flush_is_done_again(self):
+        self.store.save(self.session, 0, {'step': 1}, [self.item.pk])
+        # on_commit callbacks of a transaction that never commits are dropped
+        with self.captureOnCommitCallbacks(execute=False):
+            self.store.flush(DungeonSession.objects.filter(pk=self.session.pk))
+
+        self.assertEqual(self.store.pending_item_ids(self.session.pk), {self.item.pk})
+        self.assertEqual(self.flush(), {self.session.pk})
+
+    def test_evicting_flush_writes_idle_sessions_and_returns_them_to_the_sweep(self):
+        self.store.save(self.session, 0, {'step': 1})
+        self.flush()
+
+        self.assertEqual(self.flush(evict=True), {self.session.pk})
+        self.assertIsNone(self.store.get(self.session.pk))
+        self.assertEqual(self.store.hot_session_ids(), set())
+        self.assertIsNone(self.store.session_id_for_user(self.user.pk))
+        self.assertIsNotNone(DungeonSession.objects.get(pk=self.session.pk).next_due_at)
+
+
+class StubEventModel:
+    """Answers like the event model, numbering its events; fails once `fail_after` replies were given."""
+
+    def __init__(self, fail_after=None):
+        self.calls = 0
+        self.fail_after = fail_after
+
+    def complete(self, prompt):
+        if self.fail_after is not None and self.calls >= self.fail_after:
+            return ""
+        self.calls += 1
+        choice = {
+            "choice_text": "Wave.",
+            "consequences": {"health_change": 0, "currency_change": 0, "consequence_text": "Ok."},
+        }
+        return json.dumps({"dialogue": f"Event {self.calls}", "choices": [choice, choice]})
+
+
+@unittest.skipUnless(fakeredis, "fakeredis is not installed")
+class NPCEventPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.client = fakeredis.FakeRedis()
+        self.npc = SimpleNamespace(id=7, name="Sloan", short_description="A wary scout.")
+        refill = mock.patch('inventory.npc_events.queue_npc_event_refill')
+        self.queue_refill = refill.start()
+        self.addCleanup(refill.stop)
+
+    def test_fill_tops_pools_up_to_depth(self):
+        model = StubEventModel()
+        self.assertEqual(fill_npc_event_pools([self.npc], depth=3, model=model, client=self.client), 3)
+        pop_npc_event(self.npc, client=self.client)
+
+        self.assertEqual(fill_npc_event_pools([self.npc], depth=3, model=model, client=self.client), 1)
+        self.assertEqual(model.calls, 4)
+
+    def test_failed_generation_leaves_the_rest_for_the_next_refill(self):
+        added = fill_npc_event_pools([self.npc], depth=5, model=StubEventModel(fail_after=2), client=self.client)
+        self.assertEqual(added, 2)
+        self.assertEqual(self.client.llen("inventory:npc_events:7"), 2)
+
+    def test_pop_serves_events_in_order_then_the_static_event(self):
+        fill_npc_event_pools([self.npc], depth=2, model=StubEventModel(), client=self.client)
+
+        dialogues = [pop_npc_event(self.npc, client=self.client)["dialogue"] for _ in range(3)]
+        self.assertEqual(dialogues, ["Event 1", "Event 2", example_event(self.npc)["dialogue"]])
+        self.queue_refill.assert_called()
+
+    def test_pop_falls_back_when_redis_is_unreachable(self):
+        broken = mock.Mock()
+        broken.pipeline.side_effect = ConnectionError("down")
+        self.assertEqual(pop_npc_event(self.npc, client=broken), example_event(self.npc))
@@ -4,35 +4,28 @@ from django.http import JsonResponse
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 
-from .models import Inventory, EquippedItem, Chest, MarketListing, Item
+from users.economy import InsufficientCoins, charge_coins, transfer_coins
+
+from .loadout import resolve_loadout
+from .loot import get_loot_table
+from .models import Inventory, Chest, MarketListing, Item
+
+CHEST_COIN_REWARD = 20  # Coins paid back by every chest
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_equipped_items(request):
-    try:
-        # Fetch the user's inventory
-        inventory = Inventory.objects.get(user=request.user)
-
-        # Get equipped items
-        equipped_items = EquippedItem.objects.get(inventory=inventory)
-        equipped_data = {
-            "legs": equipped_items.legs.file_name if equipped_items.legs else None,
-            "headpiece": equipped_items.headpiece.file_name if equipped_items.headpiece else None,
-            "arm": equipped_items.arm.file_name if equipped_items.arm else None,
-            "melee": equipped_items.melee.file_name if equipped_items.melee else None,
-            "armour": equipped_items.armour.file_name if equipped_items.armour else None,
-            "wings": equipped_items.wings.file_name if equipped_items.wings else None,
-        }
-
-        return JsonResponse({"success": True, "equipped_items": equipped_data}, status=200)
-
-    except Inventory.DoesNotExist:
+    # Inventory, equipped row and all six slots in one query
+    loadout = resolve_loadout(request.user.id)
+    if loadout is None:
         return JsonResponse({"success": False, "message": "Inventory not found."}, status=404)
 
-    except EquippedItem.DoesNotExist:
+    if loadout.equipped_items is None:
         return JsonResponse({"success": False, "equipped_items": {}}, status=200)
 
+    return JsonResponse({"success": True, "equipped_items": loadout.equipped_file_names()}, status=200)
+
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -46,44 +39,35 @@ def buy_chest(request):
             )
 
         user = request.user  # Get the user object
-        user_currency = user.coins  # Assuming coins is a field on the user model
 
         # Fetch the chest
         chest = Chest.objects.get(id=chest_id)
 
-        if user_currency < chest.cost:
+        # Fetch the coin item before anything is charged
+        coin_item = Item.objects.filter(category='coins').first()
+        if not coin_item:
             return JsonResponse(
-                {"success": False, "message": "Not enough currency to buy this chest."},
-                status=400
+                {"success": False, "message": "Coin item not found in the database."},
+                status=500
             )
 
         with transaction.atomic():
-            # Deduct the cost from the user's currency
-            user.coins -= chest.cost
-            user.save()  # Save the updated user instance
-
-            # Add up to 5 items to the user's inventory, ensuring at least 2 are coins
-            inventory, created = Inventory.objects.get_or_create(user=user)
-            item_pool = chest.item_pool.exclude(category='coins')  # Exclude coins for random selection
-
-            # Fetch or create the coin item
-            coin_item = Item.objects.filter(category='coins').first()
-            if not coin_item:
+            # Deduct the cost and pay back the chest's coins in one conditional UPDATE;
+            # concurrent purchases cannot overspend
+            try:
+                charge_coins(user, chest.cost, reward=CHEST_COIN_REWARD)
+            except InsufficientCoins:
                 return JsonResponse(
-                    {"success": False, "message": "Coin item not found in the database."},
-                    status=500
+                    {"success": False, "message": "Not enough currency to buy this chest."},
+                    status=400
                 )
 
+            # Add up to 5 items to the user's inventory, ensuring at least 2 are coins
+            inventory, created = Inventory.objects.get_or_create(user=user)
 
-
-            # Add the value of the coins to the user's currency
-            user.coins += 20  # Adjust as per the value each coin should add
-            user.save()
-
-            # Randomly select 3 other items from the item pool
-            random_items = item_pool.order_by('?')[:3]
-            for item in random_items:
-                inventory.items.add(item)
+            # Draw 3 other items from the chest's pool (coins excluded), weighted by rarity
+            random_items = get_loot_table(chest.id).sample_distinct(3)
+            inventory.items.add(*random_items)
 
             # Function to include only non-zero stats
             def get_item_stats(item):
@@ -206,24 +190,19 @@ def buy_from_listing(request):
         if inventory.items.filter(name=listing.item.name).exists():
             return JsonResponse({"success": False, "message": "You already own this item."}, status=400)
 
-        # Check if the user has enough coins
-        if buyer.coins < listing.listed_price:
-            return JsonResponse({"success": False, "message": "Not enough currency to buy this item."}, status=400)
-
-        # Deduct coins from the buyer
-        buyer.coins -= listing.listed_price
-        buyer.save()
+        try:
+            with transaction.atomic():
+                # Mark the listing as inactive; the conditional UPDATE lets only one buyer claim it
+                if not MarketListing.objects.filter(pk=listing.pk, is_active=True).update(is_active=False):
+                    raise MarketListing.DoesNotExist
 
-        # Add the item to the buyer's inventory
-        inventory.items.add(listing.item)
+                # Move the coins from the buyer to the seller, if the buyer can afford it
+                transfer_coins(buyer, listing.seller_id, listing.listed_price)
 
-        # Mark the listing as inactive
-        listing.is_active = False
-        listing.save()
-
-        # Add coins to the seller
-        listing.seller.coins += listing.listed_price
-        listing.seller.save()
+                # Add the item to the buyer's inventory
+                inventory.items.add(listing.item)
+        except InsufficientCoins:
+            return JsonResponse({"success": False, "message": "Not enough currency to buy this item."}, status=400)
 
         return JsonResponse({
             "success": True,
@@ -0,0 +1,322 @@
+# locustfile.py
+"""
+Load harness for the FitQuest backend.
+
+    python manage.py seed_load --users 200          # writes loadtest/seed.json
+    locust -f loadtest/locustfile.py --host http://localhost:8000 \
+        --headless -u 100 -r 10 -t 5m --csv loadtest/results/run
+
+ApiUser covers the REST endpoints of logger, exercises, inventory and users;
+InventorySocketUser and ChatSocketUser drive the two WebSocket consumers.
+At the end of a run a table with p50/p95/p99 latency per endpoint is printed,
+together with p50/p95/p99 queries per request for every HTTP endpoint when the
+server runs with `djangoProject1.middleware.QueryCountMiddleware` installed.
+Query counts are collected in-process, so run standalone rather than distributed.
+"""
+import itertools
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+import websocket
+from locust import HttpUser, User, between, events, task
+
+SEED_FILE = os.environ.get("FITQUEST_SEED_FILE", os.path.join(os.path.dirname(__file__), "seed.json"))
+WS_TIMEOUT = float(os.environ.get("FITQUEST_WS_TIMEOUT", "10"))  # Seconds to wait for a WebSocket reply
+PERCENTILES = (0.5, 0.95, 0.99)
+
+with open(SEED_FILE) as f:
+    SEED = json.load(f)
+_seed_users = itertools.cycle(SEED["users"])
+
+# Queries per request, keyed by (method, name), filled from the X-Query-Count header
+query_counts = {}
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+
+@events.request.add_listener
+def _record_query_count(request_type, name, response=None, exception=None, **kwargs):
+    if response is None or exception is not None:
+        return
+    count = response.headers.get("X-Query-Count")
+    if count is not None:
+        query_counts.setdefault((request_type, name), []).append(int(count))
+
+
+@events.quitting.add_listener
+def _print_report(environment, **kwargs):
+    header = f"{'Type':<6} {'Name':<48} {'Reqs':>7} {'Fail':>5} " \
+             f"{'p50ms':>7} {'p95ms':>7} {'p99ms':>7} {'q50':>5} {'q95':>5} {'q99':>5}"
+    lines = [header, "-" * len(header)]
+    for (name, method), entry in sorted(environment.stats.entries.items()):
+        if not entry.num_requests:
+            continue
+        latencies = [entry.get_response_time_percentile(p) for p in PERCENTILES]
+        queries = sorted(query_counts.get((method, name), []))
+        query_columns = [_percentile(queries, p) for p in PERCENTILES]
+        lines.append(
+            f"{method:<6} {name:<48} {entry.num_requests:>7} {entry.num_failures:>5} "
+            + " ".join(f"{value:>7.0f}" for value in latencies) + " "
+            + " ".join(f"{'-' if value is None else value:>5}" for value in query_columns)
+        )
+    print("\n".join(lines))
+
+
+class ApiUser(HttpUser):
+    """One seeded account hitting the REST API with a mobile-client-like mix."""
+    wait_time = between(0.5, 2)
+    weight = 6
+
+    def on_start(self):
+        seed_user = next(_seed_users)
+        self.username = seed_user["username"]
+        self.items = seed_user["items"]
+        self.client.headers["Authorization"] = f"Token {seed_user['token']}"
+        self.exercise_names = []
+        self.muscle_names = []
+        self.listing_ids = []
+        self.exercises_etag = None
+
+    # ---------------- logger ---------------- #
+
+    @task(10)
+    def last_workout(self):
+        self.client.get("/logger/last_workout/")
+
+    @task(6)
+    def week_workouts(self):
+        self.client.get("/logger/week_workouts/")
+
+    @task(6)
+    def past_workouts(self):
+        response = self.client.get("/logger/past_workouts/?limit=50", name="/logger/past_workouts/?limit")
+        cursor = response.json().get("next_cursor") if response.ok else None
+        if cursor and random.random() < 0.3:
+            self.client.get(
+                f"/logger/past_workouts/?limit=50&cursor={cursor}", name="/logger/past_workouts/?cursor"
+            )
+
+    @task(1)
+    def workout_list(self):
+        self.client.get("/logger/workouts/")
+
+    @task(2)
+    def workout_receiver(self):
+        if not self.exercise_names:
+            self.muscles_and_exercises()
+        exercises = [
+            {"name": name, "sets": random.randint(1, 5), "reps": random.randint(5, 12)}
+            for name in random.sample(self.exercise_names, min(len(self.exercise_names), 4))
+        ]
+        if not exercises:
+            return
+        self.client.post("/logger/workout_receiver/", json={
+            "duration": random.randint(15, 90) * 60 * 1000,
+            "avg_heart_rate": random.randint(90, 170),
+            "mood": random.randint(1, 3),
+            "exercises": exercises,
+        })
+
+    @task(1)
+    def sync_workouts(self):
+        start = datetime.utcnow() - timedelta(days=random.randint(0, 30), minutes=random.randint(0, 1440))
+        end = start + timedelta(minutes=random.randint(10, 60))
+        heartrate_data = [{
+            "start_date": (start + timedelta(minutes=i)).isoformat() + "Z",
+            "end_date": (start + timedelta(minutes=i, seconds=5)).isoformat() + "Z",
+            "value": {"numericValue": random.randint(90, 170)},
+        } for i in range(int((end - start).total_seconds() // 60))]
+        self.client.post("/logger/sync_workouts/", json={
+            "workout_data": [{
+                "start_date": start.isoformat() + "Z",
+                "end_date": end.isoformat() + "Z",
+                "value": {"workoutActivityType": "TRADITIONAL_STRENGTH_TRAINING", "totalEnergyBurned": 300},
+            }],
+            "heartrate_data": heartrate_data,
+        })
+
+    # ---------------- exercises ---------------- #
+
+    @task(3)
+    def muscles_and_exercises(self):
+        response = self.client.get("/exercise/muscles")
+        if response.ok:
+            self.muscle_names = [muscle["name"] for muscle in response.json()]
+        headers = {"Accept-Encoding": "br, gzip"}
+        if self.exercises_etag:
+            headers["If-None-Match"] = self.exercises_etag
+        response = self.client.get("/exercise/exercises_all", headers=headers)
+        if response.status_code == 200:
+            self.exercises_etag = response.headers.get("ETag")
+            self.exercise_names = [exercise["name"] for exercise in response.json()]
+
+    @task(3)
+    def exercises_by_muscle(self):
+        if not self.muscle_names:
+            return
+        self.client.get(
+            f"/exercise/?muscle_type={random.choice(self.muscle_names)}&page=1&items_per_page=10",
+            name="/exercise/?muscle_type",
+        )
+
+    # ---------------- inventory ---------------- #
+
+    @task(6)
+    def equipped_items(self):
+        self.client.get("/api/inventory/get_equipped_items/")
+
+    @task(4)
+    def marketplace(self):
+        response = self.client.get("/api/inventory/marketplace/")
+        if response.ok:
+            self.listing_ids = [listing["id"] for listing in response.json().get("listings", [])]
+
+    @task(1)
+    def buy_from_listing(self):
+        if not self.listing_ids:
+            return
+        with self.client.post(
+            "/api/inventory/marketplace/buy/", json={"listing_id": random.choice(self.listing_ids)},
+            catch_response=True,
+        ) as response:
+            # Losing the race for a listing or already owning the item is expected under load
+            if response.status_code in (400, 404):
+                response.success()
+
+    @task(1)
+    def add_listing(self):
+        if not self.items:
+            return
+        with self.client.post(
+            "/api/inventory/marketplace/add_listing/",
+            json={"item_name": random.choice(self.items), "price": random.randint(10, 1500)},
+            catch_response=True,
+        ) as response:
+            if response.status_code == 404:  # Item sold in an earlier purchase race
+                response.success()
+
+    @task(1)
+    def buy_chest(self):
+        with self.client.post(
+            "/api/inventory/buy_chest/", json={"chest_id": SEED["chest_id"]}, catch_response=True
+        ) as response:
+            if response.status_code == 400:  # Out of coins
+                response.success()
+
+    # ---------------- users ---------------- #
+
+    @task(2)
+    def username_exists(self):
+        self.client.get(f"/api/social/username_exists/?username={self.username}", name="/api/social/username_exists/")
+
+    @task(1)
+    def save_user_preferences(self):
+        self.client.post("/api/social/save_user_preferences/", json={
+            "username": self.username,
+            "body_color_index": random.randint(0, 4),
+            "eye_color_index": random.randint(0, 4),
+        })
+
+
+class _SocketUser(User):
+    """Base for WebSocket users: one authenticated connection per simulated client."""
+    abstract = True
+    path = None
+    wait_time = between(1, 3)
+
+    def on_start(self):
+        self.token = next(_seed_users)["token"]
+        url = self.host.replace("http", "ws", 1).rstrip("/") + f"{self.path}?token={self.token}"
+        started = time.perf_counter()
+        try:
+            self.ws = websocket.create_connection(url, timeout=WS_TIMEOUT)
+            exception = None
+        except Exception as e:
+            self.ws = None
+            exception = e
+        self._fire("connect", started, 0, exception)
+
+    def on_stop(self):
+        if self.ws is not None:
+            self.ws.close()
+
+    def _fire(self, name, started, length, exception=None):
+        self.environment.events.request.fire(
+            request_type="WS",
+            name=f"{self.path} {name}",
+            response_time=(time.perf_counter() - started) * 1000,
+            response_length=length,
+            exception=exception,
+            context={},
+        )
+
+    def call(self, action, expected_type, **payload):
+        """Sends an action and times the wait for the first reply of `expected_type`."""
+        if self.ws is None:
+            return None
+        started = time.perf_counter()
+        try:
+            self.ws.send(json.dumps({"action": action, **payload}))
+            while True:
+                raw = self.ws.recv()
+                try:
+                    message = json.loads(raw)
+                except ValueError:
+                    message = {}  # Some consumer errors are sent as plain text
+                if message.get("type") in expected_type:
+                    self._fire(action, started, len(raw))
+                    return message
+                if time.perf_counter() - started > WS_TIMEOUT:
+                    raise TimeoutError(f"No {expected_type} reply to {action}")
+        except Exception as e:
+            self._fire(action, started, 0, e)
+            return None
+
+
+class InventorySocketUser(_SocketUser):
+    path = "/ws/inventory/"
+    weight = 2
+
+    @task(5)
+    def fetch_inventory_data(self):
+        self.call("fetch_inventory_data", ("inventory_update",))
+
+    @task(3)
+    def fetch_currency_data(self):
+        self.call("fetch_currency_data", ("currency_update",))
+
+    @task(2)
+    def fetch_market_listings(self):
+        self.call("fetch_market_listings", ("market_listings",))
+
+    @task(3)
+    def fetch_dungeon_data(self):
+        self.call("fetch_dungeon_data", ("dungeon_data",))
+
+    @task(2)
+    def check_dungeon_status(self):
+        self.call("check_dungeon_status", ("dungeon_status",))
+
+    @task(1)
+    def start_dungeon(self):
+        self.call("start_dungeon", ("dungeon_started", "dungeon_error"))
+
+
+class ChatSocketUser(_SocketUser):
+    path = "/ws/chat/"
+    weight = 1
+
+    @task(3)
+    def fetch(self):
+        self.call("fetch", ("chat_history",))
+
+    @task(1)
+    def send_message(self):
+        self.call("send", ("chat_message",), message=f"load test {random.randint(0, 10 ** 6)}")
@@ -1,6 +1,9 @@
 # admin.py
 from django.contrib import admin
-from .models import Workout
+from django.db import transaction
+
+from .models import IngestionJob, Workout, WorkoutDailyAggregate
+from .rollups import add_workouts, remove_workouts
 
 @admin.register(Workout)
 class WorkoutAdmin(admin.ModelAdmin):
@@ -12,3 +15,38 @@ class WorkoutAdmin(admin.ModelAdmin):
     # Optional: Display exercises_done more readably if it's JSON
     def exercises_summary(self, obj):
         return str(obj.exercises_done)
+
+    # Keep the daily rollups in step with edits made through the admin
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            if change:
+                remove_workouts([Workout.objects.get(pk=obj.pk)])
+            super().save_model(request, obj, form, change)
+            add_workouts([obj])
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            remove_workouts([obj])
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            remove_workouts(list(queryset))
+            super().delete_queryset(request, queryset)
+
+
+@admin.register(WorkoutDailyAggregate)
+class WorkoutDailyAggregateAdmin(admin.ModelAdmin):
+    list_display = ('user', 'day', 'workout_count', 'total_minutes', 'total_energy_burned')
+    search_fields = ('user__username',)
+    list_filter = ('day',)
+    ordering = ('-day',)
+
+
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'kind', 'status', 'attempts', 'created_at', 'finished_at')
+    search_fields = ('user__username',)
+    list_filter = ('kind', 'status')
+    ordering = ('-created_at',)
+    readonly_fields = ('created_at', 'started_at', 'finished_at', 'attempts', 'committed_offset')
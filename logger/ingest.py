@@ -0,0 +1,370 @@
+# ingest.py
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Avg
+from django.utils import timezone
+
+from exercises.catalog import get_catalog
+from inventory.snapshots import invalidate_inventory_snapshot
+from inventory.stats import refresh_effective_stats
+from users.economy import add_stats
+from .models import Workout
+from .rollups import add_workouts
+
+CALORIES_PER_SET = 30  # Calories burned per set
+STRENGTH_GAIN_PER_SET = 1  # Strength gained per set
+AGILITY_GAIN_PER_SET = 1  # Agility gained per set
+SPEED_GAIN_PER_SET = 1  # Speed gained per set
+MAX_GAIN_PER_WORKOUT = 5  # Cap on each attribute gained from a single workout
+MIN_SYNCED_WORKOUT_DURATION = timedelta(minutes=5)  # Shorter HealthKit workouts are ignored
+SYNC_BULK_CREATE_BATCH_SIZE = 500
+
+
+class WorkoutPayloadError(ValueError):
+    """Raised when a watch payload fails validation; the message is safe to return to the client."""
+
+
+def parse_workout_payload(data):
+    """
+    Validates the envelope of a watch workout upload and returns the cleaned values.
+    Individual exercise entries are normalised later by `_parse_exercises` so that a
+    single malformed entry is skipped instead of rejecting the whole workout.
+    """
+    # Duration
+    duration_ms = data.get("duration")
+    if duration_ms is None:
+        raise WorkoutPayloadError("Duration is required.")
+    try:
+        duration_ms = int(duration_ms)
+        if duration_ms < 0:
+            raise ValueError
+    except (ValueError, TypeError):
+        raise WorkoutPayloadError("Duration must be a non-negative integer representing milliseconds.")
+
+    # Average Heart Rate
+    avg_heart_rate = data.get("avg_heart_rate", 100)
+    try:
+        avg_heart_rate = int(avg_heart_rate)
+        if not (30 <= avg_heart_rate <= 220):
+            raise ValueError
+    except (ValueError, TypeError):
+        raise WorkoutPayloadError("Average heart rate must be an integer between 30 and 220.")
+
+    # Mood
+    mood = data.get("mood", 2)
+    try:
+        mood = int(mood)
+        if not (1 <= mood <= 3):
+            raise ValueError
+    except (ValueError, TypeError):
+        raise WorkoutPayloadError("Mood must be an integer between 1 and 3.")
+
+    # Exercises
+    exercises = data.get("exercises", [])
+    if not isinstance(exercises, list) or not exercises:
+        raise WorkoutPayloadError("Exercises must be a non-empty list.")
+
+    return {
+        "duration": timedelta(milliseconds=duration_ms),
+        "avg_heart_rate": avg_heart_rate,
+        "mood": mood,
+        "exercises": exercises,
+    }
+
+
+def _parse_exercises(exercises):
+    """Returns a list of (name, sets) tuples, skipping entries that cannot be used."""
+    parsed = []
+    for idx, exercise_data in enumerate(exercises, start=1):
+        if not isinstance(exercise_data, dict):
+            print(f"Exercise entry {idx} is not a dictionary. Skipping.")
+            continue
+
+        exercise_name = exercise_data.get("name")
+        if not exercise_name:
+            print(f"Exercise entry {idx} missing 'name'. Skipping.")
+            continue
+
+        sets = exercise_data.get("sets", 1)
+        try:
+            sets = int(sets)
+            if sets < 1:
+                raise ValueError
+        except (ValueError, TypeError):
+            print(f"Exercise entry {idx} has invalid 'sets'. Defaulting to 1.")
+            sets = 1
+
+        # Reps are validated for parity with the watch app but do not affect gains.
+        reps = exercise_data.get("reps", 1)
+        try:
+            reps = int(reps)
+            if reps < 1:
+                raise ValueError
+        except (ValueError, TypeError):
+            print(f"Exercise entry {idx} has invalid 'reps'. Defaulting to 1.")
+
+        parsed.append((exercise_name, sets))
+    return parsed
+
+
+def _resolve_exercises(names):
+    """
+    Resolves exercise names to ids and their muscle group ids from the in-memory
+    exercise catalog, so steady-state uploads issue no exercise queries at all.
+    Returns {name: (exercise_id, [muscle_group_id, ...])}; when several exercises
+    share a name the one with the lowest id wins.
+    """
+    catalog = get_catalog()
+    resolved = {}
+    for name in set(names):
+        exercise_id = catalog.exercise_ids_by_name.get(name)
+        if exercise_id is not None:
+            resolved[name] = (exercise_id, list(catalog.exercises[exercise_id]["muscle_group_ids"]))
+    return resolved
+
+
+def record_workout(user, duration, avg_heart_rate, mood, exercises, workout_date=None):
+    """
+    Persists a watch workout and applies the attribute gains to the user.
+    `workout_date` defaults to now; queued uploads pass the time they were received.
+
+    The number of statements issued is independent of how many exercises are sent:
+    one lookup of the previous workout (exercises come from the catalog), then a
+    single transaction holding the workout insert, one bulk insert per M2M
+    relation, the daily rollup update and the user stat update.
+    """
+    workout_date = workout_date or timezone.now()
+    last_workout_date = (
+        Workout.objects.filter(user=user, workout_date__lt=workout_date).order_by('-workout_date')
+        .values_list('workout_date', flat=True).first()
+    )
+    within_24_hours = False
+    if last_workout_date:
+        within_24_hours = workout_date - last_workout_date <= timedelta(hours=24)
+
+    entries = _parse_exercises(exercises)
+    resolved = _resolve_exercises(name for name, _ in entries) if entries else {}
+
+    total_calories = 0.0
+    total_sets = 0
+    exercise_ids = []
+    muscle_group_ids = []
+    for exercise_name, sets in entries:
+        match = resolved.get(exercise_name)
+        if match is None:
+            print(f"Exercise '{exercise_name}' does not exist. Skipping.")
+            continue
+        exercise_id, exercise_muscle_group_ids = match
+        if exercise_id not in exercise_ids:
+            exercise_ids.append(exercise_id)
+        for mg_id in exercise_muscle_group_ids:
+            if mg_id not in muscle_group_ids:
+                muscle_group_ids.append(mg_id)
+        total_calories += CALORIES_PER_SET * sets
+        total_sets += sets
+
+    total_strength = min(STRENGTH_GAIN_PER_SET * total_sets, MAX_GAIN_PER_WORKOUT)
+    total_agility = min(AGILITY_GAIN_PER_SET * total_sets, MAX_GAIN_PER_WORKOUT)
+    total_speed = min(SPEED_GAIN_PER_SET * total_sets, MAX_GAIN_PER_WORKOUT)
+
+    with transaction.atomic():
+        workout = Workout.objects.create(
+            user=user,
+            duration=duration,
+            workout_date=workout_date,
+            avg_heart_rate=avg_heart_rate,
+            mood=mood,
+            energy_burned=total_calories,
+            strength_gained=1 if within_24_hours else total_strength,
+            agility_gained=1 if within_24_hours else total_agility,
+            speed_gained=1 if within_24_hours else total_speed,
+        )
+
+        if exercise_ids:
+            ExerciseThrough = Workout.exercises_done.through
+            ExerciseThrough.objects.bulk_create([
+                ExerciseThrough(workout_id=workout.id, exercise_id=exercise_id)
+                for exercise_id in exercise_ids
+            ])
+        if muscle_group_ids:
+            MuscleGroupThrough = Workout.muscle_groups.through
+            MuscleGroupThrough.objects.bulk_create([
+                MuscleGroupThrough(workout_id=workout.id, musclegroup_id=mg_id)
+                for mg_id in muscle_group_ids
+            ])
+
+        add_workouts([workout])
+
+        add_stats(user, strength=total_strength, agility=total_agility, speed=total_speed)
+        refresh_effective_stats([user.pk])
+        # The inventory snapshot carries the effective stats
+        invalidate_inventory_snapshot(user.pk)
+
+    print("within_24_hours " + str(within_24_hours))
+    return workout
+
+
+def _parse_healthkit_datetime(value):
+    """HealthKit sends naive UTC-like ISO strings with a trailing Z; they are stored in the current timezone."""
+    return datetime.fromisoformat(value.replace("Z", ""))
+
+
+class HeartRateSeries:
+    """
+    HealthKit heart-rate samples parsed once into a sorted datetime64 array with a
+    prefix sum of the values, so the mean over any workout window is two
+    `searchsorted` lookups instead of a rescan of every sample.
+    """
+
+    def __init__(self, samples):
+        samples = [
+            hr for hr in samples
+            if hr.get('start_date') and hr.get('end_date')
+        ]
+        start_dates = [hr['start_date'].replace("Z", "") for hr in samples]
+        try:
+            times = np.array(start_dates, dtype='datetime64[us]')
+        except ValueError:
+            # Fall back to the stdlib parser for formats NumPy does not accept
+            times = np.array([datetime.fromisoformat(d) for d in start_dates], dtype='datetime64[us]')
+        values = np.array([hr['value']['numericValue'] for hr in samples], dtype=np.float64)
+
+        order = np.argsort(times, kind='stable')
+        self.times = times[order]
+        self.prefix_sums = np.concatenate(([0.0], np.cumsum(values[order])))
+
+    def mean_between(self, start, end):
+        """Mean of the samples starting within [start, end] (naive datetimes), or None if there are none."""
+        lo = np.searchsorted(self.times, np.datetime64(start, 'us'), side='left')
+        hi = np.searchsorted(self.times, np.datetime64(end, 'us'), side='right')
+        if hi <= lo:
+            return None
+        return float((self.prefix_sums[hi] - self.prefix_sums[lo]) / (hi - lo))
+
+
+def validate_healthkit_envelope(data):
+    """Checks the shape of a HealthKit upload before it is queued; raises WorkoutPayloadError."""
+    workout_data = data.get('workout_data', [])
+    heartrate_data = data.get('heartrate_data', [])
+    if not isinstance(workout_data, list) or not isinstance(heartrate_data, list):
+        raise WorkoutPayloadError("workout_data and heartrate_data must be lists.")
+    if any(not isinstance(workout, dict) or not isinstance(workout.get('value'), dict) for workout in workout_data):
+        raise WorkoutPayloadError("Each workout must be an object with a 'value' object.")
+    return workout_data, heartrate_data
+
+
+def sync_healthkit_workouts(user, workout_data, heartrate_data):
+    """
+    Stores the HealthKit workouts of one upload and returns their summaries.
+    Walking and sub-five-minute workouts are skipped, as are workouts already
+    synced for the same start time. The average heart rate comes from the samples
+    inside the workout window, falling back to the user's historical average.
+
+    Whatever the batch size this costs a fixed handful of statements: the user row
+    lock that serialises retries from the phone, one range query for the start
+    times already stored, the fallback heart-rate aggregate, a batched
+    `bulk_create(ignore_conflicts=True)` backed by the (user, workout_date) unique
+    constraint, one query to read back the new ids and the rollup updates per day.
+    """
+    candidates = {}
+    for workout in workout_data:
+        workout_type = workout['value'].get('workoutActivityType')
+        if workout_type == "WALKING":
+            continue
+
+        start_date = workout.get('start_date')
+        end_date = workout.get('end_date')
+        if not (start_date and end_date):
+            print("Workout is missing its start or end date. Skipping.")
+            continue
+
+        start_naive = _parse_healthkit_datetime(start_date)
+        end_naive = _parse_healthkit_datetime(end_date)
+        start_dt = timezone.make_aware(start_naive)
+        duration = timezone.make_aware(end_naive) - start_dt
+
+        # Check if duration is less than 5 minutes
+        if duration < MIN_SYNCED_WORKOUT_DURATION:
+            print(f"Workout duration {duration} is less than 5 minutes. Skipping.")
+            continue
+
+        # The same workout may appear twice in one upload; keep the first copy
+        candidates.setdefault(start_dt, (workout, workout_type, start_naive, end_naive, duration))
+
+    if not candidates:
+        return []
+
+    # Callers ingesting in batches parse the samples once and pass the series in
+    heart_rates = heartrate_data if isinstance(heartrate_data, HeartRateSeries) else HeartRateSeries(heartrate_data)
+
+    with transaction.atomic():
+        # Serialise concurrent syncs for the same user so the existence check below stays accurate
+        list(get_user_model().objects.select_for_update().filter(pk=user.pk).values_list('pk', flat=True))
+
+        existing = set(
+            Workout.objects.filter(
+                user=user, workout_date__range=(min(candidates), max(candidates))
+            ).values_list('workout_date', flat=True)
+        )
+        duplicates = existing & candidates.keys()
+        if duplicates:
+            print(f"{len(duplicates)} workouts already exist for {user.username}. Skipping.")
+
+        new_workouts = []
+        fallback_heart_rate = None
+        for start_dt, (workout, workout_type, start_naive, end_naive, duration) in sorted(candidates.items()):
+            if start_dt in existing:
+                continue
+
+            avg_heart_rate = heart_rates.mean_between(start_naive, end_naive)
+            if avg_heart_rate is None:
+                # Average of previous average heart rates, computed once per upload
+                if fallback_heart_rate is None:
+                    fallback_heart_rate = Workout.objects.filter(
+                        user=user, avg_heart_rate__gt=0
+                    ).aggregate(avg=Avg('avg_heart_rate'))['avg'] or 0
+                avg_heart_rate = fallback_heart_rate
+
+            new_workouts.append((workout, workout_type, Workout(
+                user=user,
+                duration=duration,
+                workout_date=start_dt,
+                avg_heart_rate=avg_heart_rate,
+                mood=workout.get('mood', 2),
+                energy_burned=workout['value'].get('totalEnergyBurned') or 0
+            )))
+
+        if not new_workouts:
+            return []
+
+        Workout.objects.bulk_create(
+            [instance for _, _, instance in new_workouts],
+            batch_size=SYNC_BULK_CREATE_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        # ignore_conflicts does not report primary keys back, so read them in one query
+        ids = dict(
+            Workout.objects.filter(
+                user=user,
+                workout_date__range=(new_workouts[0][2].workout_date, new_workouts[-1][2].workout_date),
+            ).values_list('workout_date', 'id')
+        )
+        for _, _, instance in new_workouts:
+            instance.id = ids.get(instance.workout_date)
+        add_workouts([instance for _, _, instance in new_workouts])
+
+    return [
+        {
+            'id': instance.id,
+            'workoutActivityType': workout_type,
+            'totalEnergyBurned': instance.energy_burned,
+            'start_date': workout.get('start_date'),
+            'end_date': workout.get('end_date'),
+            'duration': instance.duration.total_seconds(),
+            'average_heart_rate': instance.avg_heart_rate
+        }
+        for workout, workout_type, instance in new_workouts
+    ]
@@ -0,0 +1,79 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from logger.ingest import sync_healthkit_workouts
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the HealthKit sync path: sync N workouts for a throwaway user and report queries and wall time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workouts', type=int, default=1000, help='Workouts in the synthetic upload')
+        parser.add_argument('--samples-per-workout', type=int, default=60, help='Heart-rate samples per workout')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        workout_data, heartrate_data = self.build_upload(rng, options['workouts'], options['samples_per_workout'])
+        self.stdout.write(
+            f"Upload: {len(workout_data)} workouts, {len(heartrate_data)} heart-rate samples"
+        )
+
+        # Everything runs inside a transaction that is rolled back, so the database is left untouched
+        try:
+            with transaction.atomic():
+                user = get_user_model().objects.create_user(
+                    username=f"bench_sync_{rng.getrandbits(32):08x}", password=None
+                )
+                self.run_pass("first sync", user, workout_data, heartrate_data)
+                self.run_pass("re-sync (all duplicates)", user, workout_data, heartrate_data)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def run_pass(self, label, user, workout_data, heartrate_data):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            parsed = sync_healthkit_workouts(user, workout_data, heartrate_data)
+            elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{label}: inserted {len(parsed)} workouts in {elapsed * 1000:.1f} ms using {len(queries)} queries"
+        ))
+
+    @staticmethod
+    def build_upload(rng, workout_count, samples_per_workout):
+        """One workout per ~8 hours going back from now, each with minute-spaced HR samples."""
+        workout_data = []
+        heartrate_data = []
+        start = datetime.utcnow().replace(microsecond=0) - timedelta(hours=8 * workout_count)
+        for i in range(workout_count):
+            begin = start + timedelta(hours=8 * i, minutes=rng.randint(0, 120))
+            length = timedelta(minutes=rng.randint(10, 90))
+            workout_data.append({
+                "value": {
+                    "workoutActivityType": rng.choice(["RUNNING", "CYCLING", "TRADITIONAL_STRENGTH_TRAINING", "WALKING"]),
+                    "totalEnergyBurned": round(rng.uniform(80, 900), 1),
+                },
+                "start_date": begin.isoformat() + "Z",
+                "end_date": (begin + length).isoformat() + "Z",
+                "mood": rng.randint(1, 3),
+            })
+            for j in range(samples_per_workout):
+                sample_time = begin + length * j / samples_per_workout
+                heartrate_data.append({
+                    "value": {"numericValue": rng.randint(80, 180)},
+                    "start_date": sample_time.isoformat() + "Z",
+                    "end_date": sample_time.isoformat() + "Z",
+                })
+        rng.shuffle(heartrate_data)
+        return workout_data, heartrate_data
@@ -0,0 +1,128 @@
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Avg, Q
+from django.utils import timezone
+
+from exercises.models import Exercise, MuscleGroup
+from logger.models import Workout, WorkoutDailyAggregate
+from logger.seeding import create_seed_users, seed_workouts
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a workout dataset, EXPLAIN every hot logger query against it and fail '
+        'if any plan falls back to a sequential scan'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--workouts-per-user', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--keep', action='store_true', help='Commit the seeded rows instead of rolling back')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan, not only failing ones')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            raise CommandError(f"Plan checks are only implemented for PostgreSQL and SQLite, not {connection.vendor}.")
+
+        failures = []
+        try:
+            with transaction.atomic():
+                user = self.seed(options)
+                for label, sql, params in self.hot_queries(user):
+                    plan = self.explain(sql, params)
+                    sequential = self.is_sequential_scan(plan)
+                    if sequential:
+                        failures.append(label)
+                    if sequential or options['verbose_plans']:
+                        self.stdout.write(f"--- {label}\n{plan}\n")
+                    style = self.style.ERROR if sequential else self.style.SUCCESS
+                    self.stdout.write(style(f"{'SEQ SCAN' if sequential else 'ok':>8}  {label}"))
+                if not options['keep']:
+                    raise _Rollback
+        except _Rollback:
+            pass
+
+        if failures:
+            raise CommandError(f"{len(failures)} hot queries use a sequential scan: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS('All hot logger queries use an index.'))
+
+    def seed(self, options):
+        rng = random.Random(options['seed'])
+        users = create_seed_users(options['users'], rng, prefix="explain")
+        count = seed_workouts(
+            users,
+            options['workouts_per_user'],
+            rng,
+            exercise_ids=list(Exercise.objects.values_list('id', flat=True)[:200]),
+            muscle_group_ids=list(MuscleGroup.objects.values_list('id', flat=True)),
+        )
+        self.stdout.write(f"Seeded {len(users)} users and {count} workouts")
+
+        # Fresh statistics so the planner sees the real table sizes
+        with connection.cursor() as cursor:
+            for model in (Workout, WorkoutDailyAggregate, Workout.exercises_done.through, Workout.muscle_groups.through):
+                cursor.execute(f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
+        return users[len(users) // 2]
+
+    def hot_queries(self, user):
+        """(label, sql, params) for each query the logger endpoints run per request."""
+        now = timezone.now()
+        today = timezone.localdate(now)
+        monday = today - timedelta(days=today.weekday())
+        start_of_week = now - timedelta(days=today.weekday())
+        workouts = Workout.objects.filter(user=user)
+
+        querysets = [
+            ("last_workout: latest workout this week",
+             workouts.filter(workout_date__gte=start_of_week, workout_date__lte=now).order_by('-workout_date')[:1]),
+            ("last_workout / week_workouts: daily rollup range",
+             WorkoutDailyAggregate.objects.filter(user=user, day__gte=monday, day__lte=today, workout_count__gt=0)),
+            ("past_workouts: first keyset page",
+             workouts.filter(workout_date__lt=now).order_by('-workout_date', '-id')[:51]),
+            ("past_workouts: next keyset page",
+             workouts.filter(workout_date__lt=now).filter(
+                 Q(workout_date__lt=now - timedelta(days=30)) |
+                 Q(workout_date=now - timedelta(days=30), id__lt=10 ** 9)
+             ).order_by('-workout_date', '-id')[:51]),
+            ("past_workouts: exercises prefetch",
+             Workout.exercises_done.through.objects.filter(workout_id__in=list(workouts.values_list('id', flat=True)[:50]))),
+            ("update_latest_muscle_groups: latest workout",
+             workouts.order_by('-workout_date')[:1]),
+            ("workout_receiver: previous workout (24 hour check)",
+             workouts.filter(workout_date__lt=now).order_by('-workout_date').values_list('workout_date', flat=True)[:1]),
+            ("sync_workouts: existing start times in batch range",
+             workouts.filter(workout_date__range=(now - timedelta(days=30), now)).values_list('workout_date', flat=True)),
+            ("sync_workouts: fallback heart-rate average",
+             workouts.filter(avg_heart_rate__gt=0).values('user').annotate(avg=Avg('avg_heart_rate'))),
+        ]
+        for label, queryset in querysets:
+            sql, params = queryset.query.sql_with_params()
+            yield label, sql, params
+
+    @staticmethod
+    def explain(sql, params):
+        prefix = "EXPLAIN QUERY PLAN " if connection.vendor == 'sqlite' else "EXPLAIN "
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            rows = cursor.fetchall()
+        if connection.vendor == 'sqlite':
+            return "\n".join(str(row[-1]) for row in rows)
+        return "\n".join(row[0] for row in rows)
+
+    @staticmethod
+    def is_sequential_scan(plan):
+        if connection.vendor == 'sqlite':
+            # SQLite reports full table scans as "SCAN <table>" without an index
+            return any(
+                line.strip().startswith("SCAN ") and " USING " not in line
+                for line in plan.splitlines()
+            )
+        return "Seq Scan" in plan
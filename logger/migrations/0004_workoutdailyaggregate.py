@@ -0,0 +1,62 @@
+# Generated by Django 4.2.13 on 2026-10-18 09:12
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+def backfill_daily_aggregates(apps, schema_editor):
+    Workout = apps.get_model('logger', 'Workout')
+    WorkoutDailyAggregate = apps.get_model('logger', 'WorkoutDailyAggregate')
+
+    totals = defaultdict(lambda: [0, 0.0, 0, 0])
+    workouts = Workout.objects.values_list('user_id', 'workout_date', 'duration', 'energy_burned', 'avg_heart_rate')
+    for user_id, workout_date, duration, energy_burned, avg_heart_rate in workouts.iterator():
+        bucket = totals[(user_id, timezone.localtime(workout_date).date())]
+        bucket[0] += int(duration.total_seconds() // 60)
+        bucket[1] += energy_burned or 0.0
+        bucket[2] += 1
+        bucket[3] += max(int(avg_heart_rate or 0), 0)
+
+    WorkoutDailyAggregate.objects.bulk_create([
+        WorkoutDailyAggregate(
+            user_id=user_id,
+            day=day,
+            total_minutes=minutes,
+            total_energy_burned=energy,
+            workout_count=count,
+            heart_rate_total=heart_rate,
+        )
+        for (user_id, day), (minutes, energy, count, heart_rate) in totals.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('logger', '0003_workout_agility_gained_workout_speed_gained_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkoutDailyAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(help_text='Local calendar day the workouts started on')),
+                ('total_minutes', models.PositiveIntegerField(default=0, help_text='Sum of whole minutes per workout')),
+                ('total_energy_burned', models.FloatField(default=0, help_text='Kcal')),
+                ('workout_count', models.PositiveIntegerField(default=0)),
+                ('heart_rate_total', models.PositiveIntegerField(default=0, help_text="Sum of the workouts' average heart rates")),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='workout_days', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='workoutdailyaggregate',
+            constraint=models.UniqueConstraint(fields=('user', 'day'), name='unique_workout_day_per_user'),
+        ),
+        migrations.RunPython(backfill_daily_aggregates, migrations.RunPython.noop),
+    ]
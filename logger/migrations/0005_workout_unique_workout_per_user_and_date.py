@@ -0,0 +1,67 @@
+# Generated by Django 4.2.13 on 2026-10-18 10:03
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+
+def merge_relations(Workout, keep_id, extra_ids):
+    """Copies the exercises and muscle groups of the `extra_ids` workouts onto the kept one."""
+    for name in ('exercises_done', 'muscle_groups'):
+        field = Workout._meta.get_field(name)
+        through = field.remote_field.through
+        source, target = f"{field.m2m_field_name()}_id", f"{field.m2m_reverse_field_name()}_id"
+        targets = set(through.objects.filter(**{f"{source}__in": extra_ids}).values_list(target, flat=True))
+        through.objects.bulk_create(
+            [through(**{source: keep_id, target: target_id}) for target_id in targets], ignore_conflicts=True
+        )
+
+
+def remove_duplicate_workouts(apps, schema_editor):
+    """
+    Keeps the oldest row of each (user, workout_date) pair, merges the others'
+    exercises and muscle groups into it, and takes them out of the daily
+    rollups. The deleted rows are printed, as they cannot be brought back.
+    """
+    Workout = apps.get_model('logger', 'Workout')
+    WorkoutDailyAggregate = apps.get_model('logger', 'WorkoutDailyAggregate')
+
+    duplicates = (
+        Workout.objects.values('user_id', 'workout_date')
+        .annotate(copies=Count('id'), keep_id=Min('id'))
+        .filter(copies__gt=1)
+    )
+    for duplicate in duplicates:
+        extras = Workout.objects.filter(
+            user_id=duplicate['user_id'], workout_date=duplicate['workout_date']
+        ).exclude(id=duplicate['keep_id'])
+        merge_relations(Workout, duplicate['keep_id'], [workout.id for workout in extras])
+        for workout in extras:
+            print(
+                f"Removing workout {workout.id} of user {workout.user_id} at {workout.workout_date}, "
+                f"a copy of workout {duplicate['keep_id']} ({workout.duration}, {workout.energy_burned} kcal)"
+            )
+            WorkoutDailyAggregate.objects.filter(
+                user_id=workout.user_id, day=timezone.localtime(workout.workout_date).date()
+            ).update(
+                total_minutes=F('total_minutes') - int(workout.duration.total_seconds() // 60),
+                total_energy_burned=F('total_energy_burned') - (workout.energy_burned or 0.0),
+                workout_count=F('workout_count') - 1,
+                heart_rate_total=F('heart_rate_total') - max(int(workout.avg_heart_rate or 0), 0),
+            )
+        extras.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logger', '0004_workoutdailyaggregate'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_workouts, reverse_code=migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='workout',
+            constraint=models.UniqueConstraint(fields=('user', 'workout_date'), name='unique_workout_per_user_and_date'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.13 on 2026-10-18 11:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('logger', '0006_ingestionjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='workout',
+            index=models.Index(fields=['user', '-workout_date', '-id'], name='workout_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workout',
+            index=models.Index(condition=models.Q(('avg_heart_rate__gt', 0)), fields=['user', 'avg_heart_rate'], name='workout_user_heart_rate_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.13 on 2026-10-18 01:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logger', '0007_workout_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='committed_offset',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='started_at',
+            field=models.DateTimeField(blank=True, help_text='When the current attempt claimed the job', null=True),
+        ),
+    ]
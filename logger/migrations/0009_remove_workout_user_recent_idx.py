@@ -0,0 +1,17 @@
+# Generated by Django 4.2.13 on 2026-10-18 01:21
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logger', '0008_ingestionjob_progress'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='workout',
+            name='workout_user_recent_idx',
+        ),
+    ]
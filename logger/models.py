@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.conf import settings
 from django.db.models import JSONField
@@ -16,6 +18,79 @@ class Workout(models.Model):
     agility_gained = models.PositiveIntegerField(default=0, help_text="Player's agility attribute.")
     speed_gained = models.PositiveIntegerField(default=0, help_text="Player's speed attribute.")
 
+    class Meta:
+        constraints = [
+            # Backs the de-duplicating bulk insert in HealthKit sync. Its index, scanned backwards, also
+            # serves the newest-first reads (latest workout, 24-hour check, keyset pages of past_workouts):
+            # workout_date is unique per user, so the id tiebreak never needs the index
+            models.UniqueConstraint(fields=['user', 'workout_date'], name='unique_workout_per_user_and_date'),
+        ]
+        indexes = [
+            # Fallback heart-rate average in HealthKit sync only looks at workouts with a reading
+            models.Index(
+                fields=['user', 'avg_heart_rate'],
+                condition=models.Q(avg_heart_rate__gt=0),
+                name='workout_user_heart_rate_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.user.username}'s workout on {self.workout_date.strftime('%Y-%m-%d %H:%M:%S')}"
 
+
+
+class WorkoutDailyAggregate(models.Model):
+    """
+    Per-user, per-day rollup of Workout rows, kept up to date by `logger.rollups`
+    so the home-screen endpoints read one small indexed range instead of the week's workouts.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='workout_days')
+    day = models.DateField(help_text="Local calendar day the workouts started on")
+    total_minutes = models.PositiveIntegerField(default=0, help_text="Sum of whole minutes per workout")
+    total_energy_burned = models.FloatField(default=0, help_text="Kcal")
+    workout_count = models.PositiveIntegerField(default=0)
+    heart_rate_total = models.PositiveIntegerField(default=0, help_text="Sum of the workouts' average heart rates")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='unique_workout_day_per_user'),
+        ]
+
+    @property
+    def avg_heart_rate(self):
+        return self.heart_rate_total / self.workout_count if self.workout_count else 0
+
+    def __str__(self):
+        return f"{self.user.username}'s workouts on {self.day.isoformat()}"
+
+
+class IngestionJob(models.Model):
+    """A watch or HealthKit upload accepted by the API and ingested later by `logger.tasks`."""
+    KIND_CHOICES = [
+        ('workout', 'Watch workout'),
+        ('healthkit_sync', 'HealthKit sync'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='ingestion_jobs')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    payload = models.JSONField(help_text="Raw request body as received")
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True, help_text="When the current attempt claimed the job")
+    finished_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Workouts of a HealthKit payload already stored; a retried job carries on from here
+    committed_offset = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} for {self.user.username} ({self.status})"
@@ -0,0 +1,108 @@
+# rollups.py
+"""
+Incremental maintenance of WorkoutDailyAggregate.
+
+Every path that creates, edits or deletes a Workout calls `add_workouts` /
+`remove_workouts` inside its transaction, so the rollup never needs a rescan.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import WorkoutDailyAggregate
+
+
+def workout_day(workout_date):
+    """The local calendar day a workout is filed under."""
+    return timezone.localtime(workout_date).date()
+
+
+def _workout_minutes(workout):
+    return int(workout.duration.total_seconds() // 60)
+
+
+def _group(workouts):
+    totals = defaultdict(lambda: {"minutes": 0, "energy": 0.0, "count": 0, "heart_rate": 0})
+    for workout in workouts:
+        bucket = totals[(workout.user_id, workout_day(workout.workout_date))]
+        bucket["minutes"] += _workout_minutes(workout)
+        bucket["energy"] += workout.energy_burned or 0.0
+        bucket["count"] += 1
+        bucket["heart_rate"] += max(int(round(workout.avg_heart_rate or 0)), 0)
+    return totals
+
+
+def _changes(bucket, sign):
+    return {
+        "total_minutes": F("total_minutes") + sign * bucket["minutes"],
+        "total_energy_burned": F("total_energy_burned") + sign * bucket["energy"],
+        "workout_count": F("workout_count") + sign * bucket["count"],
+        "heart_rate_total": F("heart_rate_total") + sign * bucket["heart_rate"],
+    }
+
+
+def _new_row(user_id, day, bucket):
+    return WorkoutDailyAggregate(
+        user_id=user_id,
+        day=day,
+        total_minutes=bucket["minutes"],
+        total_energy_burned=bucket["energy"],
+        workout_count=bucket["count"],
+        heart_rate_total=bucket["heart_rate"],
+    )
+
+
+def _apply(workouts, sign):
+    totals = _group(workouts)
+    if not totals:
+        return
+
+    created = set()
+    if sign > 0:
+        # Days seen for the first time are inserted in one statement (the common case for a backfill)
+        existing = set(
+            WorkoutDailyAggregate.objects.filter(
+                user_id__in={user_id for user_id, _ in totals},
+                day__in={day for _, day in totals},
+            ).values_list("user_id", "day")
+        )
+        missing = [key for key in totals if key not in existing]
+        if missing:
+            try:
+                with transaction.atomic():
+                    WorkoutDailyAggregate.objects.bulk_create(
+                        [_new_row(user_id, day, totals[(user_id, day)]) for user_id, day in missing]
+                    )
+                created = set(missing)
+            except IntegrityError:
+                # A concurrent request created some of these days; fall back to row-by-row below.
+                pass
+
+    for (user_id, day), bucket in totals.items():
+        if (user_id, day) in created:
+            continue
+        updated = WorkoutDailyAggregate.objects.filter(user_id=user_id, day=day).update(**_changes(bucket, sign))
+        if updated or sign < 0:
+            continue
+        try:
+            with transaction.atomic():
+                _new_row(user_id, day, bucket).save(force_insert=True)
+        except IntegrityError:
+            # Another request created the day's row first; add onto it instead.
+            WorkoutDailyAggregate.objects.filter(user_id=user_id, day=day).update(**_changes(bucket, sign))
+
+
+def add_workouts(workouts):
+    """
+    Adds saved workouts to their users' daily rollups: one lookup, one bulk insert
+    for new days and one UPDATE per day that already had workouts.
+    """
+    _apply(workouts, 1)
+
+
+def remove_workouts(workouts):
+    """Subtracts workouts that are about to be deleted or edited from their daily rollups (one UPDATE per day)."""
+    _apply(workouts, -1)
+
@@ -0,0 +1,80 @@
+# seeding.py
+"""
+Synthetic data for benchmarks and query-plan checks.
+Everything is generated from a caller-supplied `random.Random` so runs are reproducible.
+"""
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from .models import Workout
+from .rollups import add_workouts
+
+
+def create_seed_users(count, rng, prefix="seed"):
+    """Bulk-creates `count` users with unusable passwords and returns them with ids set."""
+    User = get_user_model()
+    run = f"{rng.getrandbits(32):08x}"
+    users = []
+    for i in range(count):
+        user = User(
+            username=f"{prefix}_{run}_{i}",
+            email=f"{prefix}_{run}_{i}@example.com",
+            coins=rng.randint(0, 2000),
+            strength=rng.randint(10, 60),
+            agility=rng.randint(10, 60),
+            speed=rng.randint(10, 60),
+        )
+        user.set_unusable_password()
+        users.append(user)
+    User.objects.bulk_create(users, batch_size=1000)
+    # Not every backend returns primary keys from bulk_create
+    if users and users[0].pk is None:
+        users = list(User.objects.filter(username__startswith=f"{prefix}_{run}_").order_by('id'))
+    return users
+
+
+def seed_workouts(users, workouts_per_user, rng, exercise_ids=(), muscle_group_ids=()):
+    """
+    Gives each user a history of `workouts_per_user` workouts, one every one to
+    three days going back from now, with exercises, muscle groups and daily rollups.
+    Returns the number of workouts created.
+    """
+    now = timezone.now()
+    workouts = []
+    for user in users:
+        workout_date = now - timedelta(hours=rng.randint(1, 48))
+        for _ in range(workouts_per_user):
+            workouts.append(Workout(
+                user=user,
+                duration=timedelta(minutes=rng.randint(15, 100)),
+                workout_date=workout_date.replace(microsecond=rng.randint(0, 999999)),
+                avg_heart_rate=0 if rng.random() < 0.05 else rng.randint(90, 170),  # Some synced workouts lack HR
+                mood=rng.randint(1, 3),
+                energy_burned=round(rng.uniform(80, 900), 1),
+                strength_gained=rng.randint(0, 5),
+                agility_gained=rng.randint(0, 5),
+                speed_gained=rng.randint(0, 5),
+            ))
+            workout_date -= timedelta(days=rng.randint(1, 3), minutes=rng.randint(0, 600))
+    Workout.objects.bulk_create(workouts, batch_size=2000)
+    if workouts and workouts[0].pk is None:
+        workouts = list(Workout.objects.filter(user__in=users))
+
+    ExerciseThrough = Workout.exercises_done.through
+    MuscleGroupThrough = Workout.muscle_groups.through
+    exercise_rows = []
+    muscle_group_rows = []
+    for workout in workouts:
+        if exercise_ids:
+            for exercise_id in rng.sample(list(exercise_ids), min(len(exercise_ids), rng.randint(3, 8))):
+                exercise_rows.append(ExerciseThrough(workout_id=workout.pk, exercise_id=exercise_id))
+        if muscle_group_ids:
+            for mg_id in rng.sample(list(muscle_group_ids), min(len(muscle_group_ids), rng.randint(1, 3))):
+                muscle_group_rows.append(MuscleGroupThrough(workout_id=workout.pk, musclegroup_id=mg_id))
+    ExerciseThrough.objects.bulk_create(exercise_rows, batch_size=5000)
+    MuscleGroupThrough.objects.bulk_create(muscle_group_rows, batch_size=5000)
+
+    add_workouts(workouts)
+    return len(workouts)
@@ -0,0 +1,108 @@
+# tasks.py
+
+from celery import shared_task
+from django.db import transaction
+from django.db.models import F
+from django.utils.timezone import now, timedelta
+
+INGESTION_BATCH_SIZE = 500  # HealthKit workouts stored per transaction
+INGESTION_JOB_TIMEOUT = timedelta(minutes=15)  # A job running longer than this is taken to have lost its worker
+INGESTION_JOB_MAX_ATTEMPTS = 3
+
+
+class _Superseded(Exception):
+    """The reaper handed the job to a newer attempt; this one stops without writing."""
+
+
+@shared_task
+def process_ingestion_job(job_id):
+    """
+    Ingests an upload accepted by `workout_receiver` or `sync_workouts` in async mode
+    and records the outcome on the IngestionJob for the status endpoint.
+
+    HealthKit workouts are stored INGESTION_BATCH_SIZE at a time, each batch in
+    the same transaction as the job's `committed_offset` and partial result, so
+    an attempt retried by `reap_ingestion_jobs` resumes after the last stored
+    batch. Every write is conditional on the attempt number, so an attempt the
+    reaper gave up on cannot overwrite the one that replaced it.
+    """
+    from .ingest import HeartRateSeries, parse_workout_payload, record_workout, sync_healthkit_workouts
+    from .models import IngestionJob
+
+    # Claim the job; a redelivered message for a job already picked up is ignored
+    claimed = IngestionJob.objects.filter(pk=job_id, status='pending').update(
+        status='running', started_at=now(), attempts=F('attempts') + 1
+    )
+    if not claimed:
+        return
+    job = IngestionJob.objects.select_related('user').get(pk=job_id)
+    this_attempt = IngestionJob.objects.filter(pk=job_id, attempts=job.attempts)
+
+    def record(**fields):
+        if not this_attempt.update(**fields):
+            raise _Superseded
+
+    try:
+        if job.kind == 'workout':
+            payload = parse_workout_payload(job.payload)
+            with transaction.atomic():
+                workout = record_workout(job.user, workout_date=job.created_at, **payload)
+                record(status='succeeded', finished_at=now(), result={
+                    "message": "Workout saved successfully.",
+                    "total_calories": workout.energy_burned,
+                    "strength_gained": workout.strength_gained,
+                    "agility_gained": workout.agility_gained,
+                    "speed_gained": workout.speed_gained,
+                })
+            return
+
+        workout_data = job.payload.get('workout_data', [])
+        heart_rates = HeartRateSeries(job.payload.get('heartrate_data', []))
+        parsed_workouts = (job.result or {}).get('parsed_data', [])
+        for start in range(job.committed_offset, len(workout_data), INGESTION_BATCH_SIZE):
+            end = min(start + INGESTION_BATCH_SIZE, len(workout_data))
+            with transaction.atomic():
+                parsed_workouts = parsed_workouts + sync_healthkit_workouts(
+                    job.user, workout_data[start:end], heart_rates
+                )
+                # Partial progress, readable from the status endpoint while the job runs
+                record(committed_offset=end, result={
+                    'user': job.user.username,
+                    'parsed_data': parsed_workouts,
+                    'processed': end,
+                    'total': len(workout_data),
+                })
+        record(status='succeeded', finished_at=now(), result={
+            'user': job.user.username,
+            'parsed_data': parsed_workouts,
+            'processed': len(workout_data),
+            'total': len(workout_data),
+        })
+    except _Superseded:
+        print(f"Ingestion job {job_id} attempt {job.attempts} was superseded; stopping")
+    except Exception as e:
+        print(f"Ingestion job {job_id} failed: {e}")
+        # The result keeps whatever batches were stored before the failure
+        this_attempt.update(status='failed', error=str(e), finished_at=now())
+
+
+@shared_task
+def reap_ingestion_jobs():
+    """
+    Hands back jobs whose worker died mid-run: a job `running` for longer than
+    INGESTION_JOB_TIMEOUT is queued again (resuming at its committed offset),
+    or failed once it has had INGESTION_JOB_MAX_ATTEMPTS attempts. Run it from beat.
+    """
+    from .models import IngestionJob
+
+    stuck = IngestionJob.objects.filter(status='running', started_at__lt=now() - INGESTION_JOB_TIMEOUT)
+    expired = stuck.filter(attempts__gte=INGESTION_JOB_MAX_ATTEMPTS)
+    failed = expired.update(status='failed', error="Timed out.", finished_at=now())
+    retried = 0
+    for job_id in stuck.values_list('pk', flat=True):
+        # Conditional, so a job that finished in the meantime is left alone
+        if stuck.filter(pk=job_id).update(status='pending'):
+            retried += 1
+            process_ingestion_job.delay(str(job_id))
+    print(f"Ingestion jobs: {retried} stuck jobs queued again, {failed} failed after too many attempts")
+    return retried
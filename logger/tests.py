@@ -1,3 +1,122 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from exercises.catalog import get_catalog
+from exercises.models import Exercise, MuscleGroup
+
+from .models import IngestionJob
+from .tasks import INGESTION_JOB_MAX_ATTEMPTS, process_ingestion_job, reap_ingestion_jobs
+
+
+class WorkoutReceiverQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        muscle_groups = [MuscleGroup.objects.create(name=f"Muscle {i}") for i in range(5)]
+        for i in range(12):
+            exercise = Exercise.objects.create(name=f"Exercise {i}", description="d")
+            exercise.muscle_groups.set(muscle_groups[i % 5:i % 5 + 2])
+        cls.user = get_user_model().objects.create_user("lifter", password="p")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        get_catalog()  # Exercise lookups come from the catalog once it is loaded
+
+    def post_workout(self, exercise_count):
+        return self.client.post("/logger/workout_receiver/", {
+            "duration": 60000,
+            "exercises": [{"name": f"Exercise {i}", "sets": 2} for i in range(exercise_count)],
+        }, format="json")
+
+    def test_statement_count_does_not_grow_with_exercises(self):
+        # The first workout of the day also creates the rollup and stats rows; compare later ones
+        self.post_workout(1)
+
+        with CaptureQueriesContext(connection) as one_exercise:
+            response = self.post_workout(1)
+        self.assertEqual(response.status_code, 201)
+
+        with self.assertNumQueries(len(one_exercise)):
+            response = self.post_workout(12)
+        self.assertEqual(response.status_code, 201)
+
+
+@mock.patch('logger.tasks.INGESTION_BATCH_SIZE', 2)
+class IngestionJobTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("syncer", password="p")
+        self.workouts = [{"n": n} for n in range(5)]
+
+    def create_job(self, **fields):
+        return IngestionJob.objects.create(
+            user=self.user, kind='healthkit_sync', payload={"workout_data": self.workouts}, **fields
+        )
+
+    @staticmethod
+    def sync(fail_at=None):
+        """Stands in for sync_healthkit_workouts, summarising each batch by its first workout."""
+        def sync_healthkit_workouts(user, batch, heart_rates):
+            if batch[0]["n"] == fail_at:
+                raise ValueError("Bad sample")
+            return [batch[0]["n"]]
+        return mock.patch('logger.ingest.sync_healthkit_workouts', side_effect=sync_healthkit_workouts)
+
+    def test_failure_keeps_the_batches_stored_before_it(self):
+        job = self.create_job()
+        with self.sync(fail_at=2):
+            process_ingestion_job(str(job.id))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error, job.committed_offset), ('failed', "Bad sample", 2))
+        self.assertEqual(job.result, {'user': "syncer", 'parsed_data': [0], 'processed': 2, 'total': 5})
+
+    def test_reaped_job_resumes_after_its_committed_batches(self):
+        job = self.create_job(
+            status='running', started_at=timezone.now() - timedelta(hours=1), attempts=1, committed_offset=2,
+            result={'user': "syncer", 'parsed_data': [0], 'processed': 2, 'total': 5},
+        )
+        with mock.patch('logger.tasks.process_ingestion_job.delay') as delay:
+            self.assertEqual(reap_ingestion_jobs(), 1)
+        delay.assert_called_once_with(str(job.id))
+
+        with self.sync() as sync:
+            process_ingestion_job(str(job.id))
+        self.assertEqual([call.args[1] for call in sync.call_args_list], [self.workouts[2:4], self.workouts[4:]])
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('succeeded', 2))
+        self.assertEqual(job.result, {'user': "syncer", 'parsed_data': [0, 2, 4], 'processed': 5, 'total': 5})
+
+    def test_job_is_failed_after_its_last_attempt(self):
+        stuck = self.create_job(
+            status='running', started_at=timezone.now() - timedelta(hours=1), attempts=INGESTION_JOB_MAX_ATTEMPTS
+        )
+        running = self.create_job(status='running', started_at=timezone.now(), attempts=1)
+        with mock.patch('logger.tasks.process_ingestion_job.delay') as delay:
+            self.assertEqual(reap_ingestion_jobs(), 0)
+        delay.assert_not_called()
+
+        stuck.refresh_from_db()
+        running.refresh_from_db()
+        self.assertEqual((stuck.status, running.status), ('failed', 'running'))
+
+    def test_attempt_replaced_by_the_reaper_stops_writing(self):
+        job = self.create_job()
+
+        def sync_healthkit_workouts(user, batch, heart_rates):
+            # Meanwhile the job was reaped and claimed again
+            IngestionJob.objects.filter(pk=job.pk).update(attempts=2)
+            return [batch[0]["n"]]
+
+        with mock.patch('logger.ingest.sync_healthkit_workouts', side_effect=sync_healthkit_workouts):
+            process_ingestion_job(str(job.id))
 
-# Create your tests here.
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.committed_offset, job.result), ('running', 0, None))
@@ -8,6 +8,7 @@ urlpatterns = [
     path('workout_receiver/', views.workout_receiver, name='workout_receiver'),
     path('debug/', views.print_post_data, name='print_post_data'),
     path('sync_workouts/', views.sync_workouts, name='sync_workouts'),
+    path('ingestion_jobs/<uuid:job_id>/', views.ingestion_job_status, name='ingestion_job_status'),
     path('last_workout/', views.last_workout, name='last_workout'),
     path('past_workouts/', views.past_workouts, name='past_workouts'),
     path('week_workouts/', views.this_weeks_workouts, name='this_weeks_workouts'),
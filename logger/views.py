@@ -1,9 +1,14 @@
 # views.py
+import base64
+import binascii
 import json
 from datetime import datetime, timedelta
 
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import transaction
-from django.http import JsonResponse
+from django.db.models import Prefetch, Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.utils import timezone
 from django.utils.timezone import make_aware
 
@@ -13,9 +18,14 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .models import Workout
+from .models import IngestionJob, Workout, WorkoutDailyAggregate
 from exercises.models import MuscleGroup, Exercise
+from .ingest import (
+    WorkoutPayloadError, parse_workout_payload, record_workout, sync_healthkit_workouts, validate_healthkit_envelope,
+)
+from .rollups import add_workouts, remove_workouts
 from .serializers import WorkoutSerializer
+from .tasks import process_ingestion_job
 
 
 # List all workouts or create a new workout
@@ -30,17 +40,27 @@ def workout_list(request):
     elif request.method == 'POST':
         serializer = WorkoutSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(user=request.user)
+            with transaction.atomic():
+                workout = serializer.save(user=request.user)
+                add_workouts([workout])
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-# Retrieve, update, or delete a specific workout
+def _wants_async(request):
+    """Uploads sent with ?async=true are queued instead of ingested in the request thread."""
+    return request.query_params.get('async', '').lower() in ('1', 'true', 'yes')
+
 
-CALORIES_PER_SET = 30  # Calories burned per set
-STRENGTH_GAIN_PER_SET = 1  # Strength gained per set
-AGILITY_GAIN_PER_SET = 1  # Agility gained per set
-SPEED_GAIN_PER_SET = 1  # Speed gained per set
+def _accept_ingestion_job(request, kind):
+    """Persists the raw upload, queues it for `logger.tasks` and answers 202 with the job id."""
+    job = IngestionJob.objects.create(user=request.user, kind=kind, payload=request.data)
+    transaction.on_commit(lambda: process_ingestion_job.delay(str(job.id)))
+    return JsonResponse({
+        "job_id": str(job.id),
+        "status": job.status,
+        "status_url": reverse('ingestion_job_status', args=[job.id]),
+    }, status=202)
 
 
 @api_view(['POST'])
@@ -50,170 +70,26 @@ def workout_receiver(request):
     Handles incoming workout data and saves it to the database.
     Calculates energy burned and attribute gains based on the number of sets.
     Resets stats if the last workout was within 24 hours.
+    Exercise lookups and M2M writes are batched, see `logger.ingest.record_workout`.
     """
     try:
         user = request.user
         data = request.data
-
-        # -----------------------
-        # 1. Validate and Extract Data
-        # -----------------------
         print(data)
-        # Duration
-        duration_ms = data.get("duration")
-        if duration_ms is None:
-            return JsonResponse({"error": "Duration is required."}, status=400)
-        try:
-            duration_ms = int(duration_ms)
-            if duration_ms < 0:
-                raise ValueError
-        except (ValueError, TypeError):
-            return JsonResponse({"error": "Duration must be a non-negative integer representing milliseconds."},
-                                status=400)
-        duration = timedelta(milliseconds=duration_ms)
-
-        # Average Heart Rate
-        avg_heart_rate = data.get("avg_heart_rate", 100)
-        try:
-            avg_heart_rate = int(avg_heart_rate)
-            if not (30 <= avg_heart_rate <= 220):
-                raise ValueError
-        except (ValueError, TypeError):
-            return JsonResponse({"error": "Average heart rate must be an integer between 30 and 220."}, status=400)
-
-        # Mood
-        mood = data.get("mood", 2)
+
         try:
-            mood = int(mood)
-            if not (1 <= mood <= 3):
-                raise ValueError
-        except (ValueError, TypeError):
-            return JsonResponse({"error": "Mood must be an integer between 1 and 3."}, status=400)
-
-        # Exercises
-        exercises = data.get("exercises", [])
-        if not isinstance(exercises, list) or not exercises:
-            return JsonResponse({"error": "Exercises must be a non-empty list."}, status=400)
-
-        # -----------------------
-        # 2. Check Last Workout
-        # -----------------------
-        last_workout = Workout.objects.filter(user=user).order_by('-workout_date').first()
-        within_24_hours = False
-        if last_workout:
-            time_difference = timezone.now() - last_workout.workout_date
-            within_24_hours = time_difference <= timedelta(hours=24)
-
-        # -----------------------
-        # 3. Start Transaction
-        # -----------------------
-        # Create Workout object without exercises_done and muscle_groups
-        workout = Workout.objects.create(
-            user=user,
-            duration=duration,
-            workout_date=timezone.now(),
-            avg_heart_rate=avg_heart_rate,
-            mood=mood,
-            energy_burned=0.0,  # Will update later
-            strength_gained=0,
-            agility_gained=0,
-            speed_gained=0,
-        )
+            payload = parse_workout_payload(data)
+        except WorkoutPayloadError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        if _wants_async(request):
+            return _accept_ingestion_job(request, 'workout')
+
+        workout = record_workout(user, **payload)
 
-        # Initialize totals
-        total_calories = 0.0
-        total_strength = 0
-        total_agility = 0
-        total_speed = 0
-        muscle_groups_set = set()
-
-        for idx, exercise_data in enumerate(exercises, start=1):
-            # Validate each exercise entry
-            if not isinstance(exercise_data, dict):
-                print(f"Exercise entry {idx} is not a dictionary. Skipping.")
-                continue
-
-            exercise_name = exercise_data.get("name")
-            sets = exercise_data.get("sets", 1)
-            reps = exercise_data.get("reps", 1)  # Not used in calculation, but can be stored if needed
-
-            # Validate exercise_name
-            if not exercise_name:
-                print(f"Exercise entry {idx} missing 'name'. Skipping.")
-                continue
-
-            # Validate sets
-            try:
-                sets = int(sets)
-                if sets < 1:
-                    raise ValueError
-            except (ValueError, TypeError):
-                print(f"Exercise entry {idx} has invalid 'sets'. Defaulting to 1.")
-                sets = 1
-
-            # Validate reps (optional)
-            try:
-                reps = int(reps)
-                if reps < 1:
-                    raise ValueError
-            except (ValueError, TypeError):
-                print(f"Exercise entry {idx} has invalid 'reps'. Defaulting to 1.")
-                reps = 1
-
-            # Retrieve the exercise object
-            try:
-                exercise = Exercise.objects.get(name=exercise_name)
-            except Exercise.DoesNotExist:
-                print(f"Exercise '{exercise_name}' does not exist. Skipping.")
-                continue
-
-            # Add to exercises_done
-            workout.exercises_done.add(exercise)
-
-            # Accumulate muscle groups
-            muscle_groups = exercise.muscle_groups.all()
-            for mg in muscle_groups:
-                muscle_groups_set.add(mg)
-
-            # Calculate calories for this exercise
-            calories = CALORIES_PER_SET * sets
-            total_calories += calories
-
-            # Calculate attribute gains
-            strength_gain = STRENGTH_GAIN_PER_SET * sets
-            agility_gain = AGILITY_GAIN_PER_SET * sets
-            speed_gain = SPEED_GAIN_PER_SET * sets
-
-            total_strength += strength_gain
-            total_agility += agility_gain
-            total_speed += speed_gain
-
-        # Assign muscle groups to the workout
-        workout.muscle_groups.set(muscle_groups_set)
-
-        # Update energy_burned and attribute gains
-        workout.energy_burned = total_calories
-        print("within_24_hours "+str(within_24_hours))
-        if not within_24_hours:
-            workout.strength_gained = min(total_strength, 5)
-            workout.agility_gained = min(total_agility, 5)
-            workout.speed_gained = min(total_speed, 5)
-        else:
-            workout.strength_gained = 1
-            workout.agility_gained =1
-            workout.speed_gained = 1
-        workout.save()
-        user.strength += min(total_strength, 5)
-        user.agility += min(total_agility, 5)
-        user.speed += min(total_speed, 5)
-        user.save()
-
-        # -----------------------
-        # 4. Return Success Response
-        # -----------------------
         return JsonResponse({
             "message": "Workout saved successfully.",
-            "total_calories": total_calories,
+            "total_calories": workout.energy_burned,
             "strength_gained": workout.strength_gained,
             "agility_gained": workout.agility_gained,
             "speed_gained": workout.speed_gained
@@ -225,6 +101,7 @@ def workout_receiver(request):
         return JsonResponse({"error": "An internal error occurred. Please try again later."}, status=500)
 
 
+# Retrieve, update, or delete a specific workout
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def workout_detail(request, pk):
@@ -240,12 +117,17 @@ def workout_detail(request, pk):
     elif request.method == 'PUT':
         serializer = WorkoutSerializer(workout, data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                remove_workouts([workout])
+                workout = serializer.save()
+                add_workouts([workout])
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     elif request.method == 'DELETE':
-        workout.delete()
+        with transaction.atomic():
+            remove_workouts([workout])
+            workout.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -277,68 +159,15 @@ def sync_workouts(request):
     print("Authorization Header:", request.headers.get('Authorization'))
     print(user.username)
 
-    parsed_workouts = []
-
-    for workout in request.data.get('workout_data', []):
-        workout_type = workout['value'].get('workoutActivityType')
-
-        if workout_type != "WALKING":
-            total_energy_burned = workout['value'].get('totalEnergyBurned') or 0
-            start_date = workout.get('start_date')
-            end_date = workout.get('end_date')
-
-            if start_date and end_date:
-                start_dt = timezone.make_aware(datetime.fromisoformat(start_date.replace("Z", "")))
-                end_dt = timezone.make_aware(datetime.fromisoformat(end_date.replace("Z", "")))
-                duration = end_dt - start_dt
-
-                # Check if duration is less than 5 minutes
-                if duration < timedelta(minutes=5):
-                    print(f"Workout duration {duration} is less than 5 minutes. Skipping.")
-                    continue
-
-            if Workout.objects.filter(user=user, workout_date=start_dt).exists():
-                print(f"Workout on {start_dt} already exists for {user.username}. Skipping.")
-                continue
-
-            heart_rates = [
-                hr['value']['numericValue']
-                for hr in request.data.get('heartrate_data', [])
-                if hr.get('start_date') and hr.get('end_date')
-                   and start_dt <= timezone.make_aware(
-                    datetime.fromisoformat(hr['start_date'].replace("Z", ""))) <= end_dt
-            ]
-
-            if heart_rates:
-                avg_heart_rate = sum(heart_rates) / len(heart_rates)
-            else:
-                # Calculate the average of previous average heart rates
-                previous_workouts = Workout.objects.filter(user=user).exclude(avg_heart_rate__lte=0)
-                prev_avg_heart_rates = previous_workouts.values_list('avg_heart_rate', flat=True)
-
-                if prev_avg_heart_rates:
-                    avg_heart_rate = sum(prev_avg_heart_rates) / len(prev_avg_heart_rates)
-                else:
-                    avg_heart_rate = 0  # Default to 0 if no previous data is available
-
-            workout_instance = Workout.objects.create(
-                user=user,
-                duration=duration,
-                workout_date=start_dt,
-                avg_heart_rate=avg_heart_rate,
-                mood=workout.get('mood', 2),
-                energy_burned=total_energy_burned
-            )
+    try:
+        workout_data, heartrate_data = validate_healthkit_envelope(request.data)
+    except WorkoutPayloadError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if _wants_async(request):
+        return _accept_ingestion_job(request, 'healthkit_sync')
 
-            parsed_workouts.append({
-                'id': workout_instance.id,
-                'workoutActivityType': workout_type,
-                'totalEnergyBurned': total_energy_burned,
-                'start_date': start_date,
-                'end_date': end_date,
-                'duration': duration.total_seconds(),
-                'average_heart_rate': avg_heart_rate
-            })
+    parsed_workouts = sync_healthkit_workouts(user, workout_data, heartrate_data)
 
     return Response({
         'user': user.username,
@@ -346,45 +175,53 @@ def sync_workouts(request):
     }, status=status.HTTP_200_OK)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def ingestion_job_status(request, job_id):
+    """Reports the state of a queued upload; only the owner can see it."""
+    job = get_object_or_404(IngestionJob, pk=job_id, user=request.user)
+    return Response({
+        'job_id': str(job.id),
+        'kind': job.kind,
+        'status': job.status,
+        'result': job.result,
+        'error': job.error or None,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }, status=status.HTTP_200_OK)
+
+
 @csrf_exempt
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def last_workout(request):
-    from datetime import datetime, timedelta
-    from django.utils.timezone import now as timezone_now
-    from rest_framework.response import Response
-    from rest_framework import status
-
-    # Get the current time (timezone-aware) and the start of this week (Monday)
-    now = timezone_now()
-    monday_of_week = now.date() - timedelta(days=now.weekday())  # Start of the week
+    """
+    Returns the latest workout of the current week plus per-day minutes for the week.
+    The weekly minutes come from WorkoutDailyAggregate rather than rescanning workouts.
+    """
+    now = timezone.now()
+    today = timezone.localdate(now)
+    monday_of_week = today - timedelta(days=today.weekday())  # Start of the week
     start_of_week = make_aware(datetime.combine(monday_of_week, datetime.min.time()))
 
-    # Debug: Log the current time and filtering range
-    print(f"Current time (now): {now}")
-    print(f"Start of the week: {start_of_week}")
-
-    # Filter workouts from Monday to now
-    workouts = Workout.objects.filter(
+    # Initialize workout durations for each day of the week (Monday=0, Sunday=6)
+    workout_durations = [0] * 7
+    week_days = WorkoutDailyAggregate.objects.filter(
+        user=request.user,
+        day__gte=monday_of_week,
+        day__lte=today,
+        workout_count__gt=0,
+    ).values_list('day', 'total_minutes')
+    for day, total_minutes in week_days:
+        workout_durations[day.weekday()] += total_minutes
+
+    # Fetch the most recent workout of the week
+    latest_workout = Workout.objects.filter(
         user=request.user,
         workout_date__gte=start_of_week,
         workout_date__lte=now  # Ensure filtering includes current time
-    ).order_by('-workout_date')
-
-    # Debug: Log the query and fetched workouts
-    print(f"Query: {workouts.query}")
-    print(f"Fetched workouts: {list(workouts)}")
-
-    # Initialize workout durations for each day of the week (Monday=0, Sunday=6)
-    workout_durations = [0] * 7
-
-    for workout in workouts:
-        day_index = workout.workout_date.weekday()  # Determine the day of the week
-        duration_minutes = int(workout.duration.total_seconds() // 60)  # Convert duration to minutes
-        workout_durations[day_index] += duration_minutes
+    ).order_by('-workout_date').prefetch_related('muscle_groups').first()
 
-    # Fetch the most recent workout
-    latest_workout = workouts.first()  # Use already filtered workouts
     if latest_workout:
         workout_data = {
             'totalEnergyBurned': latest_workout.energy_burned,
@@ -393,9 +230,7 @@ def last_workout(request):
             'average_heart_rate': latest_workout.avg_heart_rate,
             'mood': latest_workout.mood,
             'workout_durations': workout_durations,
-            'muscleGroups': ", ".join(
-                str(muscle) for muscle in latest_workout.muscle_groups.all()
-            ) if latest_workout.muscle_groups.exists() else "",
+            'muscleGroups': ", ".join(str(muscle) for muscle in latest_workout.muscle_groups.all()),
             'stats': f"+{latest_workout.strength_gained}, +{latest_workout.agility_gained}, +{latest_workout.speed_gained}",
         }
         return Response(workout_data, status=status.HTTP_200_OK)
@@ -436,33 +271,29 @@ def update_latest_muscle_groups(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def this_weeks_workouts(request):
-    from datetime import datetime, timedelta
-    from django.utils.timezone import make_aware
-    from rest_framework.response import Response
-    from rest_framework import status
-
-    # Get today's date
-    today = datetime.now().date()
+    """
+    Returns one entry per day of the current week with training time, newest first,
+    read straight from the daily rollup.
+    """
+    today = timezone.localdate()
 
     # Calculate the most recent Monday
     monday_of_week = today - timedelta(days=today.weekday())  # Ensure Monday is the start of the week
-    start_of_week = make_aware(datetime.combine(monday_of_week, datetime.min.time()))
 
-    # Fetch workouts for the current user, starting from Monday
-    workouts = Workout.objects.filter(
+    week_days = WorkoutDailyAggregate.objects.filter(
         user=request.user,
-        workout_date__gte=start_of_week
-    ).order_by('-workout_date')
+        day__gte=monday_of_week,
+        workout_count__gt=0,
+    ).order_by('-day').values_list('day', 'total_minutes')
 
     # Prepare workout data
     workout_data = [
         {
-            'day_of_week': workout.workout_date.strftime('%A'),
-            'duration': int(workout.duration.total_seconds() // 60),  # Convert duration to minutes
+            'day_of_week': day.strftime('%A'),
+            'duration': total_minutes,
         }
-        for workout in workouts
+        for day, total_minutes in week_days
     ]
-    print(workout_data)
     # Return the response
     return Response(
         workout_data,
@@ -470,42 +301,125 @@ def this_weeks_workouts(request):
     )
 
 
+PAST_WORKOUTS_DEFAULT_LIMIT = 50
+PAST_WORKOUTS_MAX_LIMIT = 200
+PAST_WORKOUTS_STREAM_CHUNK = 500  # Rows fetched per keyset page while streaming an export
+
+
+def _encode_workout_cursor(workout):
+    raw = f"{workout.workout_date.isoformat()}|{workout.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_workout_cursor(cursor):
+    """Returns (workout_date, id) or raises ValueError for a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        date_part, id_part = raw.rsplit('|', 1)
+        return datetime.fromisoformat(date_part), int(id_part)
+    except (TypeError, UnicodeDecodeError, binascii.Error) as e:
+        raise ValueError(str(e))
+
+
+def _past_workouts_page(user, before, after_key, limit):
+    """
+    One keyset page of a user's past workouts ordered by (-workout_date, -id).
+    `after_key` is the (workout_date, id) of the last row of the previous page.
+    Exercises and muscle groups are prefetched, so a page costs three queries.
+    """
+    workouts = Workout.objects.filter(user=user, workout_date__lt=before)
+    if after_key is not None:
+        after_date, after_id = after_key
+        workouts = workouts.filter(
+            Q(workout_date__lt=after_date) | Q(workout_date=after_date, id__lt=after_id)
+        )
+    return list(
+        workouts.order_by('-workout_date', '-id').prefetch_related(
+            Prefetch('exercises_done', queryset=Exercise.objects.only('id', 'name')),
+            Prefetch('muscle_groups', queryset=MuscleGroup.objects.only('id', 'name')),
+        )[:limit]
+    )
+
+
+def _past_workout_data(workout):
+    return {
+        'id': workout.id,
+        'duration': int(workout.duration.total_seconds()),  # Duration in seconds
+        'workout_date': workout.workout_date.isoformat(),
+        'avg_heart_rate': workout.avg_heart_rate,
+        'mood': workout.mood,
+        'energy_burned': workout.energy_burned,
+        'strength_gained': workout.strength_gained,
+        'agility_gained': workout.agility_gained,
+        'speed_gained': workout.speed_gained,
+        'exercises_done': [{'id': e.id, 'name': e.name} for e in workout.exercises_done.all()],
+        'muscle_groups': [{'id': mg.id, 'name': mg.name} for mg in workout.muscle_groups.all()],
+        'created_at': workout.created_at.isoformat() if hasattr(workout, 'created_at') else None,
+        'updated_at': workout.updated_at.isoformat() if hasattr(workout, 'updated_at') else None,
+    }
+
+
+def _stream_past_workouts(user, before):
+    """Yields the full history as one JSON array, one keyset page in memory at a time."""
+    yield '['
+    after_key = None
+    first = True
+    while True:
+        page = _past_workouts_page(user, before, after_key, PAST_WORKOUTS_STREAM_CHUNK)
+        for workout in page:
+            yield ('' if first else ',') + json.dumps(_past_workout_data(workout), cls=DjangoJSONEncoder)
+            first = False
+        if len(page) < PAST_WORKOUTS_STREAM_CHUNK:
+            break
+        after_key = (page[-1].workout_date, page[-1].id)
+    yield ']'
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def past_workouts(request):
     """
-    Retrieve all past workouts of the authenticated user without using a serializer.
+    Retrieve past workouts of the authenticated user without using a serializer.
     A workout is considered past if its workout_date is earlier than the current time.
+
+    With `limit` and/or `cursor` the response is one keyset page:
+    `{"results": [...], "next_cursor": "<opaque>" | null}`. Without them the whole
+    history is streamed as a JSON array (the original response shape), so exports
+    of any length keep memory flat.
     """
     try:
         # Get the current time
         now = timezone.now()
 
-        # Query for workouts where workout_date is in the past
-        workouts = Workout.objects.filter(user=request.user, workout_date__lt=now).order_by('-workout_date')
-
-        # Manually construct the list of workouts
-        workout_list = []
-        for workout in workouts:
-            workout_data = {
-                'id': workout.id,
-                'duration': int(workout.duration.total_seconds()),  # Duration in seconds
-                'workout_date': workout.workout_date.isoformat(),
-                'avg_heart_rate': workout.avg_heart_rate,
-                'mood': workout.mood,
-                'energy_burned': workout.energy_burned,
-                'strength_gained': workout.strength_gained,
-                'agility_gained': workout.agility_gained,
-                'speed_gained': workout.speed_gained,
-                'exercises_done': list(workout.exercises_done.values('id', 'name')),
-                'muscle_groups': list(workout.muscle_groups.values('id', 'name')),
-                'created_at': workout.created_at.isoformat() if hasattr(workout, 'created_at') else None,
-                'updated_at': workout.updated_at.isoformat() if hasattr(workout, 'updated_at') else None,
-            }
-            workout_list.append(workout_data)
-
-        # Return the constructed list as JSON
-        return JsonResponse(workout_list, safe=False, status=status.HTTP_200_OK)
+        limit = request.query_params.get('limit')
+        cursor = request.query_params.get('cursor')
+
+        if limit is None and cursor is None:
+            return StreamingHttpResponse(
+                _stream_past_workouts(request.user, now), content_type='application/json'
+            )
+
+        try:
+            limit = min(max(int(limit or PAST_WORKOUTS_DEFAULT_LIMIT), 1), PAST_WORKOUTS_MAX_LIMIT)
+        except ValueError:
+            return JsonResponse({"error": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        after_key = None
+        if cursor:
+            try:
+                after_key = _decode_workout_cursor(cursor)
+            except ValueError:
+                return JsonResponse({"error": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Fetch one extra row to know whether another page exists
+        page = _past_workouts_page(request.user, now, after_key, limit + 1)
+        has_more = len(page) > limit
+        page = page[:limit]
+
+        return JsonResponse({
+            'results': [_past_workout_data(workout) for workout in page],
+            'next_cursor': _encode_workout_cursor(page[-1]) if has_more else None,
+        }, status=status.HTTP_200_OK)
 
     except Exception as e:
         # Log the exception (replace print with proper logging as needed)
@@ -0,0 +1,85 @@
+# economy.py
+"""
+Every change to a player's coins and base stats goes through here.
+
+Each change is a single UPDATE of only the columns it touches, computed in the
+database with F() expressions, so concurrent changes (two chest purchases, a
+market sale landing during a workout sync) add up instead of overwriting each
+other from stale `user` objects. Purchases are conditional on the balance
+(`coins__gte=cost`): one the player cannot afford changes nothing and raises
+InsufficientCoins, with no read beforehand and no retry.
+
+The `user` passed in has the changed fields reloaded afterwards, so callers
+can report the new balance or stats.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+STARTING_COINS = 200  # Granted to every new account
+STAT_FIELDS = ("strength", "agility", "intelligence", "stealth", "speed", "defence")
+
+
+class InsufficientCoins(Exception):
+    """The player cannot afford the purchase; nothing was charged."""
+
+
+def _players():
+    return get_user_model().objects
+
+
+def charge_coins(user, amount, reward=0):
+    """
+    Takes `amount` coins from the player if they have that many; otherwise
+    raises InsufficientCoins. A `reward` paid back by the purchase (a chest's
+    coins) is added in the same UPDATE.
+    """
+    if amount < 0 or reward < 0:
+        raise ValueError("A charge cannot be negative.")
+    if not _players().filter(pk=user.pk, coins__gte=amount).update(coins=F('coins') - (amount - reward)):
+        raise InsufficientCoins("Not enough currency.")
+    user.refresh_from_db(fields=['coins'])
+    return user.coins
+
+
+def add_coins(user, amount):
+    """
+    Adds `amount` coins to the player. A negative amount (an NPC toll, say)
+    takes coins away but never below zero.
+    """
+    if amount:
+        coins = F('coins') + amount if amount > 0 else Greatest(F('coins') + amount, 0)
+        _players().filter(pk=user.pk).update(coins=coins)
+    user.refresh_from_db(fields=['coins'])
+    return user.coins
+
+
+def transfer_coins(payer, payee_id, amount):
+    """
+    Moves `amount` coins from `payer` to the player `payee_id` (a market sale),
+    or raises InsufficientCoins and moves nothing. Both rows change in one
+    transaction, in id order, so opposite transfers cannot deadlock.
+    """
+    if amount < 0:
+        raise ValueError("A transfer cannot be negative.")
+    with transaction.atomic():
+        if payee_id < payer.pk:
+            _players().filter(pk=payee_id).update(coins=F('coins') + amount)
+        if not _players().filter(pk=payer.pk, coins__gte=amount).update(coins=F('coins') - amount):
+            raise InsufficientCoins("Not enough currency.")
+        if payee_id >= payer.pk:
+            _players().filter(pk=payee_id).update(coins=F('coins') + amount)
+    payer.refresh_from_db(fields=['coins'])
+    return payer.coins
+
+
+def add_stats(user, **gains):
+    """Raises the given base stats (strength=2, speed=1, ...) by those amounts."""
+    unknown = set(gains) - set(STAT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown stats: {', '.join(sorted(unknown))}")
+    gains = {stat: gain for stat, gain in gains.items() if gain}
+    if gains:
+        _players().filter(pk=user.pk).update(**{stat: F(stat) + gain for stat, gain in gains.items()})
+        user.refresh_from_db(fields=list(gains))
@@ -1,3 +1,45 @@
+from django.contrib.auth import get_user_model
 from django.test import TestCase
 
-# Create your tests here.
+from .economy import InsufficientCoins, add_coins, charge_coins, transfer_coins
+
+
+class EconomyTests(TestCase):
+    def setUp(self):
+        players = get_user_model().objects
+        self.payer = players.create_user("payer", password="p", coins=50)
+        self.payee = players.create_user("payee", password="p", coins=10)
+
+    def coins(self, user):
+        return get_user_model().objects.get(pk=user.pk).coins
+
+    def test_charge_takes_coins(self):
+        self.assertEqual(charge_coins(self.payer, 30), 20)
+        self.assertEqual(self.coins(self.payer), 20)
+
+    def test_charge_pays_the_reward_back_in_the_same_update(self):
+        with self.assertNumQueries(2):  # The UPDATE and reloading the balance
+            self.assertEqual(charge_coins(self.payer, 50, reward=20), 20)
+        with self.assertRaises(InsufficientCoins):
+            charge_coins(self.payer, 30, reward=20)
+        self.assertEqual(self.coins(self.payer), 20)
+
+    def test_charge_beyond_the_balance_changes_nothing(self):
+        with self.assertRaises(InsufficientCoins):
+            charge_coins(self.payer, 51)
+        self.assertEqual(self.coins(self.payer), 50)
+
+    def test_negative_add_stops_at_zero(self):
+        self.assertEqual(add_coins(self.payer, -80), 0)
+
+    def test_transfer_moves_coins_between_players(self):
+        self.assertEqual(transfer_coins(self.payer, self.payee.pk, 50), 0)
+        self.assertEqual(self.coins(self.payee), 60)
+
+    def test_transfer_beyond_the_balance_moves_nothing(self):
+        # The payee's row is credited first when it has the lower id; that must be undone too
+        for payer, payee in ((self.payer, self.payee), (self.payee, self.payer)):
+            before = self.coins(payer), self.coins(payee)
+            with self.assertRaises(InsufficientCoins):
+                transfer_coins(payer, payee.pk, self.coins(payer) + 1)
+            self.assertEqual((self.coins(payer), self.coins(payee)), before)
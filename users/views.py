@@ -13,6 +13,7 @@ from rest_framework import status
 from rest_framework.views import APIView
 
 from inventory.models import Inventory
+from .economy import STARTING_COINS, add_coins
 from .models import CustomUser
 from django.contrib.auth import authenticate, get_user_model
 from django.utils.timezone import now as timezone_now
@@ -43,11 +44,10 @@ def guest_signup(request):
         guest_user = User.objects.create_user(
             username=guest_username,
             email=guest_email,
-            password=None  # Guests do not have a password
+            password=None,  # Guests do not have a password
+            is_active=True,  # Ensure the user is active
+            coins=STARTING_COINS,
         )
-        guest_user.is_active = True  # Ensure the user is active
-        guest_user.coins = 200
-        guest_user.save()
 
         # Optionally, flag the user as a guest by extending the User model or using a Profile model
         # For simplicity, we'll skip this step here
@@ -111,8 +111,7 @@ class GoogleLogin(SocialLoginView):
                     response = super().post(request, *args, **kwargs)
                     response.data['is_new_user'] = True
                     user = User.objects.get(email=email)
-                    user.coins = 200
-                    user.save()
+                    add_coins(user, STARTING_COINS)
                     Inventory.objects.get_or_create(user=user)
                     return response
             else:
@@ -220,7 +219,8 @@ def save_user_preferences(request):
         user.username = username
         user.body_color = body_color_value
         user.eye_color = eye_color_value
-        user.save()
+        # Only these columns; a full save would write back a stale coin balance and stats
+        user.save(update_fields=['username', 'body_color', 'eye_color'])
 
         # Reload user to confirm save
         user.refresh_from_db()